@@ -0,0 +1,118 @@
+"""
+持久化HTTP缓存的冷/热加载基准
+
+通过getctrip.PersistentProfile在同一个持久化用户目录中依次启动浏览器：第一次目录为空（冷启动），
+之后每次都复用上一次留下的磁盘缓存（热启动）。每次加载酒店首页和详情页，记录load事件耗时、
+缓存命中率和网络传输量。
+
+--readonly 时热启动走Config.PROFILE_READONLY的路径：每次把冷启动预热好的目录中的缓存复制到
+临时目录使用，额外输出每次复制的大小和耗时，复制耗时计入该次运行的总耗时。
+
+用法:
+    python bench_cache.py                         # 冷启动1次，热启动3次
+    python bench_cache.py --warm-runs 5
+    python bench_cache.py --readonly              # 热启动使用只读副本
+    python bench_cache.py --detail-url https://hotels.ctrip.com/hotels/419109.html
+    python bench_cache.py --profile-dir /tmp/ctrip-profile --keep   # 保留目录，可作为Config.PROFILE_DIR
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from playwright.async_api import async_playwright
+
+import getctrip
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOME_URL = "https://hotels.ctrip.com/"
+
+
+async def load_pages(profile, pages, cookies):
+    """用PersistentProfile启动一次浏览器并依次加载各页面，返回 ({页面: 耗时ms}, HttpCacheStats)"""
+    context = await profile.new_context()
+    try:
+        if cookies:
+            await context.add_cookies(cookies)
+        page = context.pages[0] if context.pages else await context.new_page()
+        stats = getctrip.HttpCacheStats()
+        await stats.watch(page)
+        durations = {}
+        for name, url in pages:
+            start = time.perf_counter()
+            await page.goto(url, wait_until="load", timeout=60000)
+            durations[name] = (time.perf_counter() - start) * 1000
+        return durations, stats
+    finally:
+        await profile.close()
+
+
+async def run(args):
+    profile_dir = args.profile_dir or tempfile.mkdtemp(prefix="ctrip-cache-bench-")
+    if os.path.isdir(profile_dir) and os.listdir(profile_dir):
+        print(f"用户目录 {profile_dir} 不为空，第一次运行不是冷启动")
+    pages = [("首页", args.home_url), ("详情页", args.detail_url)]
+    # load_cookies会输出日志，基准中不需要
+    with contextlib.redirect_stdout(io.StringIO()):
+        cookies = getctrip.load_cookies()
+
+    results = []
+    try:
+        async with async_playwright() as p:
+            for i in range(args.warm_runs + 1):
+                readonly = args.readonly and i > 0
+                label = "冷启动" if i == 0 else f"热启动{i}{'(只读)' if readonly else ''}"
+                profile = getctrip.PersistentProfile(p, profile_dir, readonly)
+                # PersistentProfile会输出日志，基准中不需要
+                with contextlib.redirect_stdout(io.StringIO()):
+                    durations, stats = await load_pages(profile, pages, cookies)
+                if readonly:
+                    durations["复制缓存"] = profile.copy_ms
+                results.append((label, durations))
+                timings = ", ".join(f"{name} {ms:.0f}ms" for name, ms in durations.items())
+                copied = f"，复制缓存 {profile.copy_bytes / 1024 / 1024:.1f}MB" if readonly else ""
+                print(f"{label}: {timings}; 缓存命中 {stats.hits}/{stats.requests}（{stats.hit_rate() * 100:.0f}%），"
+                      f"节省 {stats.saved_bytes / 1024:.0f}KB，网络传输 {stats.network_bytes / 1024:.0f}KB{copied}")
+    finally:
+        if not args.keep and not args.profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+    print()
+    cold = results[0][1]
+    if args.readonly and args.warm_runs:
+        copy_ms = statistics.median(durations["复制缓存"] for _, durations in results[1:])
+        print(f"只读副本: 每次复制缓存耗时(中位数) {copy_ms:.0f}ms")
+    for name, _ in pages:
+        warm = statistics.median(durations[name] for _, durations in results[1:]) if args.warm_runs else None
+        if warm:
+            print(f"{name}: 冷 {cold[name]:.0f}ms，热(中位数) {warm:.0f}ms，减少 {(1 - warm / cold[name]) * 100:.0f}%")
+        else:
+            print(f"{name}: 冷 {cold[name]:.0f}ms")
+    if args.keep or args.profile_dir:
+        print(f"\n用户目录: {profile_dir}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="持久化HTTP缓存的冷/热加载基准")
+    parser.add_argument("--warm-runs", type=int, default=3, help="热启动次数")
+    parser.add_argument("--home-url", default=HOME_URL, help="首页URL")
+    parser.add_argument("--detail-url", default=getctrip.Config.KNOWN_HOTEL_URLS[0], help="详情页URL")
+    parser.add_argument("--profile-dir", help="持久化用户目录，缺省使用临时目录")
+    parser.add_argument("--keep", action="store_true", help="结束后保留临时用户目录")
+    parser.add_argument("--readonly", action="store_true", help="热启动使用只读副本（Config.PROFILE_READONLY）")
+    args = parser.parse_args()
+
+    # getctrip按相对路径读取cookie等文件
+    os.chdir(BASE_DIR)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
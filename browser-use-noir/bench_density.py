@@ -0,0 +1,161 @@
+"""
+各启动配置下每个BrowserContext的内存占用
+
+按browser_server.LAUNCH_PROFILES中的配置依次启动Chromium，逐个新建context并在其中加载
+roomlist.txt（或--url指定的页面），统计浏览器整个进程树的内存增长，得出每个context的
+内存和每GB可容纳的context数，用来估算单机能同时运行多少个任务。
+
+进程树内存优先读取 /proc/<pid>/smaps_rollup 的Pss（按共享页比例分摊，多进程相加不会重复计算），
+不可用时退回到status中的VmRSS。仅支持Linux。
+
+用法:
+    python bench_density.py                           # default和density各20个context
+    python bench_density.py --contexts 50 --sample-every 10
+    python bench_density.py --profiles density --url https://hotels.ctrip.com/hotels/419109.html
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from playwright.async_api import async_playwright
+
+from browser_server import LAUNCH_PROFILES, start_chromium, wait_for_cdp
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOMLIST_FILE = os.path.join(BASE_DIR, "roomlist.txt")
+
+
+def read_kb(path, field):
+    """读取/proc文件中"字段: 数值 kB"形式的值，读取失败返回None"""
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def process_tree(root_pid):
+    """root_pid及其所有子孙进程的pid"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r") as f:
+                # comm字段可能包含空格，从最后一个")"之后解析
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def tree_memory_mb(root_pid):
+    """进程树的内存(MB)和进程数"""
+    total_kb = 0
+    pids = process_tree(root_pid)
+    for pid in pids:
+        kb = read_kb(f"/proc/{pid}/smaps_rollup", "Pss")
+        if kb is None:
+            kb = read_kb(f"/proc/{pid}/status", "VmRSS") or 0
+        total_kb += kb
+    return total_kb / 1024, len(pids)
+
+
+async def open_context(browser, profile, content, url):
+    context = await browser.new_context(viewport=profile["viewport"])
+    page = await context.new_page()
+    if url:
+        await page.goto(url, wait_until="load", timeout=60000)
+    else:
+        await page.set_content(content)
+    return context
+
+
+async def measure_profile(p, name, args):
+    """在一个启动配置下逐个新建context，返回采样结果 [(context数, 内存MB, 进程数)]"""
+    profile = LAUNCH_PROFILES[name]
+    user_data_dir = tempfile.mkdtemp(prefix=f"ctrip-density-{name}-")
+    cdp_url = f"http://127.0.0.1:{args.port}"
+    process = start_chromium(p.chromium.executable_path, args.port, user_data_dir, extra_args=profile["args"])
+    try:
+        if not await asyncio.to_thread(wait_for_cdp, cdp_url, 15.0, process):
+            raise RuntimeError(f"Chromium未能在 {cdp_url} 启动")
+        browser = await p.chromium.connect_over_cdp(cdp_url)
+        content = None
+        if not args.url:
+            with open(ROOMLIST_FILE, "r", encoding="utf-8") as f:
+                content = f"<html><body>{f.read()}</body></html>"
+
+        await asyncio.sleep(args.settle)
+        samples = [(0, *tree_memory_mb(process.pid))]
+        contexts = []
+        start = time.perf_counter()
+        for i in range(1, args.contexts + 1):
+            contexts.append(await open_context(browser, profile, content, args.url))
+            if i % args.sample_every == 0 or i == args.contexts:
+                await asyncio.sleep(args.settle)
+                memory_mb, processes = tree_memory_mb(process.pid)
+                samples.append((i, memory_mb, processes))
+                print(f"  {name} {i:>3} 个context: {memory_mb:.0f}MB, {processes} 个进程")
+        elapsed = time.perf_counter() - start
+
+        for context in contexts:
+            await context.close()
+        await browser.close()
+        return samples, elapsed
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(user_data_dir, ignore_errors=True)
+
+
+async def run(args):
+    results = {}
+    async with async_playwright() as p:
+        for name in args.profiles:
+            print(f"启动配置 {name}:")
+            results[name] = await measure_profile(p, name, args)
+
+    print(f"\n{'启动配置':<10}{'空载MB':>10}{'满载MB':>10}{'每context MB':>14}{'每GB context数':>16}{'进程数':>8}{'新建耗时':>10}")
+    for name, (samples, elapsed) in results.items():
+        base_mb = samples[0][1]
+        count, full_mb, processes = samples[-1]
+        per_context = (full_mb - base_mb) / count if count else 0
+        per_gb = 1024 / per_context if per_context > 0 else float("inf")
+        print(f"{name:<10}{base_mb:>10.0f}{full_mb:>10.0f}{per_context:>14.1f}{per_gb:>16.1f}{processes:>8}"
+              f"{elapsed / count * 1000 if count else 0:>8.0f}ms")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各启动配置下每个BrowserContext的内存占用")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(LAUNCH_PROFILES),
+                        default=sorted(LAUNCH_PROFILES), help="要测量的启动配置")
+    parser.add_argument("--contexts", type=int, default=20, help="每个配置新建的context数")
+    parser.add_argument("--sample-every", type=int, default=5, help="每新建多少个context采样一次")
+    parser.add_argument("--url", help="每个context加载的页面，缺省加载本地roomlist.txt")
+    parser.add_argument("--port", type=int, default=9333, help="测量用Chromium的远程调试端口")
+    parser.add_argument("--settle", type=float, default=1.0, help="采样前等待的时间(秒)")
+    args = parser.parse_args()
+
+    if not os.path.isdir("/proc"):
+        print("只支持Linux（需要读取/proc）")
+        sys.exit(1)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
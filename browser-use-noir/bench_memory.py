@@ -0,0 +1,140 @@
+"""
+房型提取的渲染进程内存基准
+
+在本地加载roomlist.txt，连续执行N次房型提取，每隔若干次强制GC后通过CDP读取
+标签页的JS堆和DOM节点数，并按bench_density.py的方式读取浏览器进程树的内存(Pss)。
+JS堆只是渲染进程内存的一部分，句柄泄漏也会留在DOM包装对象和浏览器进程中，
+所以两者都要保持平稳。进程树内存只支持Linux。
+
+用法:
+    python bench_memory.py                         # element模式 500 次
+    python bench_memory.py --mode bulk
+    python bench_memory.py --mode leak             # 对照组：不释放句柄的query_selector_all
+    python bench_memory.py --max-growth-mb 1.5 --max-process-growth-mb 20
+
+JS堆增长超过 --max-growth-mb 或进程树内存增长超过 --max-process-growth-mb 时退出码为1。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from playwright.async_api import async_playwright
+
+import getctrip
+from bench_density import tree_memory_mb
+from browser_server import start_chromium, wait_for_cdp
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOMLIST_FILE = os.path.join(BASE_DIR, "roomlist.txt")
+
+
+async def leak_extract(page):
+    """旧写法：query_selector_all得到的句柄从不dispose"""
+    cards = await page.query_selector_all('div.commonRoomCard__BpNjl')
+    for card in cards:
+        await card.query_selector_all('.saleRoomItemBox__orNIv div')
+    return cards
+
+
+EXTRACTORS = {
+    "element": getctrip.extract_rooms_by_element,
+    "bulk": getctrip.extract_rooms_bulk,
+    "leak": leak_extract,
+}
+
+
+async def sample(page, session, pid):
+    """强制GC后读取内存指标，process_mb为浏览器进程树的内存"""
+    await session.send("HeapProfiler.collectGarbage")
+    memory = await getctrip.get_page_memory(page)
+    memory["process_mb"] = tree_memory_mb(pid)[0]
+    return memory
+
+
+async def run(args):
+    with open(ROOMLIST_FILE, "r", encoding="utf-8") as f:
+        roomlist_html = f.read()
+    extract = EXTRACTORS[args.mode]
+
+    user_data_dir = tempfile.mkdtemp(prefix="ctrip-memory-bench-")
+    cdp_url = f"http://127.0.0.1:{args.port}"
+    async with async_playwright() as p:
+        # 自行启动Chromium以便拿到浏览器进程的pid
+        process = start_chromium(p.chromium.executable_path, args.port, user_data_dir)
+        try:
+            if not await asyncio.to_thread(wait_for_cdp, cdp_url, 15.0, process):
+                raise RuntimeError(f"Chromium未能在 {cdp_url} 启动")
+            browser = await p.chromium.connect_over_cdp(cdp_url)
+            page = await browser.new_page()
+            await page.set_content(f"<html><body>{roomlist_html}</body></html>")
+            session = await page.context.new_cdp_session(page)
+
+            samples = []
+            start = time.perf_counter()
+            for i in range(1, args.iterations + 1):
+                # extract_*会逐条输出日志，基准中不需要
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await extract(page)
+                getctrip.log_entries.clear()
+
+                if i == args.warmup or i % args.sample_every == 0 or i == args.iterations:
+                    memory = await sample(page, session, process.pid)
+                    samples.append((i, memory))
+                    print(f"第 {i:>4} 次: JS堆 {memory['js_heap_mb']:.2f}MB, DOM节点 {memory['nodes']}, "
+                          f"进程树 {memory['process_mb']:.1f}MB")
+            elapsed = time.perf_counter() - start
+
+            await session.detach()
+            await browser.close()
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(user_data_dir, ignore_errors=True)
+
+    baseline = next(memory for i, memory in samples if i >= args.warmup)
+    final = samples[-1][1]
+    growth = final["js_heap_mb"] - baseline["js_heap_mb"]
+    process_growth = final["process_mb"] - baseline["process_mb"]
+    print(f"\n模式 {args.mode}: {args.iterations} 次提取，耗时 {elapsed:.1f}s，"
+          f"平均 {elapsed / args.iterations * 1000:.1f}ms/次")
+    print(f"JS堆 {baseline['js_heap_mb']:.2f}MB -> {final['js_heap_mb']:.2f}MB (增长 {growth:+.2f}MB)，"
+          f"DOM节点 {baseline['nodes']} -> {final['nodes']}")
+    print(f"进程树 {baseline['process_mb']:.1f}MB -> {final['process_mb']:.1f}MB (增长 {process_growth:+.1f}MB)")
+
+    if growth > args.max_growth_mb:
+        print(f"\nJS堆增长超过 {args.max_growth_mb}MB")
+        return 1
+    if process_growth > args.max_process_growth_mb:
+        print(f"\n进程树内存增长超过 {args.max_process_growth_mb}MB")
+        return 1
+    print("\n内存平稳")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="房型提取的渲染进程内存基准")
+    parser.add_argument("--mode", choices=sorted(EXTRACTORS), default="element", help="提取方式")
+    parser.add_argument("--iterations", type=int, default=500, help="提取次数")
+    parser.add_argument("--sample-every", type=int, default=50, help="每隔多少次采样一次")
+    parser.add_argument("--warmup", type=int, default=10, help="以第几次提取后的内存作为基线")
+    parser.add_argument("--max-growth-mb", type=float, default=2.0, help="允许的JS堆增长(MB)")
+    parser.add_argument("--max-process-growth-mb", type=float, default=30.0, help="允许的进程树内存增长(MB)")
+    parser.add_argument("--port", type=int, default=9334, help="测量用Chromium的远程调试端口")
+    args = parser.parse_args()
+
+    # getctrip按相对路径读取schema等文件
+    if not os.path.isdir("/proc"):
+        print("只支持Linux（需要读取/proc）")
+        sys.exit(1)
+    os.chdir(BASE_DIR)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+roomlist_parser的正确性校验和性能基准
+
+用法:
+    python bench_roomlist.py                  # 校验并输出耗时
+    python bench_roomlist.py --iterations 200
+    python bench_roomlist.py --update-golden  # 解析规则有意变更后重新生成golden文件
+
+校验内容:
+1. roomlist.txt 的解析结果必须与 roomlist_golden.json 完全一致
+2. hotel_results.txt（线上extract_room_info的真实输出）读回后，
+   解析器产出的房型/报价字段必须与其字段集合一致
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from roomlist_parser import OFFER_METADATA_KEYS, ROOM_METADATA_KEY, load_room_results, parse_room_list_html
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOMLIST_FILE = os.path.join(BASE_DIR, "roomlist.txt")
+RESULTS_FILE = os.path.join(BASE_DIR, "hotel_results.txt")
+GOLDEN_FILE = os.path.join(BASE_DIR, "roomlist_golden.json")
+
+ROOM_KEYS = {"房型名称", "床型", "面积和楼层", "价格选项", ROOM_METADATA_KEY}
+REQUIRED_OFFER_KEYS = {"早餐", "取消政策", "可住人数", "价格"}
+
+
+def read_text(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def check_schema(parsed, reference):
+    """检查解析结果的字段与线上结果文件的字段一致，返回错误列表"""
+    errors = []
+    # data-exposure元数据字段不会出现在结果文件中
+    reference_offer_keys = set(OFFER_METADATA_KEYS)
+    for room in reference["房型列表"]:
+        for offer in room["价格选项"]:
+            reference_offer_keys.update(offer)
+
+    for i, room in enumerate(parsed["房型列表"]):
+        if set(room) != ROOM_KEYS:
+            errors.append(f"房型 #{i+1} 字段不一致: {sorted(room)}")
+        for j, offer in enumerate(room["价格选项"]):
+            missing = REQUIRED_OFFER_KEYS - set(offer)
+            unknown = set(offer) - reference_offer_keys
+            if missing:
+                errors.append(f"房型 #{i+1} 价格选项 #{j+1} 缺少字段: {sorted(missing)}")
+            if unknown:
+                errors.append(f"房型 #{i+1} 价格选项 #{j+1} 出现结果文件中没有的字段: {sorted(unknown)}")
+    return errors
+
+
+def time_call(func, arg, iterations):
+    """重复调用func，返回每次耗时（毫秒）"""
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(arg)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name, durations, size):
+    durations = sorted(durations)
+    p95 = durations[max(0, int(len(durations) * 0.95) - 1)]
+    mean = statistics.mean(durations)
+    throughput = size / 1024 / (mean / 1000) if mean else 0
+    print(f"{name}: 平均 {mean:.2f}ms, 中位数 {statistics.median(durations):.2f}ms, "
+          f"p95 {p95:.2f}ms, {throughput:.0f}KB/s ({size / 1024:.1f}KB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="roomlist_parser 校验与基准")
+    parser.add_argument("--iterations", type=int, default=50, help="基准循环次数")
+    parser.add_argument("--update-golden", action="store_true", help="重新生成golden文件")
+    args = parser.parse_args()
+
+    roomlist_html = read_text(ROOMLIST_FILE)
+    results_text = read_text(RESULTS_FILE)
+
+    parsed = parse_room_list_html(roomlist_html)
+    reference = load_room_results(results_text)
+
+    if args.update_golden:
+        with open(GOLDEN_FILE, "w", encoding="utf-8") as f:
+            json.dump(parsed, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"已更新 {GOLDEN_FILE}")
+
+    # 正确性校验
+    errors = []
+    with open(GOLDEN_FILE, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    if parsed != golden:
+        for i, (room, expected) in enumerate(zip(parsed["房型列表"], golden["房型列表"])):
+            if room != expected:
+                errors.append(f"roomlist.txt 房型 #{i+1} 与golden不一致: {room} != {expected}")
+        if len(parsed["房型列表"]) != len(golden["房型列表"]):
+            errors.append(f"roomlist.txt 房型数量与golden不一致: "
+                          f"{len(parsed['房型列表'])} != {len(golden['房型列表'])}")
+        if parsed["酒店名称"] != golden["酒店名称"]:
+            errors.append(f"酒店名称与golden不一致: {parsed['酒店名称']} != {golden['酒店名称']}")
+
+    if not reference["房型列表"]:
+        errors.append("hotel_results.txt 中没有读到任何房型")
+    errors.extend(check_schema(parsed, reference))
+
+    offer_count = sum(len(room["价格选项"]) for room in parsed["房型列表"])
+    print(f"roomlist.txt: {len(parsed['房型列表'])} 种房型, {offer_count} 个价格选项")
+    print(f"hotel_results.txt: {len(reference['房型列表'])} 种房型")
+
+    # 性能基准
+    report("parse_room_list_html(roomlist.txt)",
+           time_call(parse_room_list_html, roomlist_html, args.iterations),
+           len(roomlist_html.encode("utf-8")))
+    report("load_room_results(hotel_results.txt)",
+           time_call(load_room_results, results_text, args.iterations),
+           len(results_text.encode("utf-8")))
+
+    if errors:
+        print("\n校验失败:")
+        for error in errors:
+            print(f"  - {error}")
+        sys.exit(1)
+    print("\n校验通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,9 @@ async def main():
     # 基本浏览器配置
     config = BrowserConfig(
         headless=False,
-        disable_security=True
+        disable_security=True,
+        # 设置BROWSER_CDP_URL时连接browser_server.py启动的常驻Chromium
+        cdp_url=os.getenv("BROWSER_CDP_URL")
     )
 
     browser = Browser(config=config)
@@ -0,0 +1,164 @@
+"""
+常驻Chromium浏览器服务
+
+启动一个开启远程调试端口的Chromium，getctrip等脚本通过connect_over_cdp连接它，
+不必每次运行都冷启动浏览器。Chromium退出（崩溃或被杀）后自动重新启动。
+
+用法:
+    python browser_server.py                      # 在9222端口启动无头Chromium
+    python browser_server.py --port 9333 --headed
+    python browser_server.py --user-data-dir /tmp/ctrip-profile
+    python browser_server.py --profile density    # 高密度启动配置，见LAUNCH_PROFILES
+
+连接地址为 http://127.0.0.1:<端口>，在getctrip.py中设置 Config.CDP_URL，
+在test_nav.py / browser.py中设置环境变量 BROWSER_CDP_URL。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# 命名的启动配置: Chromium附加参数和新建context使用的视口
+LAUNCH_PROFILES = {
+    "default": {
+        "args": [],
+        "viewport": {"width": 1280, "height": 720},
+    },
+    # 单机容纳尽量多的并发任务：限制渲染进程数并让同站点标签页共用进程，关闭站点隔离和后台功能，
+    # GPU放在浏览器进程内并只用CPU光栅化，视口缩小以减少光栅和合成内存
+    "density": {
+        "args": [
+            "--renderer-process-limit=4",
+            "--process-per-site",
+            # 安全取舍：关闭站点隔离后不同站点的页面可能共用一个渲染进程，渲染进程被攻破或出现
+            # Spectre类侧信道时可以读到同进程内其他站点的数据。只应在只访问受信站点（携程）的
+            # 抓取机器上使用，不要用它浏览任意网页
+            "--disable-site-isolation-trials",
+            "--disable-features=site-per-process,IsolateOrigins,Translate,OptimizationHints,MediaRouter,BackForwardCache",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-extensions",
+            "--disable-sync",
+            "--metrics-recording-only",
+            "--mute-audio",
+            "--disable-gpu",
+            "--disable-gpu-compositing",
+            "--in-process-gpu",
+        ],
+        "viewport": {"width": 800, "height": 600},
+    },
+}
+
+
+def chromium_args(port, user_data_dir, headless=True, extra_args=()):
+    """Chromium的启动参数，extra_args通常是某个启动配置的args"""
+    args = [
+        f"--remote-debugging-port={port}",
+        "--remote-debugging-address=127.0.0.1",
+        f"--user-data-dir={user_data_dir}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-dev-shm-usage",
+    ]
+    if headless:
+        args.append("--headless=new")
+    return args + list(extra_args)
+
+
+def start_chromium(executable, port, user_data_dir, headless=True, detach=False, extra_args=()):
+    """
+    启动Chromium进程
+
+    参数:
+    - detach: 放到新的会话中运行，启动它的脚本退出后浏览器继续运行
+    - extra_args: 附加的启动参数
+    """
+    os.makedirs(user_data_dir, exist_ok=True)
+    return subprocess.Popen(
+        [executable] + chromium_args(port, user_data_dir, headless, extra_args),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=detach,
+    )
+
+
+def cdp_version(cdp_url, timeout=1.0):
+    """读取 /json/version，浏览器未就绪时返回None"""
+    try:
+        with urllib.request.urlopen(f"{cdp_url.rstrip('/')}/json/version", timeout=timeout) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+def wait_for_cdp(cdp_url, timeout=15.0, process=None):
+    """等待调试端口可以连接，进程提前退出或超时返回False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cdp_version(cdp_url):
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        time.sleep(0.1)
+    return False
+
+
+def default_executable():
+    """Playwright安装的Chromium路径"""
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        return p.chromium.executable_path
+
+
+def supervise(args):
+    """启动Chromium并在它退出后重新启动，直到收到Ctrl+C"""
+    executable = args.executable or default_executable()
+    user_data_dir = args.user_data_dir or tempfile.mkdtemp(prefix="ctrip-browser-")
+    cdp_url = f"http://127.0.0.1:{args.port}"
+    restarts = 0
+    while True:
+        start = time.perf_counter()
+        process = start_chromium(executable, args.port, user_data_dir, headless=not args.headed,
+                                 extra_args=LAUNCH_PROFILES[args.profile]["args"])
+        if wait_for_cdp(cdp_url, args.startup_timeout, process):
+            version = cdp_version(cdp_url) or {}
+            print(f"Chromium已就绪: {cdp_url}（{version.get('Browser', '未知版本')}，"
+                  f"启动耗时 {(time.perf_counter() - start) * 1000:.0f}ms，pid {process.pid}）")
+        else:
+            print(f"Chromium在 {args.startup_timeout:.0f}s 内未就绪")
+        try:
+            code = process.wait()
+        except KeyboardInterrupt:
+            process.terminate()
+            process.wait()
+            print("已停止Chromium")
+            return 0
+        restarts += 1
+        print(f"Chromium已退出（退出码 {code}），{args.restart_delay:.0f}s 后第 {restarts} 次重新启动")
+        try:
+            time.sleep(args.restart_delay)
+        except KeyboardInterrupt:
+            return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻Chromium浏览器服务")
+    parser.add_argument("--port", type=int, default=9222, help="远程调试端口")
+    parser.add_argument("--user-data-dir", help="浏览器用户目录，缺省使用临时目录")
+    parser.add_argument("--executable", help="Chromium可执行文件，缺省使用Playwright安装的Chromium")
+    parser.add_argument("--headed", action="store_true", help="显示浏览器窗口")
+    parser.add_argument("--profile", choices=sorted(LAUNCH_PROFILES), default="default", help="启动配置")
+    parser.add_argument("--startup-timeout", type=float, default=15.0, help="等待调试端口就绪的时间(秒)")
+    parser.add_argument("--restart-delay", type=float, default=1.0, help="退出后重新启动前等待的时间(秒)")
+    args = parser.parse_args()
+    sys.exit(supervise(args))
+
+
+if __name__ == "__main__":
+    main()
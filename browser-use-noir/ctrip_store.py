@@ -0,0 +1,479 @@
+"""
+跨运行持久化的小型存储
+
+只依赖标准库。JSON文件统一用"写临时文件再替换"的方式保存，进程中途退出也不会留下半个文件；
+需要按键查询的记录放在SQLite中，静态资源按内容哈希存成单独的文件。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import unicodedata
+
+
+def load_json(path, default):
+    """读取JSON文件，文件不存在或损坏时返回default"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def normalize_key(text):
+    """规范化名称用作缓存键：全角转半角、小写、合并空白，逗号统一为逗号加一个空格"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return ", ".join(" ".join(part.split()) for part in text.split(","))
+
+
+def save_json(path, data):
+    """原子地写入JSON文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class SelectorCache:
+    """
+    记录每个候选选择器列表中"获胜"的选择器
+
+    以"站点|页面类型|字段"为键。下次探测时上次的获胜者排在最前，
+    连续失败达到demote_after次的候选移到末尾；hits/misses统计缓存的获胜者是否仍然有效，
+    命中率下降说明页面结构发生了漂移。
+    """
+
+    def __init__(self, path, demote_after=3):
+        self.path = path
+        self.demote_after = demote_after
+        self.entries = load_json(path, {})
+        self.dirty = False
+
+    @staticmethod
+    def make_key(site, page_type, field):
+        return f"{site}|{page_type}|{field}"
+
+    def order(self, key, selectors):
+        """按缓存重排候选：上次获胜者优先，连续失败的候选靠后，其余保持原有优先级"""
+        entry = self.entries.get(key)
+        if not entry:
+            return list(selectors)
+        candidates = entry["candidates"]
+        winner = entry.get("winner")
+
+        def rank(selector):
+            stats = candidates.get(selector)
+            if stats and stats["consecutive_misses"] >= self.demote_after:
+                return 2
+            return 0 if selector == winner else 1
+
+        return sorted(selectors, key=rank)
+
+    def record(self, key, ordered, winner, elapsed_ms):
+        """
+        记录一次探测结果
+
+        ordered为实际探测时的顺序，排在winner之前的候选记为失败；winner为None表示全部失败。
+        返回 (是否命中缓存的获胜者, 之前的获胜者)。
+        """
+        entry = self.entries.setdefault(key, {"winner": None, "hits": 0, "misses": 0, "candidates": {}})
+        previous = entry["winner"]
+        hit = winner is not None and winner == previous
+        entry["hits" if hit else "misses"] += 1
+
+        candidates = entry["candidates"]
+        failed = ordered if winner is None else ordered[:ordered.index(winner)]
+        for selector in failed:
+            stats = candidates.setdefault(selector, {"wins": 0, "fails": 0, "consecutive_misses": 0, "avg_ms": 0.0})
+            stats["fails"] += 1
+            stats["consecutive_misses"] += 1
+        if winner is not None:
+            stats = candidates.setdefault(winner, {"wins": 0, "fails": 0, "consecutive_misses": 0, "avg_ms": 0.0})
+            stats["wins"] += 1
+            stats["consecutive_misses"] = 0
+            # 获胜时解析耗时的累计平均
+            stats["avg_ms"] = round(stats["avg_ms"] + (elapsed_ms - stats["avg_ms"]) / stats["wins"], 1)
+            stats["last_win"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            entry["winner"] = winner
+        self.dirty = True
+        return hit, previous
+
+    def stats(self):
+        """返回每个键的命中统计 {键: {"winner", "hits", "misses", "hit_rate"}}"""
+        result = {}
+        for key, entry in self.entries.items():
+            total = entry["hits"] + entry["misses"]
+            result[key] = {
+                "winner": entry["winner"],
+                "hits": entry["hits"],
+                "misses": entry["misses"],
+                "hit_rate": entry["hits"] / total if total else 0.0,
+            }
+        return result
+
+    def save(self):
+        if self.dirty:
+            save_json(self.path, self.entries)
+            self.dirty = False
+
+
+class WaitTimeStore:
+    """
+    各等待点耗时的直方图，用于推算自适应超时
+
+    每个等待点按固定的分桶记录成功等待的耗时和超时次数。计数每次记录时按decay衰减，
+    页面变慢或变快后旧数据会逐渐失去影响。超时取分位数所在桶的上界乘以margin，
+    并限制在[min_ms, max_ms]内；样本不足或超时比例过高时直接使用max_ms。
+    """
+
+    # 分桶上界(毫秒)，超过最后一个上界的样本计入溢出桶
+    BUCKETS_MS = (
+        100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000, 7500,
+        10000, 15000, 20000, 30000, 45000, 60000, 90000, 120000,
+    )
+
+    def __init__(self, path, percentile=0.95, margin=1.5, min_samples=10, decay=0.98):
+        self.path = path
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.decay = decay
+        self.entries = load_json(path, {})
+        self.dirty = False
+
+    def _entry(self, name):
+        return self.entries.setdefault(name, {
+            "counts": [0.0] * (len(self.BUCKETS_MS) + 1),
+            "timeouts": 0.0,
+            "samples": 0,
+        })
+
+    def record(self, name, elapsed_ms, timed_out=False):
+        """记录一次等待；timed_out表示等待以超时结束"""
+        entry = self._entry(name)
+        entry["counts"] = [round(count * self.decay, 4) for count in entry["counts"]]
+        entry["timeouts"] = round(entry["timeouts"] * self.decay, 4)
+        if timed_out:
+            entry["timeouts"] += 1
+        else:
+            index = next((i for i, bound in enumerate(self.BUCKETS_MS) if elapsed_ms <= bound), len(self.BUCKETS_MS))
+            entry["counts"][index] += 1
+        entry["samples"] += 1
+        self.dirty = True
+
+    def samples(self, name):
+        """等待点累计的记录次数（不衰减）"""
+        entry = self.entries.get(name)
+        return entry["samples"] if entry else 0
+
+    def quantile_ms(self, name, percentile=None):
+        """
+        返回等待耗时的分位数（所在桶的上界），无数据或落在溢出桶时返回None
+
+        超时样本只知道耗时不短于记录值，按落在所有桶之后计入总数，
+        分位数落到这部分时同样返回None。percentile缺省使用构造时的分位数
+        """
+        entry = self.entries.get(name)
+        if not entry:
+            return None
+        total = sum(entry["counts"]) + entry["timeouts"]
+        if not sum(entry["counts"]):
+            return None
+        percentile = self.percentile if percentile is None else percentile
+        cumulative = 0.0
+        for bound, count in zip(self.BUCKETS_MS, entry["counts"]):
+            cumulative += count
+            if cumulative >= total * percentile:
+                return bound
+        return None
+
+    def timeout_for(self, name, max_ms, min_ms=0):
+        """计算等待点的超时(毫秒)，不会超过max_ms"""
+        entry = self.entries.get(name)
+        if not entry or entry["samples"] < self.min_samples:
+            return max_ms
+        # 超时比例超过分位数允许的范围，说明推算值偏小
+        weight = sum(entry["counts"]) + entry["timeouts"]
+        if weight and entry["timeouts"] / weight > 1 - self.percentile:
+            return max_ms
+        quantile = self.quantile_ms(name)
+        if quantile is None:
+            return max_ms
+        return int(min(max_ms, max(min_ms, quantile * self.margin)))
+
+    def stats(self):
+        """返回每个等待点的统计 {名称: {"samples", "quantile_ms", "timeouts"}}"""
+        return {
+            name: {
+                "samples": entry["samples"],
+                "quantile_ms": self.quantile_ms(name),
+                "timeouts": entry["timeouts"],
+            }
+            for name, entry in self.entries.items()
+        }
+
+    def save(self):
+        if self.dirty:
+            save_json(self.path, self.entries)
+            self.dirty = False
+
+
+class CityIdCache:
+    """
+    目的地字符串到携程城市ID的映射
+
+    键为normalize_key规范化后的目的地。城市ID通常从表单搜索跳转后的
+    列表页URL中学到；同时按目的地记录表单搜索的平均耗时，用来估算直接打开列表页节省的时间。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = load_json(path, {})
+        self.dirty = False
+
+    @staticmethod
+    def normalize(destination):
+        return normalize_key(destination)
+
+    def get(self, destination):
+        """返回缓存的城市ID，没有时返回None"""
+        entry = self.entries.get(self.normalize(destination))
+        return entry.get("city_id") if entry else None
+
+    def put(self, destination, city_id, source):
+        """记录城市ID，source说明来源（例如"form_url"）"""
+        entry = self.entries.setdefault(self.normalize(destination), {})
+        if entry.get("city_id") == city_id:
+            return
+        entry.update(city_id=city_id, source=source, updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+        self.dirty = True
+
+    def forget(self, destination):
+        """直接打开列表页失败时丢弃城市ID，下次通过表单重新学习；表单耗时保留"""
+        entry = self.entries.get(self.normalize(destination))
+        if entry and entry.pop("city_id", None) is not None:
+            entry.pop("source", None)
+            entry.pop("updated", None)
+            self.dirty = True
+
+    def record_form_time(self, destination, elapsed_ms):
+        """记录一次表单搜索（打开首页到列表页加载完成）的耗时"""
+        entry = self.entries.setdefault(self.normalize(destination), {})
+        count = entry.get("form_count", 0) + 1
+        average = entry.get("form_ms", 0.0)
+        entry["form_count"] = count
+        entry["form_ms"] = round(average + (elapsed_ms - average) / count, 1)
+        self.dirty = True
+
+    def form_time_ms(self, destination):
+        """表单搜索的平均耗时(毫秒)，没有记录时返回None"""
+        entry = self.entries.get(self.normalize(destination))
+        return entry.get("form_ms") if entry else None
+
+    def save(self):
+        if self.dirty:
+            save_json(self.path, self.entries)
+            self.dirty = False
+
+
+class HotelIdCache:
+    """
+    (酒店名称, 目的地) 到hotelId和详情页URL的映射，保存在SQLite中
+
+    只记录在详情页上验证过酒店名称的结果。超过ttl_days未重新验证的记录视为过期，
+    get不再返回；命中后验证失败的记录由调用方invalidate。
+    """
+
+    def __init__(self, path, ttl_days=7):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self._conn = None
+
+    @property
+    def conn(self):
+        """首次使用时才打开数据库，导入模块不会创建文件"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._create_tables()
+        return self._conn
+
+    def _create_tables(self):
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS hotels (
+                name_key TEXT NOT NULL,
+                destination_key TEXT NOT NULL,
+                hotel_id TEXT NOT NULL,
+                detail_url TEXT NOT NULL,
+                source TEXT,
+                verified_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (name_key, destination_key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS hotels_hotel_id ON hotels (hotel_id)")
+        self._conn.commit()
+
+    def get(self, name, destination):
+        """返回未过期的记录 {"hotel_id", "detail_url", "source", "verified_at", "hits"}，没有时返回None"""
+        row = self.conn.execute(
+            "SELECT hotel_id, detail_url, source, verified_at, hits FROM hotels "
+            "WHERE name_key = ? AND destination_key = ? AND verified_at >= ?",
+            (normalize_key(name), normalize_key(destination), time.time() - self.ttl_seconds),
+        ).fetchone()
+        if not row:
+            return None
+        return dict(zip(("hotel_id", "detail_url", "source", "verified_at", "hits"), row))
+
+    def put(self, name, destination, hotel_id, detail_url, source):
+        """写入或更新一条已验证的记录，source说明来源（例如"list"、"known_url"）"""
+        self.conn.execute(
+            "INSERT INTO hotels (name_key, destination_key, hotel_id, detail_url, source, verified_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (name_key, destination_key) DO UPDATE SET "
+            "hotel_id = excluded.hotel_id, detail_url = excluded.detail_url, "
+            "source = excluded.source, verified_at = excluded.verified_at",
+            (normalize_key(name), normalize_key(destination), str(hotel_id), detail_url, source, time.time()),
+        )
+        self.conn.commit()
+
+    def mark_verified(self, name, destination):
+        """命中的记录再次验证通过：刷新验证时间并累计命中次数"""
+        self.conn.execute(
+            "UPDATE hotels SET verified_at = ?, hits = hits + 1 WHERE name_key = ? AND destination_key = ?",
+            (time.time(), normalize_key(name), normalize_key(destination)),
+        )
+        self.conn.commit()
+
+    def invalidate(self, name, destination):
+        self.conn.execute(
+            "DELETE FROM hotels WHERE name_key = ? AND destination_key = ?",
+            (normalize_key(name), normalize_key(destination)),
+        )
+        self.conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class StaticAssetStore:
+    """
+    按URL和ETag索引、按内容SHA-256存放的静态资源库
+
+    内容存放在 objects/<sha256>，相同内容只存一份；index.json记录 URL -> {ETag: 内容哈希、大小、
+    ETag/Last-Modified和响应头}，同一URL的多个版本分别保存（没有ETag的版本以空字符串为键）。
+    回放时直接把内容文件的路径交给调用方，不在进程内保留内容。
+    内容文件只新增不修改，index.json按"最后写入者为准"保存，多个进程共用目录也不会损坏。
+    max_bytes限制内容文件的总大小，超过后不再写入新内容。
+    """
+
+    INDEX_FILE = "index.json"
+    # 不随内容保存的响应头：保存的是解码后的body，长度和编码由回放时重新生成
+    DROP_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection",
+                    "set-cookie", "date", "age", "keep-alive"}
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.index = load_json(self.index_path, {})
+        self.dirty = False
+        # 本进程的统计：直接命中、条件请求后命中(304)、未命中，新写入的字节数和因超出上限未写入的次数
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stored_bytes = 0
+        self.skipped = 0
+
+    def versions(self, url):
+        """URL的所有版本，按写入时间从新到旧"""
+        return sorted(self.index.get(url, {}).values(), key=lambda entry: -entry["stored"])
+
+    def lookup(self, url, etag=None):
+        """etag为None时返回URL最新的版本，否则返回ETag对应的版本"""
+        if etag is None:
+            versions = self.versions(url)
+            return versions[0] if versions else None
+        return self.index.get(url, {}).get(etag)
+
+    def path(self, entry):
+        """返回内容文件的路径，文件丢失或大小不符时返回None"""
+        path = os.path.join(self.objects_dir, entry["hash"])
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def object_bytes(self):
+        """索引中引用的内容文件总大小（相同内容只计一次）"""
+        sizes = {entry["hash"]: entry["size"] for versions in self.index.values() for entry in versions.values()}
+        return sum(sizes.values())
+
+    def put(self, url, body, headers):
+        """保存资源内容和响应头，返回索引记录；超出max_bytes时不保存，返回None"""
+        digest = hashlib.sha256(body).hexdigest()
+        path = os.path.join(self.objects_dir, digest)
+        if not os.path.exists(path):
+            if self.max_bytes is not None and self.object_bytes() + len(body) > self.max_bytes:
+                self.skipped += 1
+                return None
+            os.makedirs(self.objects_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self.stored_bytes += len(body)
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() not in self.DROP_HEADERS}
+        entry = {
+            "hash": digest,
+            "size": len(body),
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "headers": headers,
+            "stored": time.time(),
+        }
+        self.index.setdefault(url, {})[entry["etag"] or ""] = entry
+        self.dirty = True
+        return entry
+
+    def forget(self, url, entry):
+        versions = self.index.get(url, {})
+        if versions.pop(entry.get("etag") or "", None):
+            if not versions:
+                del self.index[url]
+            self.dirty = True
+
+    def record(self, outcome):
+        """记录一次请求的结果，outcome为 "hit" / "revalidated" / "miss" 之一"""
+        if outcome == "hit":
+            self.hits += 1
+        elif outcome == "revalidated":
+            self.revalidated += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        total = self.hits + self.revalidated + self.misses
+        return {
+            "requests": total,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.revalidated) / total if total else 0.0,
+            "urls": len(self.index),
+            "entries": sum(len(versions) for versions in self.index.values()),
+            "object_bytes": self.object_bytes(),
+            "stored_bytes": self.stored_bytes,
+            "skipped": self.skipped,
+        }
+
+    def save(self):
+        if self.dirty:
+            os.makedirs(self.directory, exist_ok=True)
+            save_json(self.index_path, self.index)
+            self.dirty = False
@@ -0,0 +1,257 @@
+"""
+声明式提取schema
+
+extraction_schema.json 按页面类型(home / hotel_list / hotel_detail / room_list)列出命名选择器(locators)
+和要提取的字段。locators供等待和页面预检使用，其中"ready"是页面已加载的标志；每个字段是一组
+按优先级尝试的选择器规则和后处理步骤。ExtractionSchema把每个带fields的页面类型编译成一个独立的
+JS函数并缓存，getctrip里一次page.evaluate就能取回整页字段。
+
+schema文件的修改时间变化时自动重新加载，携程更换hash类名（如commonRoomCard-title__iYBn2）时
+只需替换json文件，正在运行的进程在下一次提取时就会使用新规则。
+
+字段定义:
+    {"rules": [规则, ...], "default": 默认值, "post": [后处理, ...]}
+    {"items": {"selector": 选择器, "fields": {子字段...}}}     # 列表字段
+规则:
+    selector   CSS选择器，"@名称"引用同一页面locators中的选择器
+    contains   只保留文本包含其中任一关键字的元素（相当于Playwright的:has-text）
+    all        拼接所有匹配元素的文本（以" | "分隔），否则取第一个匹配元素
+    attr       "html"取outerHTML，其他值取对应属性，缺省取textContent
+    count      按匹配数量生成值，"{}"替换为数量
+    value      匹配到元素时返回的固定值
+    nonempty   文本为空白时视为未匹配，继续尝试下一条规则
+    post       本条规则命中后的后处理
+后处理: "trim" 或 {"replace": [旧, 新]}（替换全部出现）。
+没有default且所有规则都未命中的字段不出现在结果中。
+"""
+import json
+import os
+
+POST_OPS = {"trim", "replace"}
+RULE_KEYS = {"selector", "contains", "all", "attr", "count", "value", "nonempty", "post"}
+
+# 运行时解释器，__SPEC__替换为编译后的页面定义；root缺省为document
+EXTRACTOR_TEMPLATE = """
+(root) => {
+    const spec = __SPEC__;
+    const text = el => (el && el.textContent) || '';
+    const applyPost = (value, post) => {
+        for (const step of post || []) {
+            if (step === 'trim') value = value.trim();
+            else if (step.replace) value = value.split(step.replace[0]).join(step.replace[1]);
+        }
+        return value;
+    };
+    const read = (el, rule) => {
+        if (rule.attr === 'html') return el.outerHTML;
+        if (rule.attr) return el.getAttribute(rule.attr) || '';
+        return text(el);
+    };
+    const applyRule = (scope, rule) => {
+        let els;
+        if (rule.contains || rule.all || rule.count) {
+            els = Array.from(scope.querySelectorAll(rule.selector));
+            if (rule.contains) els = els.filter(el => rule.contains.some(k => text(el).includes(k)));
+        } else {
+            const el = scope.querySelector(rule.selector);
+            els = el ? [el] : [];
+        }
+        if (rule.count) return els.length ? rule.count.replace('{}', els.length) : undefined;
+        if (rule.all) {
+            const joined = els.map(el => read(el, rule)).filter(t => t).map(t => t.trim()).join(' | ');
+            return joined ? applyPost(joined, rule.post) : undefined;
+        }
+        if (!els.length) return undefined;
+        if (rule.value !== undefined) return rule.value;
+        const value = read(els[0], rule);
+        if (rule.nonempty && !value.trim()) return undefined;
+        return applyPost(value, rule.post);
+    };
+    const extractField = (scope, field) => {
+        if (field.items) {
+            return Array.from(scope.querySelectorAll(field.items.selector))
+                .map(el => extractFields(el, field.items.fields));
+        }
+        for (const rule of field.rules) {
+            const value = applyRule(scope, rule);
+            if (value !== undefined) return applyPost(value, field.post);
+        }
+        return field.default === undefined ? undefined : applyPost(field.default, field.post);
+    };
+    const extractFields = (scope, fields) => {
+        const result = {};
+        for (const [name, field] of Object.entries(fields)) {
+            const value = extractField(scope, field);
+            if (value !== undefined) result[name] = value;
+        }
+        return result;
+    };
+    return extractFields(root || document, spec.fields);
+}
+"""
+
+
+class SchemaError(ValueError):
+    """schema文件缺失或格式错误"""
+
+
+def _resolve(selector, locators, where):
+    """展开"@名称"形式的locator引用"""
+    if not isinstance(selector, str) or not selector:
+        raise SchemaError(f"{where}: selector必须是非空字符串")
+    if selector.startswith("@"):
+        name = selector[1:]
+        if name not in locators:
+            raise SchemaError(f"{where}: 未定义的locator '{name}'")
+        return locators[name]
+    return selector
+
+
+def _check_post(post, where):
+    if not isinstance(post, list):
+        raise SchemaError(f"{where}: post必须是列表")
+    for step in post:
+        if step == "trim":
+            continue
+        if isinstance(step, dict) and list(step) == ["replace"] \
+                and isinstance(step["replace"], list) and len(step["replace"]) == 2:
+            continue
+        raise SchemaError(f"{where}: 不支持的后处理 {step!r}，可用: {sorted(POST_OPS)}")
+
+
+def _compile_fields(fields, locators, where):
+    """校验字段定义并展开locator引用，返回可直接序列化进JS的字段字典"""
+    if not isinstance(fields, dict) or not fields:
+        raise SchemaError(f"{where}: fields必须是非空对象")
+    compiled = {}
+    for name, field in fields.items():
+        path = f"{where}.{name}"
+        if not isinstance(field, dict):
+            raise SchemaError(f"{path}: 字段定义必须是对象")
+        if "items" in field:
+            items = field["items"]
+            compiled[name] = {"items": {
+                "selector": _resolve(items.get("selector"), locators, path),
+                "fields": _compile_fields(items.get("fields"), locators, path),
+            }}
+            continue
+        rules = field.get("rules")
+        if not isinstance(rules, list) or not rules:
+            raise SchemaError(f"{path}: rules必须是非空列表")
+        compiled_rules = []
+        for i, rule in enumerate(rules):
+            rule_path = f"{path}.rules[{i}]"
+            if not isinstance(rule, dict):
+                raise SchemaError(f"{rule_path}: 规则必须是对象")
+            unknown = set(rule) - RULE_KEYS
+            if unknown:
+                raise SchemaError(f"{rule_path}: 未知的规则字段 {sorted(unknown)}")
+            rule = dict(rule, selector=_resolve(rule.get("selector"), locators, rule_path))
+            if "contains" in rule and not (isinstance(rule["contains"], list) and rule["contains"]):
+                raise SchemaError(f"{rule_path}: contains必须是非空列表")
+            if "post" in rule:
+                _check_post(rule["post"], rule_path)
+            compiled_rules.append(rule)
+        compiled_field = {"rules": compiled_rules}
+        if "default" in field:
+            compiled_field["default"] = field["default"]
+        if "post" in field:
+            _check_post(field["post"], path)
+            compiled_field["post"] = field["post"]
+        compiled[name] = compiled_field
+    return compiled
+
+
+def compile_page(page_spec, page_type):
+    """把单个页面类型的定义编译成JS提取函数"""
+    locators = page_spec.get("locators", {})
+    if not isinstance(locators, dict):
+        raise SchemaError(f"{page_type}: locators必须是对象")
+    fields = _compile_fields(page_spec.get("fields"), locators, page_type)
+    spec = json.dumps({"fields": fields}, ensure_ascii=False)
+    return EXTRACTOR_TEMPLATE.replace("__SPEC__", spec)
+
+
+def validate_schema(schema):
+    """校验整个schema，返回 {页面类型: 编译后的JS}"""
+    if not isinstance(schema, dict) or not isinstance(schema.get("version"), int):
+        raise SchemaError("schema缺少整数version")
+    pages = schema.get("pages")
+    if not isinstance(pages, dict) or not pages:
+        raise SchemaError("schema缺少pages")
+    # 只有locators的页面类型（如home）不生成提取函数
+    return {
+        page_type: compile_page(page_spec, page_type)
+        for page_type, page_spec in pages.items()
+        if "fields" in page_spec
+    }
+
+
+class ExtractionSchema:
+    """
+    extraction_schema.json的加载器
+
+    每次取提取函数或locator前检查文件修改时间，变化时重新加载并重新编译；
+    新文件无效时抛出SchemaError并继续使用上一个有效版本。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.schema = None
+        self.extractors = {}
+        self.mtime = None
+
+    def refresh(self):
+        """文件有变化时重新加载，加载了新内容返回True"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self.schema is None:
+                raise SchemaError(f"无法读取schema文件 {self.path}: {e}") from e
+            return False
+        if mtime == self.mtime:
+            return False
+        # 无论新文件是否有效都记录mtime，避免对同一个坏文件反复解析和报错
+        self.mtime = mtime
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                schema = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SchemaError(f"schema文件 {self.path} 解析失败: {e}") from e
+        extractors = validate_schema(schema)
+        self.schema, self.extractors, self.version = schema, extractors, schema["version"]
+        return True
+
+    def extractor(self, page_type):
+        """返回页面类型对应的JS提取函数"""
+        if page_type not in self.extractors:
+            raise SchemaError(f"schema中没有页面类型 '{page_type}'")
+        return self.extractors[page_type]
+
+    def locator(self, page_type, name):
+        """返回页面类型下命名的选择器，例如('room_list', 'ready')"""
+        try:
+            return self.schema["pages"][page_type]["locators"][name]
+        except (KeyError, TypeError):
+            raise SchemaError(f"schema中没有locator '{page_type}.{name}'") from None
+
+    def field_rules(self, page_type, *path):
+        """
+        返回字段的规则列表，选择器中的"@名称"已展开，供逐元素提取使用
+
+        path依次是字段名，列表字段向下进入items，例如('room_list', '房型列表', '房型名称')
+        """
+        where = ".".join((page_type,) + path)
+        try:
+            page_spec = self.schema["pages"][page_type]
+            fields = page_spec["fields"]
+            field = None
+            for name in path:
+                if field is not None:
+                    fields = field["items"]["fields"]
+                field = fields[name]
+            locators = page_spec.get("locators", {})
+            return [dict(rule, selector=_resolve(rule["selector"], locators, where)) for rule in field["rules"]]
+        except (KeyError, TypeError):
+            raise SchemaError(f"schema中没有字段 '{where}'") from None
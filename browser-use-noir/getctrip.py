@@ -1,13 +1,22 @@
 import asyncio
+import contextlib
 import json
 import os
 from datetime import datetime
 import logging
+import shutil
+import tempfile
+import time
 import traceback
 import urllib.parse
 import re
 
-from playwright.async_api import async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError, async_playwright
+
+from browser_server import LAUNCH_PROFILES, start_chromium, wait_for_cdp
+from ctrip_store import CityIdCache, HotelIdCache, SelectorCache, StaticAssetStore, WaitTimeStore
+from extraction_schema import ExtractionSchema, SchemaError
+from roomlist_parser import merge_room_metadata, parse_room_list_html, parse_room_payload
 
 # 设置日志记录
 log_entries = []
@@ -49,6 +58,8 @@ class Config:
     TIMEOUT = 60000  # 页面加载超时时间(毫秒)
     DEBUG = False  # 调试模式，打印更多信息
     HEADLESS = True  # 是否以无头模式启动浏览器
+    # 浏览器启动配置（Chromium参数和视口，见browser_server.LAUNCH_PROFILES）: "default" / "density"
+    LAUNCH_PROFILE = "default"
     # 已知的FAV酒店链接，作为备选
     KNOWN_HOTEL_URLS = [
         "https://hotels.ctrip.com/hotels/detail/?hotelId=28682274",  # 可能的酒店ID 1
@@ -57,12 +68,1317 @@ class Config:
     ]
     # 搜索重试次数
     SEARCH_RETRY = 3
-    # 选择目的地后的等待时间
+    # 搜索方式: "url" 已知城市ID时直接打开酒店列表页，未知或失败时回到首页表单; "form" 始终使用首页表单
+    SEARCH_MODE = "url"
+    # 酒店列表页地址，城市ID、入住/退房日期和酒店名称之外的固定查询参数
+    LIST_URL_BASE = "https://hotels.ctrip.com/hotels/list"
+    LIST_URL_EXTRA_PARAMS = {"crn": 1, "adult": 1, "children": 0}
+    # 目的地 -> 城市ID缓存，城市ID从表单搜索跳转后的列表页URL中学习
+    CITY_ID_CACHE_FILE = "city_ids.json"
+    # 手工指定的城市ID，优先于缓存，例如 {"takamatsu, japan": 12345}
+    CITY_IDS = {}
+    # (酒店名称, 目的地) -> hotelId和详情页URL的SQLite缓存，命中时跳过搜索和列表阶段；设为None时不使用
+    HOTEL_ID_CACHE_FILE = "hotel_ids.db"
+    # 缓存记录多少天未重新验证后过期
+    HOTEL_ID_TTL_DAYS = 7
+    # 进入详情页的各种方式（新标签页、当前页跳转、已知URL）并发进行时共用的预算(毫秒)
+    DETAIL_ENTRY_BUDGET = 30000
+    # 已知URL比点击进入晚多少毫秒开始，第i个已知URL再晚 i 倍；0表示同时开始。
+    # 点击进入通常在这段时间内完成，已知URL只作为兜底，不必每次都多开标签页
+    DETAIL_KNOWN_URL_DELAY = 5000
+    # 输入目的地后等待下拉菜单的最长时间(毫秒)
     DESTINATION_WAIT = 2000
+    # 日期引擎设置入住和离店日期时最多翻页的次数
+    CALENDAR_MAX_STEPS = 24
+    # 目的地下拉菜单
+    DESTINATION_DROPDOWN_SELECTOR = '.drop-result-list, .search-suggest-list, .result-list'
     # 截图文件名前缀
     SCREENSHOT_PREFIX = ""
     # 是否保存中间文件
     SAVE_TEMP_FILES = False  # 新增参数，控制是否保存中间文件
+    # 详情页获取模式: "browser" 始终使用浏览器, "http" 先用HTTP直接请求KNOWN_HOTEL_URLS并解析，
+    # 房型列表由客户端渲染或请求被拦截时再启动浏览器
+    DETAIL_FETCH_MODE = "browser"
+    # HTTP模式使用的User-Agent
+    HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+    # HTTP模式下主站(KNOWN_HOTEL_URLS第一个)超过其历史耗时的该分位数仍未返回时，向另一个镜像(ctrip/trip.com)
+    # 发出对冲请求，采用先解析出房型列表的一方；设为None时按顺序逐个请求
+    HEDGE_PERCENTILE = 0.9
+    # 历史样本不足时的对冲延迟(毫秒)
+    HEDGE_DEFAULT_DELAY = 3000
+    # 请求各镜像时附加的查询参数，trip.com按中文和人民币返回，与ctrip使用同一个解析器得到相同结构的结果
+    MIRROR_QUERY_PARAMS = {"trip.com": {"locale": "zh-CN", "curr": "CNY"}}
+    # 进入详情页时监听房型/价格接口，直接用接口JSON构建房型列表，DOM提取作为备选
+    CAPTURE_ROOM_PAYLOAD = True
+    # 房型接口URL关键字（不区分大小写）
+    ROOM_PAYLOAD_URL_KEYWORDS = ["roomlist", "saleroom"]
+    # 提取房型时等待接口数据的最长时间(毫秒)
+    PAYLOAD_WAIT = 5000
+    # 房型提取模式: "bulk" 一次evaluate批量提取, "element" 逐元素提取, "compare" 两种都执行并对比结果,
+    # "offline" 取一次page.content()后在浏览器外用roomlist_parser解析
+    ROOM_EXTRACT_MODE = "bulk"
+    # 声明式提取schema文件，修改后运行中的进程会自动重新加载
+    EXTRACTION_SCHEMA_FILE = "extraction_schema.json"
+    # 记录各候选选择器列表中获胜的选择器，下次优先尝试；设为None关闭
+    SELECTOR_CACHE_FILE = "selector_cache.json"
+    # 候选连续失败多少次后排到列表末尾
+    SELECTOR_DEMOTE_AFTER = 3
+    # 页面预检时等待页面标志元素出现的最长时间(毫秒)，超时判定为页面结构变化
+    PREFLIGHT_WAIT = 10000
+    # 标签页JS堆（JSHeapUsedSize，不含DOM、图片解码和GPU等渲染进程的其他内存）超过该值(MB)时
+    # 新开标签页替换，设为None关闭；渲染进程的总内存由bench_memory.py按进程树测量
+    PAGE_JS_HEAP_LIMIT_MB = 300
+    # 就绪等待中DOM需要保持不变的时间(毫秒)
+    READY_QUIET_MS = 200
+    # 各等待点的历史耗时，用于推算自适应超时；设为None时始终使用配置的超时
+    WAIT_STATS_FILE = "wait_stats.json"
+    # 自适应超时 = 历史耗时的该分位数 × 余量，且不低于最小值(毫秒)、不超过各等待点配置的超时
+    ADAPTIVE_TIMEOUT_PERCENTILE = 0.95
+    ADAPTIVE_TIMEOUT_MARGIN = 1.5
+    ADAPTIVE_TIMEOUT_MIN = 3000
+    # 每个BrowserContext注入一次初始化脚本，在弹窗/遮罩/登录引导渲染前隐藏它们（规则见OVERLAY_RULES）
+    SUPPRESS_OVERLAYS = True
+    # 请求路由策略（规则见ROUTE_RULES）: "off" 不拦截; "safe" 拦截图片/字体/媒体和跟踪域名，脚本和XHR全部放行;
+    # "strict" 另外拦截站点allow_domains之外的脚本、样式等资源。房型接口和文档请求在任何模式下都放行
+    ROUTE_POLICY = "safe"
+    # 进程内所有context共用的静态资源库目录（按URL和ETag索引、按内容哈希存储），在请求路由中直接回放
+    # ctrip的JS/CSS/字体，未命中时请求网络并写入；默认None关闭。
+    # 启用后即使ROUTE_POLICY为"off"也会注册context.route，Playwright因此不再使用浏览器的HTTP缓存
+    STATIC_ASSET_DIR = None
+    # 静态资源库内容文件的总大小上限(MB)，超过后不再写入新资源；设为None时不限制
+    STATIC_ASSET_MAX_MB = 200
+    # 静态资源库处理的资源类型和域名
+    STATIC_ASSET_TYPES = ["script", "stylesheet", "font"]
+    STATIC_ASSET_DOMAINS = ["c-ctrip.com", "tripcdn.com", "ctrip.com", "trip.com"]
+    # 常驻Chromium的CDP地址（见browser_server.py），例如 "http://127.0.0.1:9222"；设为None时每次运行启动新浏览器
+    CDP_URL = None
+    # 连接不上CDP_URL（未启动或已崩溃）时在该端口自动启动常驻Chromium，脚本退出后它继续运行
+    CDP_AUTO_LAUNCH = True
+    # 自动启动的常驻Chromium使用的用户目录
+    CDP_USER_DATA_DIR = "browser_profile"
+    # 常驻Chromium断开后，重新连接前等待它恢复（例如被browser_server.py重新启动）的时间(秒)，
+    # 超时仍连接不上时按CDP_AUTO_LAUNCH处理
+    CDP_RECONNECT_WAIT = 15
+    # 持久化浏览器用户目录，设置后用launch_persistent_context启动，ctrip的JS/CSS/图片等HTTP磁盘缓存跨运行复用；
+    # 持久化目录只有一个context，context池大小固定为1，并且不安装请求路由（Playwright启用路由后不使用HTTP缓存）
+    PROFILE_DIR = None
+    # 只读共享PROFILE_DIR：每次运行只把其中的HTTP缓存和代码缓存（PROFILE_CACHE_DIRS）复制到临时目录使用，
+    # 结束后删除，多个worker可以共用同一个预热好的目录。复制耗时与缓存大小成正比，每次运行都要付出，
+    # 日志中会输出复制的大小和耗时，可用 bench_cache.py --readonly 测量
+    PROFILE_READONLY = False
+    # 只读模式下从PROFILE_DIR复制的子目录（Chromium磁盘缓存不能被多个浏览器同时使用，只能复制）
+    PROFILE_CACHE_DIRS = [os.path.join("Default", "Cache"), os.path.join("Default", "Code Cache")]
+    # BrowserContext池：预热的context数量（已设置视口、cookies、弹窗屏蔽和请求路由）
+    CONTEXT_POOL_SIZE = 1
+    # context使用满该次数后关闭并重建
+    CONTEXT_MAX_USES = 20
+    # 归还时context所有标签页的JS堆合计超过该值(MB)则重建，设为None时不检查
+    CONTEXT_MEMORY_LIMIT_MB = 500
+    # 单次任务的时间预算(秒)，各阶段只使用剩余的预算，用完时取消任务；设为None时不限制
+    JOB_DEADLINE = 180
+    # 任务列表文件（JSON数组），每个任务是对Config的覆盖，例如
+    # [{"HOTEL_NAME": "...", "DESTINATION": "...", "CHECK_IN_DATE": "...", "CHECK_OUT_DATE": "...", "OUTPUT_FILE": "..."}]
+    # 同一进程依次执行，浏览器和context池在任务之间复用；设为None时只按当前配置执行一个任务
+    JOBS_FILE = None
+
+# ==================== 提取schema ====================
+
+extraction_schema = ExtractionSchema(Config.EXTRACTION_SCHEMA_FILE)
+
+def refresh_extraction_schema():
+    """检查schema文件是否有更新，返回当前是否有可用的schema"""
+    try:
+        if extraction_schema.refresh():
+            log_step(f"已加载提取schema v{extraction_schema.version}: {Config.EXTRACTION_SCHEMA_FILE}", "成功")
+    except SchemaError as e:
+        if extraction_schema.schema is None:
+            log_step(f"提取schema不可用: {str(e)}", "失败")
+        else:
+            log_step(f"新的提取schema无效，继续使用v{extraction_schema.version}: {str(e)}", "警告")
+    return extraction_schema.schema is not None
+
+def schema_locator(page_type, name):
+    """取schema中的命名选择器，schema不可用时抛出SchemaError"""
+    refresh_extraction_schema()
+    return extraction_schema.locator(page_type, name)
+
+def schema_field_rules(page_type, *path):
+    """取schema中字段的规则列表，schema不可用时抛出SchemaError"""
+    refresh_extraction_schema()
+    return extraction_schema.field_rules(page_type, *path)
+
+async def run_schema_extractor(target, page_type):
+    """在页面或元素上执行schema编译出的提取函数，一次evaluate返回所有字段，失败时返回None"""
+    if not refresh_extraction_schema():
+        return None
+    try:
+        return await target.evaluate(extraction_schema.extractor(page_type))
+    except Exception as e:
+        log_step(f"执行{page_type}提取函数时出错: {str(e)}", "警告")
+        return None
+
+# ==================== 任务截止时间 ====================
+
+class DeadlineExceeded(Exception):
+    """任务用完了时间预算"""
+    
+    def __init__(self, stage, budget_s):
+        super().__init__(f"任务在{stage}阶段超出 {budget_s}s 的时间预算")
+        self.stage = stage
+        self.budget_s = budget_s
+
+class Deadline:
+    """
+    单次任务的截止时间，由main创建并传给每个阶段函数
+    
+    各阶段的Playwright调用只使用剩余的预算：TimedWait和wait_until_ready的超时
+    不超过剩余时间，进入阶段时把页面的默认超时也收紧到剩余时间。
+    budget_s为None时不限制，各调用使用原来的超时
+    """
+    
+    def __init__(self, budget_s):
+        self.budget_s = budget_s
+        self.start = time.monotonic()
+        self.expires_at = self.start + budget_s if budget_s else None
+    
+    def elapsed_s(self):
+        return time.monotonic() - self.start
+    
+    def remaining_s(self):
+        """剩余秒数，不限制时返回None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def check(self, stage):
+        """预算已用完时抛出DeadlineExceeded"""
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded(stage, self.budget_s)
+    
+    def timeout(self, timeout_ms, stage):
+        """把超时(毫秒)收紧到剩余预算内"""
+        self.check(stage)
+        remaining = self.remaining_s()
+        if remaining is None:
+            return timeout_ms
+        return max(1, int(min(timeout_ms, remaining * 1000)))
+    
+    def limit(self, page, stage):
+        """把页面上未显式指定超时的操作（点击、导航等）限制在剩余预算内"""
+        if self.expires_at is None:
+            return
+        page_timeout = self.timeout(Config.TIMEOUT, stage)
+        page.set_default_timeout(page_timeout)
+        page.set_default_navigation_timeout(page_timeout)
+    
+    def enter(self, stage, page=None):
+        """进入一个阶段：检查预算并收紧页面的默认超时"""
+        self.check(stage)
+        if self.expires_at is None:
+            return
+        if page is not None:
+            self.limit(page, stage)
+        log_step(f"进入{stage}阶段，已用 {self.elapsed_s():.1f}s，剩余 {self.remaining_s():.1f}s", "信息")
+
+# ==================== 自适应超时 ====================
+
+wait_stats = WaitTimeStore(
+    Config.WAIT_STATS_FILE,
+    percentile=Config.ADAPTIVE_TIMEOUT_PERCENTILE,
+    margin=Config.ADAPTIVE_TIMEOUT_MARGIN,
+) if Config.WAIT_STATS_FILE else None
+
+class TimedWait:
+    """
+    命名等待点：按历史耗时给出超时，并记录本次等待的耗时
+    
+    用法:
+        with TimedWait("room_list_ready", 30000) as wait:
+            await page.wait_for_selector(selector, timeout=wait.timeout)
+    
+    超时取历史耗时的高分位数乘以余量，不低于Config.ADAPTIVE_TIMEOUT_MIN，不超过max_ms；
+    传入deadline时再收紧到任务剩余的预算内。只有正常结束和Playwright超时会被记录，
+    其他异常和因预算不足提前超时的等待不计入统计
+    """
+    
+    def __init__(self, name, max_ms, deadline=None):
+        self.name = name
+        self.max_ms = max_ms
+        adaptive = wait_stats.timeout_for(name, max_ms, Config.ADAPTIVE_TIMEOUT_MIN) if wait_stats else max_ms
+        self.timeout = deadline.timeout(adaptive, name) if deadline else adaptive
+        self.clipped = self.timeout < adaptive
+        self.start = None
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if wait_stats is None:
+            return False
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is None:
+            wait_stats.record(self.name, elapsed_ms)
+        elif issubclass(exc_type, PlaywrightTimeoutError) and not self.clipped:
+            wait_stats.record(self.name, elapsed_ms, timed_out=True)
+            if self.timeout < self.max_ms:
+                log_step(f"等待点 {self.name} 超过自适应超时 {self.timeout}ms（配置上限 {self.max_ms}ms）", "警告")
+        return False
+
+def save_wait_stats():
+    """保存等待耗时统计并输出各等待点当前的超时"""
+    if not wait_stats:
+        return
+    for name, stats in wait_stats.stats().items():
+        quantile = f"{stats['quantile_ms']}ms" if stats["quantile_ms"] else "未知"
+        log_step(f"等待点 {name}: {stats['samples']} 个样本，p{Config.ADAPTIVE_TIMEOUT_PERCENTILE * 100:.0f} {quantile}，"
+                 f"近期超时 {stats['timeouts']:.1f}", "信息")
+    try:
+        wait_stats.save()
+    except OSError as e:
+        log_step(f"保存等待耗时统计失败: {str(e)}", "警告")
+
+# ==================== 选择器探测 ====================
+
+# 一次检查所有候选选择器的第一个匹配元素是否可见，可见的判断与Playwright的is_visible一致：
+# 包围盒非空且visibility不是hidden。:has-text等浏览器不支持的选择器记入unsupported
+probe_selectors_script = """
+(selectors) => {
+    const unsupported = [];
+    for (let i = 0; i < selectors.length; i++) {
+        let el;
+        try {
+            el = document.querySelector(selectors[i]);
+        } catch (e) {
+            unsupported.push(i);
+            continue;
+        }
+        if (!el || getComputedStyle(el).visibility === 'hidden') continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.width > 0 && rect.height > 0) return {hit: i, unsupported};
+    }
+    return {hit: -1, unsupported};
+}
+"""
+
+selector_cache = SelectorCache(Config.SELECTOR_CACHE_FILE, Config.SELECTOR_DEMOTE_AFTER) if Config.SELECTOR_CACHE_FILE else None
+
+def selector_cache_key(page, page_type, field):
+    """选择器缓存的键，未启用缓存或未指定字段时返回None"""
+    if not (selector_cache and field):
+        return None
+    site = urllib.parse.urlparse(page.url).netloc or "unknown"
+    return SelectorCache.make_key(site, page_type, field)
+
+def record_selector_winner(cache_key, ordered, winner, elapsed_ms):
+    """记录一次选择器探测/操作的获胜者，获胜者与上次不同时输出缓存未命中"""
+    cache_hit, previous = selector_cache.record(cache_key, ordered, winner, elapsed_ms)
+    if previous and not cache_hit:
+        log_step(f"选择器缓存未命中 {cache_key}: 上次 '{previous}'，本次 '{winner}'", "警告")
+
+async def probe_selectors(page, selectors, page_type=None, field=None, record=True):
+    """
+    在一次evaluate中检查所有候选选择器，按优先级返回第一个可见的选择器，都不可见时返回None
+    
+    排在命中项之前的Playwright专用选择器（如:has-text）无法在页面内执行，按原顺序用page.is_visible单独检查。
+    指定page_type和field时按选择器缓存重排候选；record为True时把第一个可见的选择器记为本次的获胜者
+    """
+    selectors = list(selectors)
+    cache_key = selector_cache_key(page, page_type, field)
+    if cache_key:
+        selectors = selector_cache.order(cache_key, selectors)
+    
+    start = time.perf_counter()
+    try:
+        result = await page.evaluate(probe_selectors_script, selectors)
+    except Exception as e:
+        log_step(f"批量探测选择器失败，逐个检查: {str(e)}", "警告")
+        result = {"hit": -1, "unsupported": list(range(len(selectors)))}
+    
+    hit = result["hit"] if result["hit"] >= 0 else len(selectors)
+    winner = selectors[hit] if hit < len(selectors) else None
+    for i in result["unsupported"]:
+        if i > hit:
+            break
+        try:
+            if await page.is_visible(selectors[i]):
+                winner = selectors[i]
+                break
+        except Exception:
+            continue
+    
+    if cache_key and record:
+        record_selector_winner(cache_key, selectors, winner, (time.perf_counter() - start) * 1000)
+    return winner
+
+class SelectorCandidates:
+    """
+    按优先级依次产出可见的候选选择器，由iter_visible_selectors创建
+    
+    调用方放弃当前候选（操作失败）继续循环时，对剩余的候选再做一次批量探测。
+    可见不代表操作能成功，获胜者要等调用方操作成功后调用succeeded()才记入选择器缓存；
+    所有候选都不可见或都失败时整组记为失败:
+    
+        candidates = iter_visible_selectors(page, selectors, "search_form", "destination")
+        async for selector in candidates:
+            ...
+            candidates.succeeded(selector)
+            break
+    """
+    
+    def __init__(self, page, selectors, page_type=None, field=None):
+        self.page = page
+        self.selectors = list(selectors)
+        self.cache_key = selector_cache_key(page, page_type, field)
+        # 第一次探测时的候选顺序，排在获胜者之前的候选记为失败
+        self.ordered = selector_cache.order(self.cache_key, self.selectors) if self.cache_key else self.selectors
+        self.start = time.perf_counter()
+    
+    async def __aiter__(self):
+        remaining = list(self.ordered)
+        while remaining:
+            selector = await probe_selectors(self.page, remaining, record=False)
+            if selector is None:
+                break
+            yield selector
+            remaining.remove(selector)
+        if self.cache_key:
+            record_selector_winner(self.cache_key, self.ordered, None, (time.perf_counter() - self.start) * 1000)
+    
+    def succeeded(self, selector):
+        """调用方对selector的操作成功，记为本次的获胜者"""
+        if self.cache_key:
+            record_selector_winner(self.cache_key, self.ordered, selector, (time.perf_counter() - self.start) * 1000)
+
+def iter_visible_selectors(page, selectors, page_type=None, field=None):
+    """按优先级依次产出可见的候选选择器，操作成功后调用返回对象的succeeded()记录获胜者"""
+    return SelectorCandidates(page, selectors, page_type, field)
+
+def save_selector_cache():
+    """保存选择器缓存并输出各字段的命中统计"""
+    if not selector_cache:
+        return
+    for key, stats in selector_cache.stats().items():
+        total = stats["hits"] + stats["misses"]
+        log_step(f"选择器缓存 {key}: 获胜 '{stats['winner']}'，命中 {stats['hits']}/{total} ({stats['hit_rate']:.0%})", "信息")
+    try:
+        selector_cache.save()
+    except OSError as e:
+        log_step(f"保存选择器缓存失败: {str(e)}", "警告")
+
+# ==================== 句柄与标签页内存 ====================
+
+class HandleScope:
+    """
+    收集一段提取代码创建的ElementHandle，release()时统一dispose
+    
+    未释放的句柄会把远程对象一直钉在渲染进程里，长时间运行时内存持续增长
+    """
+    
+    def __init__(self):
+        self.handles = []
+    
+    def track(self, result):
+        """记录query_selector/query_selector_all的返回值并原样返回"""
+        if isinstance(result, list):
+            self.handles.extend(result)
+        elif result is not None:
+            self.handles.append(result)
+        return result
+    
+    async def release(self):
+        handles, self.handles = self.handles, []
+        await asyncio.gather(*(handle.dispose() for handle in handles), return_exceptions=True)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+async def get_page_memory(page):
+    """通过CDP读取标签页的JS堆大小(MB)和DOM节点数，返回 {"js_heap_mb", "nodes"}"""
+    session = await page.context.new_cdp_session(page)
+    try:
+        await session.send("Performance.enable")
+        result = await session.send("Performance.getMetrics")
+    finally:
+        await session.detach()
+    metrics = {metric["name"]: metric["value"] for metric in result["metrics"]}
+    return {
+        "js_heap_mb": metrics.get("JSHeapUsedSize", 0) / 1024 / 1024,
+        "nodes": int(metrics.get("Nodes", 0)),
+    }
+
+async def recycle_page_if_needed(page, deadline=None, reload=True, owned=True):
+    """
+    标签页JS堆超过Config.PAGE_JS_HEAP_LIMIT_MB时，在同一context中新开标签页替换它
+    
+    参数:
+    - deadline: 重新打开当前URL时使用的任务预算
+    - reload: 新标签页是否重新打开当前URL；调用方马上要导航到别处时传False
+    - owned: 页面是否归调用方所有；ContextPool借出的页面由池在归还时按内存上限回收，这里不关闭
+    
+    返回可以继续使用的页面（未超限或不归调用方所有时就是原页面）
+    """
+    if not Config.PAGE_JS_HEAP_LIMIT_MB or page.is_closed():
+        return page
+    try:
+        memory = await get_page_memory(page)
+    except Exception as e:
+        log_step(f"读取标签页内存失败: {str(e)}", "警告")
+        return page
+    if memory["js_heap_mb"] <= Config.PAGE_JS_HEAP_LIMIT_MB:
+        return page
+    
+    if not owned:
+        log_step(f"标签页JS堆 {memory['js_heap_mb']:.0f}MB 超过上限 {Config.PAGE_JS_HEAP_LIMIT_MB}MB"
+                 f"（DOM节点 {memory['nodes']}），该页面由context池管理，归还时回收", "警告")
+        return page
+    
+    log_step(f"标签页JS堆 {memory['js_heap_mb']:.0f}MB 超过上限 {Config.PAGE_JS_HEAP_LIMIT_MB}MB"
+             f"（DOM节点 {memory['nodes']}），新开标签页替换", "警告")
+    url = page.url
+    new_page = await page.context.new_page()
+    await page.close()
+    if reload and url.startswith("http"):
+        with TimedWait("recycle_reload", Config.TIMEOUT, deadline) as wait:
+            await new_page.goto(url, timeout=wait.timeout)
+    return new_page
+
+# ==================== 页面就绪等待 ====================
+
+# 在页面内用MutationObserver等待就绪，代替固定时长的sleep：
+# selector对应元素达到state（visible/attached/hidden），文本不再等于changedFrom，
+# 并且之后DOM连续quietMs没有变化。DOM持续变化时最多再等quietMs*10；超时返回当前状态
+wait_ready_script = """
+({selector, state, quietMs, timeoutMs, changedFrom}) => new Promise(resolve => {
+    const start = performance.now();
+    const isVisible = el => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const matches = () => {
+        if (!selector) return true;
+        const el = document.querySelector(selector);
+        if (state === 'hidden') return !el || !isVisible(el);
+        if (!el || (state === 'visible' && !isVisible(el))) return false;
+        return changedFrom === null || el.textContent !== changedFrom;
+    };
+    let quietTimer = null;
+    let capTimer = null;
+    const finish = (ready, reason) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(capTimer);
+        clearTimeout(deadline);
+        resolve({ready, reason, waited: Math.round(performance.now() - start)});
+    };
+    const check = () => {
+        clearTimeout(quietTimer);
+        if (!matches()) return;
+        if (!capTimer) capTimer = setTimeout(() => finish(matches(), 'busy'), quietMs * 10);
+        quietTimer = setTimeout(() => { if (matches()) finish(true, 'ready'); }, quietMs);
+    };
+    const observer = new MutationObserver(check);
+    observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+    const deadline = setTimeout(() => finish(matches(), 'timeout'), timeoutMs);
+    check();
+})
+"""
+
+async def wait_until_ready(page, selector=None, label="页面", state="visible", timeout=10000,
+                           quiet_ms=None, changed_from=None, deadline=None):
+    """
+    等待页面真正就绪，就绪后立即返回，并记录实际等待时长
+    
+    参数:
+    - selector: 需要等待的元素，为None时只等待DOM安静
+    - state: "visible" 可见 / "attached" 存在 / "hidden" 不存在或不可见
+    - timeout: 最长等待时间(毫秒)，替换固定sleep时传原来的时长，保证不会比原来更慢
+    - quiet_ms: 元素就绪后DOM需要保持不变的时间，默认Config.READY_QUIET_MS
+    - changed_from: 元素文本需要与该值不同（例如翻页后等待标题变化）
+    - deadline: 任务的Deadline，超时不超过剩余预算
+    
+    返回是否在超时前就绪
+    """
+    if deadline:
+        timeout = deadline.timeout(timeout, label)
+    args = {
+        "selector": selector,
+        "state": state,
+        "quietMs": Config.READY_QUIET_MS if quiet_ms is None else quiet_ms,
+        "timeoutMs": timeout,
+        "changedFrom": changed_from,
+    }
+    start = time.perf_counter()
+    try:
+        result = await page.evaluate(wait_ready_script, args)
+    except Exception as e:
+        # 等待期间页面跳转会销毁执行上下文
+        log_step(f"等待{label}时出错（已等待 {(time.perf_counter() - start) * 1000:.0f}ms）: {str(e)}", "警告")
+        return False
+    
+    if result["ready"]:
+        log_step(f"{label}已就绪，等待 {result['waited']}ms（上限 {timeout}ms）", "信息")
+    else:
+        log_step(f"{label}在 {result['waited']}ms 内未就绪", "警告")
+    return result["ready"]
+
+# ==================== 页面预检 ====================
+
+# 验证码/风控页面的文本标志（不区分大小写）
+BLOCKED_PAGE_MARKERS = [
+    '验证码', '安全验证', '滑动验证', '访问过于频繁', 'captcha', 'cpt-drop-box', 'slider-verify'
+]
+# 滑块验证码的元素
+BLOCKED_PAGE_SELECTOR = '[class*="cpt-drop-box"], [id*="slider-verify"], [class*="slider-verify"], iframe[src*="captcha"]'
+# 跳转到登录页的URL标志和登录表单元素
+LOGGED_OUT_URL_MARKERS = ['passport.ctrip.com', '/login']
+LOGGED_OUT_SELECTOR = '#nloginname, #npwd, .lg_loginwrap, .login-box'
+
+PREFLIGHT_OUTCOMES = ("ok", "blocked", "logged-out", "layout-changed")
+preflight_stats = {outcome: 0 for outcome in PREFLIGHT_OUTCOMES}
+
+# 一次evaluate判断页面状态：页面标志元素存在时直接判定ok，只有缺失时才检查验证码和登录表单
+classify_page_script = """
+([anchor, blockedMarkers, blockedSelector, loginUrlMarkers, loginSelector]) => {
+    const url = location.href.toLowerCase();
+    const loginUrl = loginUrlMarkers.find(m => url.includes(m));
+    if (loginUrl) return {outcome: 'logged-out', reason: `URL包含${loginUrl}`};
+    if (anchor && document.querySelector(anchor)) return {outcome: 'ok', reason: ''};
+    
+    const captcha = document.querySelector(blockedSelector);
+    if (captcha) return {outcome: 'blocked', reason: `验证码元素 ${captcha.id || captcha.className}`};
+    const text = ((document.title || '') + ' ' + (document.body ? document.body.innerText : '')).toLowerCase();
+    const marker = blockedMarkers.find(m => text.includes(m));
+    if (marker) return {outcome: 'blocked', reason: `页面包含'${marker}'`};
+    if (document.querySelector(loginSelector)) return {outcome: 'logged-out', reason: '页面显示登录表单'};
+    return {outcome: anchor ? 'layout-changed' : 'ok', reason: anchor ? '未找到页面标志元素' : ''};
+}
+"""
+
+class PageBlockedError(Exception):
+    """预检判定页面被拦截或需要登录，继续执行只会在各阶段超时"""
+    
+    def __init__(self, page_type, outcome, reason):
+        super().__init__(f"{page_type} 页面预检结果 {outcome}: {reason}")
+        self.page_type = page_type
+        self.outcome = outcome
+        self.reason = reason
+
+async def classify_page(page, page_type, deadline=None):
+    """
+    判断页面状态，返回 (结果, 原因)，结果为 "ok" / "blocked" / "logged-out" / "layout-changed"
+    
+    页面标志元素取自schema中对应页面类型的ready locator。标志暂未出现时
+    最多再等待Config.PREFLIGHT_WAIT毫秒（验证码出现也会提前结束等待）后重新判断一次
+    """
+    try:
+        anchor = schema_locator(page_type, "ready")
+    except SchemaError:
+        anchor = None
+    args = [anchor, BLOCKED_PAGE_MARKERS, BLOCKED_PAGE_SELECTOR, LOGGED_OUT_URL_MARKERS, LOGGED_OUT_SELECTOR]
+    
+    result = await page.evaluate(classify_page_script, args)
+    if result["outcome"] == "layout-changed":
+        try:
+            with TimedWait(f"preflight_{page_type}", Config.PREFLIGHT_WAIT, deadline) as wait:
+                await page.wait_for_selector(f"{anchor}, {BLOCKED_PAGE_SELECTOR}, {LOGGED_OUT_SELECTOR}",
+                                             timeout=wait.timeout)
+        except (PageBlockedError, DeadlineExceeded):
+            raise
+        except Exception:
+            pass
+        result = await page.evaluate(classify_page_script, args)
+    return result["outcome"], result["reason"]
+
+async def preflight_page(page, page_type, deadline=None):
+    """
+    导航后的页面预检：记录结果计数，页面被拦截或需要登录时抛出PageBlockedError，
+    其余情况返回结果，由调用方决定是否绕过当前阶段
+    """
+    start = time.perf_counter()
+    try:
+        outcome, reason = await classify_page(page, page_type, deadline)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        # 预检本身出错时不阻断流程
+        log_step(f"{page_type} 页面预检出错: {str(e)}", "警告")
+        return "ok"
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    preflight_stats[outcome] += 1
+    
+    if outcome == "ok":
+        log_step(f"{page_type} 页面预检通过，耗时 {elapsed_ms:.0f}ms", "成功")
+        return outcome
+    log_step(f"{page_type} 页面预检结果 {outcome}: {reason}，耗时 {elapsed_ms:.0f}ms，URL: {page.url}", "警告")
+    if outcome in ("blocked", "logged-out"):
+        raise PageBlockedError(page_type, outcome, reason)
+    return outcome
+
+def log_preflight_stats():
+    """输出本次运行各预检结果的计数"""
+    summary = ", ".join(f"{outcome} {count}" for outcome, count in preflight_stats.items())
+    log_step(f"页面预检统计: {summary}", "信息")
+
+# ==================== 弹窗屏蔽 ====================
+
+# 站点 -> 屏蔽规则，规则名用于统计；验证码和登录表单（预检依赖它们）永远不会被隐藏
+OVERLAY_RULES = {
+    "ctrip.com": [
+        {"name": "营销弹窗", "selector": '[class*="pop-mask"], [class*="popup-ad"], [class*="marketing-pop"], [class*="activity-pop"]'},
+        {"name": "优惠券浮层", "selector": '[class*="coupon-pop"], [class*="couponPop"], [class*="red-packet"], [class*="redPacket"]'},
+        {"name": "登录引导", "selector": '[class*="login-guide"], [class*="loginGuide"], [class*="login-tip-pop"]'},
+        {"name": "APP下载浮层", "selector": '[class*="download-app"], [class*="app-download"], [class*="appDownload"]'},
+    ],
+    "trip.com": [
+        {"name": "Cookie提示", "selector": '#ibu-cookie-banner, [class*="cookie-banner"], [class*="cookieBanner"]'},
+        {"name": "登录引导", "selector": '[class*="login-guide"], [class*="loginGuide"], [class*="signin-popup"]'},
+        {"name": "APP下载浮层", "selector": '[class*="download-app"], [class*="app-download"], [class*="appDownload"]'},
+    ],
+}
+
+# 初始化脚本：在文档创建时启动MutationObserver，新节点插入后、下一次渲染前隐藏命中规则的元素，
+# 并解除弹窗加在body上的滚动锁定；每次命中通过绑定函数回报规则名
+overlay_suppression_script = """
+({sites, protectedSelector, binding}) => {
+    const host = location.hostname;
+    const rules = Object.entries(sites)
+        .filter(([site]) => host === site || host.endsWith('.' + site))
+        .flatMap(([, siteRules]) => siteRules)
+        .filter(rule => {
+            try { document.createDocumentFragment().querySelector(rule.selector); return true; }
+            catch (e) { return false; }
+        });
+    if (!rules.length) return;
+    const combined = rules.map(rule => rule.selector).join(', ');
+    const hidden = new WeakSet();
+    
+    const isProtected = el => el.matches(protectedSelector) || el.querySelector(protectedSelector);
+    const hide = el => {
+        if (hidden.has(el) || isProtected(el)) return;
+        const rule = rules.find(r => el.matches(r.selector));
+        hidden.add(el);
+        el.style.setProperty('display', 'none', 'important');
+        for (const root of [document.documentElement, document.body]) {
+            if (root && root.style.overflow === 'hidden') root.style.overflow = '';
+        }
+        if (typeof window[binding] === 'function') window[binding](rule.name).catch(() => {});
+    };
+    const scan = node => {
+        if (node.nodeType !== 1) return;
+        if (node.matches(combined)) hide(node);
+        else if (node.firstElementChild) node.querySelectorAll(combined).forEach(hide);
+    };
+    
+    new MutationObserver(mutations => {
+        for (const mutation of mutations) {
+            // class变化只检查元素本身，避免大容器切换class时扫描整棵子树
+            if (mutation.type === 'attributes') { if (mutation.target.matches(combined)) hide(mutation.target); }
+            else mutation.addedNodes.forEach(scan);
+        }
+    }).observe(document, {childList: true, subtree: true, attributes: true, attributeFilter: ['class']});
+    if (document.documentElement) scan(document.documentElement);
+}
+"""
+
+# 初始化脚本回报命中时调用的绑定函数名
+OVERLAY_BINDING = "__ctripOverlaySuppressed"
+
+# 规则名 -> 本次运行中隐藏的元素数
+overlay_stats = {}
+
+def record_overlay_hit(rule_name):
+    """初始化脚本每隐藏一个元素调用一次"""
+    overlay_stats[rule_name] = overlay_stats.get(rule_name, 0) + 1
+    if Config.DEBUG:
+        log_step(f"已屏蔽弹窗: {rule_name}", "信息")
+
+async def install_overlay_suppression(context):
+    """为BrowserContext注入弹窗屏蔽脚本，对之后打开的所有标签页和跳转生效"""
+    if not Config.SUPPRESS_OVERLAYS:
+        return
+    args = {
+        "sites": OVERLAY_RULES,
+        "protectedSelector": f"{BLOCKED_PAGE_SELECTOR}, {LOGGED_OUT_SELECTOR}",
+        "binding": OVERLAY_BINDING,
+    }
+    await context.expose_function(OVERLAY_BINDING, record_overlay_hit)
+    await context.add_init_script(script=f"({overlay_suppression_script})({json.dumps(args, ensure_ascii=False)})")
+    log_step(f"已注入弹窗屏蔽脚本，共 {sum(len(rules) for rules in OVERLAY_RULES.values())} 条规则", "信息")
+
+def log_overlay_stats():
+    """输出本次运行各屏蔽规则的命中次数"""
+    if not Config.SUPPRESS_OVERLAYS:
+        return
+    summary = ", ".join(f"{name} {count}" for name, count in sorted(overlay_stats.items(), key=lambda x: -x[1]))
+    log_step(f"弹窗屏蔽统计: {summary or '无命中'}", "信息")
+
+# ==================== 请求路由 ====================
+
+# 统计/跟踪类第三方域名
+TRACKER_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "hm.baidu.com", "cnzz.com", "mmstat.com", "facebook.net", "bat.bing.com", "criteo.com", "hotjar.com",
+]
+
+# 站点 -> 路由规则，"*"对所有站点生效并与命中的站点规则合并；站点按标签页当前URL的域名匹配
+#   deny_types    拦截的资源类型
+#   deny_domains  拦截的请求域名
+#   allow_domains 第一方域名，strict模式下只放行这些域名的资源
+#   allow_types   strict模式下第三方域名仍放行的资源类型
+ROUTE_RULES = {
+    "*": {
+        "deny_types": ["image", "media", "font"],
+        "deny_domains": TRACKER_DOMAINS,
+        "allow_types": ["document", "xhr", "fetch"],
+    },
+    "ctrip.com": {
+        "allow_domains": ["ctrip.com", "c-ctrip.com", "ctripcorp.com", "tripcdn.com"],
+    },
+    "trip.com": {
+        "allow_domains": ["trip.com", "tripcdn.com", "ctrip.com", "c-ctrip.com"],
+    },
+}
+
+# 任何模式下都放行的URL关键字（另加Config.ROOM_PAYLOAD_URL_KEYWORDS），验证码资源被拦截会影响预检判断
+ROUTE_KEEP_URL_KEYWORDS = ["captcha", "slider"]
+
+def domain_matches(host, domains):
+    """host是domains中某个域名或其子域名"""
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+class RouteDispatcher:
+    """
+    每个BrowserContext一个的请求分发器：只注册一次context.route，请求按注册顺序交给各处理器，
+    处理器返回True表示已经abort/fulfill，都没有处理时放行
+    
+    Playwright在启用路由的context中不使用HTTP缓存，没有处理器时不注册路由
+    """
+    
+    def __init__(self, context):
+        self.context = context
+        self.handlers = []
+        self.installed = False
+    
+    def add(self, handler):
+        self.handlers.append(handler)
+    
+    async def install(self):
+        if self.handlers and not self.installed:
+            await self.context.route("**/*", self.dispatch)
+            self.installed = True
+    
+    async def dispatch(self, route, request):
+        try:
+            for handler in self.handlers:
+                if await handler(route, request):
+                    return
+            await route.continue_()
+        except Exception as e:
+            # 标签页关闭后route已失效
+            if Config.DEBUG:
+                log_step(f"路由处理 {request.url} 出错: {str(e)}", "警告")
+
+class RoutePolicy:
+    """按站点的资源类型和域名允许/拒绝列表决定请求是否放行，统计拦截的请求数和实际加载的字节数"""
+    
+    def __init__(self, mode, rules):
+        self.mode = mode
+        self.rules = rules
+        self.keep_keywords = [k.lower() for k in ROUTE_KEEP_URL_KEYWORDS + Config.ROOM_PAYLOAD_URL_KEYWORDS]
+        self.site_cache = {}
+        self.allowed = 0
+        self.loaded_bytes = 0
+        # 拦截原因 -> 请求数，资源类型 -> 请求数
+        self.blocked_by_reason = {}
+        self.blocked_by_type = {}
+    
+    def site_rules(self, host):
+        """合并"*"和与host匹配的站点规则"""
+        if host not in self.site_cache:
+            merged = {}
+            for site, rules in self.rules.items():
+                if site == "*" or domain_matches(host, [site]):
+                    for key, values in rules.items():
+                        merged.setdefault(key, []).extend(values)
+            self.site_cache[host] = merged
+        return self.site_cache[host]
+    
+    def decide(self, url, resource_type, page_url):
+        """返回拦截原因，放行时返回None"""
+        if resource_type == "document":
+            return None
+        lowered = url.lower()
+        if any(keyword in lowered for keyword in self.keep_keywords):
+            return None
+        host = urllib.parse.urlparse(url).hostname or ""
+        rules = self.site_rules(urllib.parse.urlparse(page_url or url).hostname or "")
+        if domain_matches(host, rules.get("deny_domains", [])):
+            return "deny-domain"
+        if resource_type in rules.get("deny_types", []):
+            return "deny-type"
+        if self.mode == "strict" and not domain_matches(host, rules.get("allow_domains", [])) \
+                and resource_type not in rules.get("allow_types", []):
+            return "third-party"
+        return None
+    
+    async def handle(self, route, request):
+        try:
+            page_url = request.frame.url
+        except Exception:
+            # service worker发出的请求没有frame
+            page_url = ""
+        reason = self.decide(request.url, request.resource_type, page_url)
+        if reason is None:
+            self.allowed += 1
+            return False
+        self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+        self.blocked_by_type[request.resource_type] = self.blocked_by_type.get(request.resource_type, 0) + 1
+        await route.abort("blockedbyclient")
+        return True
+    
+    def on_response(self, response):
+        """按Content-Length累计实际加载的字节数（分块传输的响应没有该头，不计入）"""
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            self.loaded_bytes += int(length)
+    
+    def attach(self, context, dispatcher):
+        dispatcher.add(self.handle)
+        context.on("response", self.on_response)
+    
+    def log_stats(self):
+        """被拦截的请求没有发出，无法得知其大小，只统计请求数；节省的流量用bench_cache.py等对照测量"""
+        blocked = sum(self.blocked_by_type.values())
+        total = blocked + self.allowed
+        by_type = ", ".join(f"{t} {n}" for t, n in sorted(self.blocked_by_type.items(), key=lambda x: -x[1]))
+        by_reason = ", ".join(f"{r} {n}" for r, n in self.blocked_by_reason.items())
+        log_step(f"请求路由({self.mode}): 拦截 {blocked}/{total} 个请求"
+                 f"{f'（{blocked / total * 100:.0f}%）' if total else ''}，"
+                 f"放行的请求按Content-Length计加载 {self.loaded_bytes / 1024 / 1024:.1f}MB", "信息")
+        if blocked:
+            log_step(f"拦截明细: 按类型 {by_type}; 按原因 {by_reason}", "信息")
+
+# 模式 -> 路由策略，同一模式的统计在整个进程内累计
+route_policies = {}
+
+def current_route_policy():
+    """
+    按当前的Config.ROUTE_POLICY返回路由策略，"off"时返回None
+    
+    在安装路由时读取配置，运行中修改Config.ROUTE_POLICY对之后新建的context生效
+    """
+    mode = Config.ROUTE_POLICY
+    if mode == "off":
+        return None
+    if mode not in route_policies:
+        route_policies[mode] = RoutePolicy(mode, ROUTE_RULES)
+    return route_policies[mode]
+
+async def install_request_routing(context):
+    """
+    为BrowserContext安装请求分发器，依次注册路由策略和静态资源库，返回分发器
+    
+    被路由策略拦截的请求不会再交给静态资源库
+    """
+    dispatcher = RouteDispatcher(context)
+    route_policy = current_route_policy()
+    static_asset_cache = current_static_asset_cache()
+    if browser_mode() == "profile":
+        if route_policy or static_asset_cache:
+            log_step("持久化缓存模式下不安装请求路由，以免Playwright停用HTTP缓存", "信息")
+        return dispatcher
+    if route_policy:
+        route_policy.attach(context, dispatcher)
+    if static_asset_cache:
+        dispatcher.add(static_asset_cache.handle)
+    await dispatcher.install()
+    return dispatcher
+
+def log_route_stats():
+    """输出本次运行各路由模式拦截的请求数"""
+    for route_policy in route_policies.values():
+        route_policy.log_stats()
+
+# ==================== 静态资源库 ====================
+
+# 带内容哈希或版本号的URL内容不会变化，命中后直接回放，其余的先发条件请求重新验证
+VERSIONED_ASSET_PATTERN = re.compile(
+    r'[._-][0-9a-f]{8,}\.(?:js|css|woff2?|ttf|otf)(?:$|\?)|[?&](?:v|ver|version|_v)=[^&]+|/\d+\.\d+\.\d+/',
+    re.IGNORECASE,
+)
+
+class StaticAssetCache:
+    """
+    请求路由中的静态资源处理器，背后是进程内共用的StaticAssetStore
+    
+    同一URL同时有多个未命中的请求（例如多个context同时冷启动）时只向网络请求一次，
+    其余请求等它写入后从本地回放
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        # URL -> 正在请求网络的Future，结果为写入后的索引记录
+        self.inflight = {}
+    
+    def cacheable(self, request):
+        if request.method != "GET" or request.resource_type not in Config.STATIC_ASSET_TYPES:
+            return False
+        host = urllib.parse.urlparse(request.url).hostname or ""
+        return domain_matches(host, Config.STATIC_ASSET_DOMAINS)
+    
+    async def replay(self, route, entry):
+        """用本地内容文件fulfill，内容文件丢失时返回False"""
+        path = self.store.path(entry)
+        if path is None:
+            return False
+        await route.fulfill(status=200, headers=entry["headers"], path=path)
+        return True
+    
+    async def handle(self, route, request):
+        if not self.cacheable(request):
+            return False
+        url = request.url
+        entry = self.store.lookup(url)
+        if entry and VERSIONED_ASSET_PATTERN.search(url):
+            if await self.replay(route, entry):
+                self.store.record("hit")
+                return True
+            self.store.forget(url, entry)
+            entry = None
+        
+        pending = self.inflight.get(url)
+        if pending:
+            entry = await pending
+            if entry and await self.replay(route, entry):
+                self.store.record("hit")
+                return True
+            return False
+        
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[url] = future
+        new_entry = None
+        try:
+            new_entry = await self.fetch(route, request, entry)
+            return True
+        except Exception as e:
+            if Config.DEBUG:
+                log_step(f"静态资源 {url} 请求失败: {str(e)}", "警告")
+            return False
+        finally:
+            del self.inflight[url]
+            future.set_result(new_entry)
+    
+    async def fetch(self, route, request, entry):
+        """
+        请求网络并fulfill，返回最新的索引记录
+        
+        有本地记录时带条件请求头：If-None-Match列出该URL所有已保存版本的ETag，
+        304响应按其ETag回放对应的版本
+        """
+        headers = dict(request.headers)
+        etags = [version["etag"] for version in self.store.versions(request.url) if version.get("etag")]
+        if etags:
+            headers["if-none-match"] = ", ".join(etags)
+        if entry and entry.get("last_modified"):
+            headers["if-modified-since"] = entry["last_modified"]
+        response = await route.fetch(headers=headers)
+        if response.status == 304 and entry:
+            etag = response.headers.get("etag")
+            matched = self.store.lookup(request.url, etag) if etag else entry
+            if matched and await self.replay(route, matched):
+                self.store.record("revalidated")
+                return matched
+            # 本地内容丢失或没有对应的版本，不带条件请求头重新请求
+            response = await route.fetch()
+        
+        self.store.record("miss")
+        body = await response.body()
+        new_entry = None
+        if response.status == 200 and "no-store" not in response.headers.get("cache-control", ""):
+            new_entry = self.store.put(request.url, body, response.headers)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in StaticAssetStore.DROP_HEADERS}
+        await route.fulfill(status=response.status, headers=headers, body=body)
+        return new_entry
+    
+    def log_stats(self):
+        stats = self.store.stats()
+        skipped = f"，超出上限未写入 {stats['skipped']} 个" if stats["skipped"] else ""
+        log_step(f"静态资源库: {stats['requests']} 个请求，命中 {stats['hits']}，304重新验证 {stats['revalidated']}，"
+                 f"未命中 {stats['misses']}（命中率 {stats['hit_ratio'] * 100:.0f}%）；本地 {stats['urls']} 个URL、"
+                 f"{stats['entries']} 个版本，内容文件共 {stats['object_bytes'] / 1024 / 1024:.1f}MB，"
+                 f"本次写入 {stats['stored_bytes'] / 1024 / 1024:.1f}MB{skipped}", "信息")
+
+# 目录 -> 静态资源库，同一目录在整个进程内共用
+static_asset_caches = {}
+
+def current_static_asset_cache():
+    """按当前的Config.STATIC_ASSET_DIR返回静态资源库，未设置时返回None"""
+    directory = Config.STATIC_ASSET_DIR
+    if not directory:
+        return None
+    if directory not in static_asset_caches:
+        max_bytes = Config.STATIC_ASSET_MAX_MB * 1024 * 1024 if Config.STATIC_ASSET_MAX_MB else None
+        static_asset_caches[directory] = StaticAssetCache(StaticAssetStore(directory, max_bytes))
+    return static_asset_caches[directory]
+
+def save_static_assets():
+    """输出静态资源库的命中率和大小，并保存索引"""
+    for static_asset_cache in static_asset_caches.values():
+        static_asset_cache.log_stats()
+        try:
+            static_asset_cache.store.save()
+        except Exception as e:
+            log_step(f"保存静态资源库索引失败: {str(e)}", "警告")
+
+# ==================== 日历日期引擎 ====================
+
+# 日期输入框（点击后弹出日历）
+DATE_INPUT_SELECTORS = [
+    'input.focus-input.show-hightlight.in-time',
+    'input.focus-input.in-time',
+    'div.time-tab input[type="text"]',
+    'input[aria-label*="入住时间"]',
+    '.time-tab input',
+    'label[aria-label="入住时间"], label.in',
+]
+CALENDAR_SELECTOR = '.c-calendar__body, .c-calendar-month__days, .c-calendar, .m-calendar-box'
+MONTH_PANEL_SELECTOR = '.c-calendar-month, .month-panel, div[class*="calendar"] > div'
+MONTH_TITLE_SELECTOR = 'h3, .title, [class*="title"]'
+PREV_MONTH_SELECTOR = '.c-calendar-icon-prev, .prev-btn, .btn-prev, [class*="prev"]'
+NEXT_MONTH_SELECTOR = '.c-calendar-icon-next, .next-btn, .btn-next, [class*="next"]'
+# 日期单元格，按优先级尝试
+DAY_CELL_SELECTORS = [
+    'li[class*="allow-hover"]',
+    'li:not([class*="disable"])',
+    'li[tabindex]',
+    'td[class*="day"]',
+    'div[class*="day"]',
+    'li',
+    'td',
+]
+# 选择完成后回读日期的元素
+DATE_DISPLAY_SELECTORS = {
+    "checkIn": [
+        'input.focus-input.in-time', 'input.in-time', 'input[placeholder*="入住"]',
+        'input[aria-label*="入住"]', 'label.in',
+    ],
+    "checkOut": [
+        'input.focus-input.out-time', 'input.out-time', 'input[placeholder*="离店"]',
+        'input[placeholder*="退房"]', 'input[aria-label*="离店"]', 'input[aria-label*="退房"]', 'label.out',
+    ],
+}
+
+# 一次evaluate完成：打开日历 → 翻到入住月份并点击 → 翻到离店月份并点击 → 等待日历关闭 → 回读两个日期。
+# 翻页在页面内用MutationObserver等待月份标题变化，不需要每次点击都往返一次
+calendar_engine_script = """
+async ({dates, inputSelectors, calendarSelector, panelSelector, titleSelector, prevSelector, nextSelector,
+        cellSelectors, displaySelectors, maxSteps, stepTimeoutMs, closeTimeoutMs}) => {
+    const started = performance.now();
+    const log = [];
+    let steps = 0;
+    const isVisible = el => {
+        if (!el) return false;
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const firstVisible = selector => Array.from(document.querySelectorAll(selector)).find(isVisible) || null;
+    const isDisabled = el => el.classList.contains('is-disable') || el.classList.contains('disabled') ||
+        el.getAttribute('aria-disabled') === 'true' || el.hasAttribute('disabled');
+    // 条件满足或超时后返回条件的值
+    const waitFor = (predicate, timeoutMs) => new Promise(resolve => {
+        const initial = predicate();
+        if (initial) return resolve(initial);
+        const observer = new MutationObserver(() => {
+            const value = predicate();
+            if (value) {
+                clearTimeout(timer);
+                observer.disconnect();
+                resolve(value);
+            }
+        });
+        const timer = setTimeout(() => {
+            observer.disconnect();
+            resolve(predicate());
+        }, timeoutMs);
+        observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+    });
+    // 可见的月份面板，按年*12+月编号；嵌套匹配时只保留最内层
+    const monthPanels = () => {
+        const panels = Array.from(document.querySelectorAll(panelSelector)).filter(isVisible).map(panel => {
+            const title = panel.querySelector(titleSelector);
+            const match = title && title.textContent.match(/(\\d{4})年\\s*(\\d{1,2})月/);
+            return match ? {panel, index: Number(match[1]) * 12 + Number(match[2])} : null;
+        }).filter(Boolean);
+        return panels.filter(p => !panels.some(q => q !== p && p.panel.contains(q.panel)));
+    };
+    const showMonth = async (index) => {
+        for (;;) {
+            const panels = monthPanels();
+            if (!panels.length) return null;
+            const hit = panels.find(p => p.index === index);
+            if (hit) return hit.panel;
+            if (steps >= maxSteps) return null;
+            const forward = index > panels[0].index;
+            const button = firstVisible(forward ? nextSelector : prevSelector);
+            if (!button || isDisabled(button)) {
+                log.push(`${forward ? '下' : '上'}一月按钮不可用`);
+                return null;
+            }
+            const before = panels.map(p => p.index).join(',');
+            button.click();
+            steps++;
+            await waitFor(() => {
+                const now = monthPanels().map(p => p.index).join(',');
+                return now && now !== before;
+            }, stepTimeoutMs);
+        }
+    };
+    // 格子是否对应date：有data-date属性时按完整日期比较，否则只取文本开头的1-2位数字作为日数，
+    // 格子里同时显示的价格、节假日等数字不参与匹配
+    const cellMatches = (cell, date) => {
+        const attr = cell.getAttribute('data-date') || cell.getAttribute('data-day') || '';
+        const full = attr.match(/^(\d{4})\D(\d{1,2})\D(\d{1,2})$/);
+        if (full) return Number(full[1]) === date.year && Number(full[2]) === date.month && Number(full[3]) === date.day;
+        if (/^\d{1,2}$/.test(attr)) return Number(attr) === date.day;
+        const leading = cell.textContent.trim().match(/^(\d{1,2})(?!\d)/);
+        return Boolean(leading) && Number(leading[1]) === date.day;
+    };
+    const findDay = (panel, date) => {
+        for (const selector of cellSelectors) {
+            const cell = Array.from(panel.querySelectorAll(selector)).find(cell =>
+                cellMatches(cell, date) && !isDisabled(cell));
+            if (cell) return cell;
+        }
+        return null;
+    };
+    const readDisplay = selectors => {
+        for (const selector of selectors) {
+            for (const el of document.querySelectorAll(selector)) {
+                const value = (el.value || el.textContent || '').trim();
+                if (value) return value;
+            }
+        }
+        return null;
+    };
+    const finish = (ok, closed) => ({
+        ok, closed, steps, log,
+        checkIn: readDisplay(displaySelectors.checkIn),
+        checkOut: readDisplay(displaySelectors.checkOut),
+        elapsedMs: Math.round(performance.now() - started),
+    });
+
+    if (!firstVisible(calendarSelector)) {
+        const input = inputSelectors.map(firstVisible).find(Boolean);
+        if (!input) {
+            log.push('未找到入住日期输入框');
+            return finish(false, false);
+        }
+        input.focus();
+        input.click();
+        if (!await waitFor(() => firstVisible(calendarSelector), stepTimeoutMs * 2)) {
+            log.push('点击入住日期输入框后日历未显示');
+            return finish(false, false);
+        }
+    }
+
+    for (const date of dates) {
+        const panel = await showMonth(date.year * 12 + date.month);
+        if (!panel) {
+            log.push(`无法翻到${date.label}月份 ${date.year}年${date.month}月（已翻页 ${steps} 次）`);
+            return finish(false, false);
+        }
+        const cell = findDay(panel, date);
+        if (!cell) {
+            log.push(`${date.year}年${date.month}月中没有可选的 ${date.day} 日`);
+            return finish(false, false);
+        }
+        const before = panel.innerHTML;
+        cell.click();
+        // 等待选中状态渲染（或日历关闭）后再处理下一个日期
+        await waitFor(() => !panel.isConnected || panel.innerHTML !== before, stepTimeoutMs);
+    }
+    const closed = Boolean(await waitFor(() => !firstVisible(calendarSelector), closeTimeoutMs));
+    return finish(true, closed);
+}
+"""
+
+# 日期文本中带年份的写法: 2025-07-15 / 2025年7月15日 / 2025/07/15 / 2025.07.15
+DATE_YMD_PATTERN = re.compile(r'(?<!\d)(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})(?!\d)')
+# 年份在后的写法: 07/15/2025 或 15/07/2025 / 07.15.2025，月日顺序无法区分，两种都接受
+DATE_MDY_PATTERN = re.compile(r'(?<!\d)(\d{1,2})\s*[/.]\s*(\d{1,2})\s*[/.]\s*(\d{4})(?!\d)')
+# 不带年份的写法: 7月15日 / 07-15
+DATE_MD_PATTERN = re.compile(r'(?<!\d)(\d{1,2})\s*(?:月|-)\s*(\d{1,2})(?:日|(?!\d))')
+
+def date_text_matches(date_text, expected_date):
+    """
+    日期输入框/显示元素的文本是否对应expected_date（YYYY-MM-DD）
+
+    文本中找到的日期月、日必须与目标完全一致，带年份时年份也必须一致
+    """
+    if not date_text:
+        return False
+    expected = datetime.strptime(expected_date, "%Y-%m-%d")
+    year, month, day = expected.year, expected.month, expected.day
+    for match in DATE_YMD_PATTERN.finditer(date_text):
+        if tuple(int(g) for g in match.groups()) == (year, month, day):
+            return True
+    for match in DATE_MDY_PATTERN.finditer(date_text):
+        first, second, found_year = (int(g) for g in match.groups())
+        if found_year == year and (month, day) in ((first, second), (second, first)):
+            return True
+    # 带年份的日期已经检查过，去掉后再找不带年份的写法，避免其中的月日部分被当成不带年份的日期
+    rest = DATE_MDY_PATTERN.sub(" ", DATE_YMD_PATTERN.sub(" ", date_text))
+    for match in DATE_MD_PATTERN.finditer(rest):
+        if (int(match.group(1)), int(match.group(2))) == (month, day):
+            return True
+    return False
+
+async def set_dates_in_page(page, check_in_date, check_out_date, deadline=None):
+    """
+    用一次evaluate设置入住和离店日期并回读验证
+    
+    页面内翻页和等待日历关闭的超时收紧到deadline剩余的预算内。
+    返回两个日期是否都已选中且回读值与目标一致；返回False时由调用方回退到逐步操作日历
+    """
+    step_timeout = deadline.timeout(800, "设置日期") if deadline else 800
+    close_timeout = deadline.timeout(2000, "设置日期") if deadline else 2000
+    args = {
+        "dates": [
+            {"label": "入住", "year": check_in_date.year, "month": check_in_date.month, "day": check_in_date.day},
+            {"label": "离店", "year": check_out_date.year, "month": check_out_date.month, "day": check_out_date.day},
+        ],
+        "inputSelectors": DATE_INPUT_SELECTORS,
+        "calendarSelector": CALENDAR_SELECTOR,
+        "panelSelector": MONTH_PANEL_SELECTOR,
+        "titleSelector": MONTH_TITLE_SELECTOR,
+        "prevSelector": PREV_MONTH_SELECTOR,
+        "nextSelector": NEXT_MONTH_SELECTOR,
+        "cellSelectors": DAY_CELL_SELECTORS,
+        "displaySelectors": DATE_DISPLAY_SELECTORS,
+        "maxSteps": Config.CALENDAR_MAX_STEPS,
+        "stepTimeoutMs": step_timeout,
+        "closeTimeoutMs": close_timeout,
+    }
+    try:
+        result = await page.evaluate(calendar_engine_script, args)
+    except Exception as e:
+        log_step(f"日期引擎执行出错: {str(e)}", "警告")
+        return False
+    
+    for message in result["log"]:
+        log_step(f"日期引擎: {message}", "警告")
+    log_step(f"日期引擎: 翻页 {result['steps']} 次，页面内耗时 {result['elapsedMs']}ms，"
+             f"回读 入住 '{result['checkIn']}' / 离店 '{result['checkOut']}'", "信息")
+    if not result["ok"]:
+        return False
+    if not result["closed"]:
+        log_step("日期引擎: 选择离店日期后日历未关闭", "警告")
+    return (date_text_matches(result["checkIn"], check_in_date.strftime("%Y-%m-%d")) and
+            date_text_matches(result["checkOut"], check_out_date.strftime("%Y-%m-%d")))
 
 async def verify_date_selection(page, expected_date, date_type="入住"):
     """验证日期选择是否成功，返回是否符合预期"""
@@ -158,50 +1474,9 @@ async def verify_date_selection(page, expected_date, date_type="入住"):
         
         if date_value:
             log_step(f"通过JavaScript找到{date_type}日期显示: {date_value}", "信息")
-            
-            # 转换日期格式进行比较
-            expected_date_obj = datetime.strptime(expected_date, "%Y-%m-%d")
-            
-            # 检查日期文本中是否包含预期的日期部分
-            day = expected_date_obj.day
-            month = expected_date_obj.month
-            year = expected_date_obj.year
-            
-            day_str = str(day)
-            month_str = str(month)
-            year_str = str(year)
-            
-            # 检查各种可能的日期格式
-            if (day_str in date_value or 
-                f"{year}-{month:02d}-{day:02d}" in date_value or 
-                f"{day:02d}/{month:02d}/{year}" in date_value or
-                f"{month:02d}/{day:02d}/{year}" in date_value or
-                f"{year}年{month}月{day}日" in date_value or
-                f"{month}月{day}日" in date_value):
-                log_step(f"{date_type}日期验证成功: {date_value} 包含预期日期 {expected_date}", "成功", "符合预期")
+            if date_text_matches(date_value, expected_date):
+                log_step(f"{date_type}日期验证成功: {date_value} 对应预期日期 {expected_date}", "成功", "符合预期")
                 return True
-            
-            # 尝试按预定格式解析日期文本
-            try:
-                # 尝试多种日期格式
-                date_formats = [
-                    "%Y-%m-%d", "%Y年%m月%d日", "%m/%d/%Y", "%d/%m/%Y",
-                    "%Y.%m.%d", "%m.%d.%Y", "%m月%d日"
-                ]
-                
-                parsed_date = None
-                for fmt in date_formats:
-                    try:
-                        parsed_date = datetime.strptime(date_value, fmt)
-                        break
-                    except ValueError:
-                        continue
-                
-                if parsed_date and parsed_date.day == day and parsed_date.month == month and parsed_date.year == year:
-                    log_step(f"{date_type}日期验证成功: 解析 {date_value} 为 {parsed_date.strftime('%Y-%m-%d')}", "成功", "符合预期")
-                    return True
-            except Exception as e:
-                log_step(f"解析日期文本时出错: {str(e)}", "警告")
         
         # 如果JavaScript方法失败，回退到原始方法
         for selector in date_display_selectors:
@@ -211,27 +1486,8 @@ async def verify_date_selection(page, expected_date, date_type="入住"):
                     date_text = await element.get_attribute('value') or await element.text_content()
                     if date_text:
                         log_step(f"找到{date_type}日期显示元素: {selector}, 内容: {date_text}", "信息")
-                        
-                        # 转换日期格式进行比较
-                        expected_date_obj = datetime.strptime(expected_date, "%Y-%m-%d")
-                        
-                        # 检查日期文本中是否包含预期的日期部分
-                        day = expected_date_obj.day
-                        month = expected_date_obj.month
-                        year = expected_date_obj.year
-                        
-                        day_str = str(day)
-                        month_str = str(month)
-                        year_str = str(year)
-                        
-                        # 检查各种可能的日期格式
-                        if (day_str in date_text or 
-                            f"{year}-{month:02d}-{day:02d}" in date_text or 
-                            f"{day:02d}/{month:02d}/{year}" in date_text or
-                            f"{month:02d}/{day:02d}/{year}" in date_text or
-                            f"{year}年{month}月{day}日" in date_text or
-                            f"{month}月{day}日" in date_text):
-                            log_step(f"{date_type}日期验证成功: {date_text} 包含预期日期 {expected_date}", "成功", "符合预期")
+                        if date_text_matches(date_text, expected_date):
+                            log_step(f"{date_type}日期验证成功: {date_text} 对应预期日期 {expected_date}", "成功", "符合预期")
                             return True
             except Exception as e:
                 log_step(f"检查日期元素 {selector} 时出错: {str(e)}", "警告")
@@ -256,23 +1512,9 @@ async def verify_hotel_found(page, expected_hotel_name):
         # 检查方法1：页面标题
         hotel_title = await page.title()
         
-        # 检查方法2：查找页面上可能包含酒店名的元素
-        hotel_name_selectors = [
-            '.hotel-name', 'h1.name', '.hotel-title', '.detail-headline',
-            'div.name-wrap h1', '.hotelDetailTitle', '.e_title h1'
-        ]
-        
-        hotel_name_from_element = None
-        for selector in hotel_name_selectors:
-            try:
-                element = await page.query_selector(selector)
-                if element:
-                    name_text = await element.text_content()
-                    if name_text.strip():
-                        hotel_name_from_element = name_text.strip()
-                        break
-            except Exception:
-                continue
+        # 检查方法2：按schema中的选择器查找页面上可能包含酒店名的元素
+        detail_info = await run_schema_extractor(page, "hotel_detail") or {}
+        hotel_name_from_element = detail_info.get("酒店名称")
                 
         # 规范化名称进行比较（转小写并去除额外空格）
         expected_name_normalized = expected_hotel_name.lower().strip()
@@ -300,8 +1542,10 @@ async def verify_hotel_found(page, expected_hotel_name):
         return False
 
 # 创建新的方法用于设置日期
-async def set_date_parameters(page):
+async def set_date_parameters(page, deadline=None):
     """设置入住和离店日期"""
+    if deadline:
+        deadline.enter("设置日期", page)
     log_step("正在设置入住和离店日期...")
     
     try:
@@ -312,6 +1556,15 @@ async def set_date_parameters(page):
         log_step(f"目标入住日期: {check_in_date.strftime('%Y年%m月%d日')}", "信息")
         log_step(f"目标离店日期: {check_out_date.strftime('%Y年%m月%d日')}", "信息")
         
+        # 先用日期引擎一次evaluate完成选择和验证，失败时再逐步操作日历
+        date_start = time.perf_counter()
+        if await set_dates_in_page(page, check_in_date, check_out_date, deadline):
+            log_step(f"日期设置成功并已验证，耗时 {(time.perf_counter() - date_start) * 1000:.0f}ms", "成功", "符合预期")
+            return True
+        log_step("日期引擎未能完成设置，回退到逐步操作日历", "警告")
+        if deadline:
+            deadline.check("设置日期")
+        
         # 尝试截图保存页面状态
         if Config.DEBUG:
             await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}3_before_calendar.png")
@@ -329,37 +1582,37 @@ async def set_date_parameters(page):
         
         # 点击入住时间输入框显示日历
         calendar_activated = False
-        for selector in input_selectors:
+        input_candidates = iter_visible_selectors(page, input_selectors, "search_form", "check_in_input")
+        async for selector in input_candidates:
             try:
-                if await page.is_visible(selector, timeout=2000):
-                    log_step(f"找到入住时间输入框: {selector}", "成功", "符合预期")
-                    
-                    # 直接点击输入框
-                    await page.click(selector, timeout=5000)
-                    log_step(f"已点击入住时间输入框: {selector}", "成功", "符合预期")
-                    
-                    # 等待一段时间确保日历出现
-                    await page.wait_for_timeout(1500)
-                    
-                    # 检查日历是否显示 - 使用更多可能的选择器
-                    calendar_selectors = [
-                        '.c-calendar__body',
-                        '.m-calendar-box',
-                        '.c-calendar',
-                        'div[class*="calendar"]',
-                        'h3.c-calendar-month__title'
-                    ]
-                    
-                    for cal_selector in calendar_selectors:
-                        if await page.is_visible(cal_selector, timeout=1000):
-                            calendar_activated = True
-                            log_step(f"成功激活日历选择器: {cal_selector}", "成功", "符合预期")
-                            break
-                    
-                    if calendar_activated:
-                        break
-                    else:
-                        log_step(f"点击 {selector} 未显示日历，尝试下一个选择器", "警告")
+                log_step(f"找到入住时间输入框: {selector}", "成功", "符合预期")
+                
+                # 直接点击输入框
+                await page.click(selector, timeout=5000)
+                log_step(f"已点击入住时间输入框: {selector}", "成功", "符合预期")
+                
+                # 检查日历是否显示 - 使用更多可能的选择器
+                calendar_selectors = [
+                    '.c-calendar__body',
+                    '.m-calendar-box',
+                    '.c-calendar',
+                    'div[class*="calendar"]',
+                    'h3.c-calendar-month__title'
+                ]
+                
+                # 等待日历出现
+                await wait_until_ready(page, ", ".join(calendar_selectors), "日历", timeout=1500)
+                
+                cal_selector = await probe_selectors(page, calendar_selectors, "search_form", "calendar")
+                if cal_selector:
+                    calendar_activated = True
+                    log_step(f"成功激活日历选择器: {cal_selector}", "成功", "符合预期")
+                
+                if calendar_activated:
+                    input_candidates.succeeded(selector)
+                    break
+                else:
+                    log_step(f"点击 {selector} 未显示日历，尝试下一个选择器", "警告")
             except Exception as e:
                 log_step(f"点击输入框 {selector} 失败: {str(e)}", "警告")
                 continue
@@ -374,7 +1627,7 @@ async def set_date_parameters(page):
                     await page.click(label_selector, timeout=5000)
                     log_step("已点击入住时间标签", "成功", "符合预期")
                     
-                    await page.wait_for_timeout(1500)
+                    await wait_until_ready(page, '.c-calendar__body, .c-calendar-month__days', "日历", timeout=1500)
                     if await page.is_visible('.c-calendar__body, .c-calendar-month__days', timeout=2000):
                         calendar_activated = True
                         log_step("通过点击标签成功激活日历选择器", "成功", "符合预期")
@@ -401,8 +1654,8 @@ async def set_date_parameters(page):
         if Config.DEBUG:
             await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}3_checkin_selected.png")
         
-        # 等待一下确保入住日期被记录
-        await page.wait_for_timeout(1000)
+        # 等待入住日期被记录
+        await wait_until_ready(page, label="入住日期选择后的页面", timeout=1000)
         
         # 2. 选择离店日期
         check_out_selected = await select_date_in_calendar(page, check_out_date)
@@ -415,20 +1668,23 @@ async def set_date_parameters(page):
             await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}3_checkout_selected.png")
         
         # 等待日历自动关闭
-        await page.wait_for_timeout(2000)
+        await wait_until_ready(page, '.c-calendar__body, .c-calendar-month__days', "日历关闭", state="hidden", timeout=2000)
         
         # 日历选择完成后验证结果
         # 验证日期是否已正确设置
         date_verification = await verify_date_selection(page, Config.CHECK_IN_DATE, "入住")
         date_verification = await verify_date_selection(page, Config.CHECK_OUT_DATE, "退房") and date_verification
         
+        elapsed_ms = (time.perf_counter() - date_start) * 1000
         if date_verification:
-            log_step("日期设置成功并已验证", "成功", "符合预期")
+            log_step(f"日期设置成功并已验证，耗时 {elapsed_ms:.0f}ms（含日期引擎的尝试）", "成功", "符合预期")
             return True
         else:
-            log_step("日期设置可能不正确", "失败", "不符合预期")
+            log_step(f"日期设置可能不正确，耗时 {elapsed_ms:.0f}ms", "失败", "不符合预期")
             return False
             
+    except (PageBlockedError, DeadlineExceeded):
+        raise
     except Exception as e:
         log_step(f"设置日期时出错: {str(e)}", "失败", "不符合预期")
         return False
@@ -550,8 +1806,14 @@ async def select_date_in_calendar(page, target_date):
                         break
                     
                     # 点击前一月按钮
+                    panel_text = await page.evaluate(
+                        "s => { const el = document.querySelector(s); return el ? el.textContent : null; }",
+                        month_panel_selector
+                    )
                     await page.click(prev_month_btn)
-                    await page.wait_for_timeout(800)  # 等待面板更新
+                    # 等待月份面板内容变化
+                    await wait_until_ready(page, month_panel_selector, "月份面板", state="attached",
+                                           timeout=800, quiet_ms=100, changed_from=panel_text)
                     
                     # 检查是否已达到目标月份
                     updated_panels = await page.query_selector_all(month_panel_selector)
@@ -593,8 +1855,14 @@ async def select_date_in_calendar(page, target_date):
                         break
                     
                     # 点击后一月按钮
+                    panel_text = await page.evaluate(
+                        "s => { const el = document.querySelector(s); return el ? el.textContent : null; }",
+                        month_panel_selector
+                    )
                     await page.click(next_month_btn)
-                    await page.wait_for_timeout(800)  # 等待面板更新
+                    # 等待月份面板内容变化
+                    await wait_until_ready(page, month_panel_selector, "月份面板", state="attached",
+                                           timeout=800, quiet_ms=100, changed_from=panel_text)
                     
                     # 检查是否已达到目标月份
                     updated_panels = await page.query_selector_all(month_panel_selector)
@@ -826,7 +2094,7 @@ async def select_date_in_calendar(page, target_date):
             return False
         
         # 等待日期选择被处理
-        await page.wait_for_timeout(1000)
+        await wait_until_ready(page, label="日期选择后的页面", timeout=1000)
         return True
     except Exception as e:
         log_step(f"选择日期时出错: {str(e)}", "失败", "不符合预期")
@@ -836,8 +2104,10 @@ async def select_date_in_calendar(page, target_date):
         return False
 
 # 修改set_search_parameters方法，移除日期处理代码
-async def set_search_parameters(page):
+async def set_search_parameters(page, deadline=None):
     """设置搜索参数（目的地、日期）"""
+    if deadline:
+        deadline.enter("设置搜索参数", page)
     log_step("正在设置搜索参数...")
     
     try:
@@ -854,41 +2124,43 @@ async def set_search_parameters(page):
         ]
         
         destination_input_found = False
-        for selector in destination_selectors:
+        destination_candidates = iter_visible_selectors(page, destination_selectors, "search_form", "destination")
+        async for selector in destination_candidates:
             try:
-                if await page.is_visible(selector, timeout=2000):
-                    # 点击输入框激活
-                    await page.click(selector)
-                    await page.wait_for_timeout(500)
-                    
-                    # 清空输入框
-                    await page.fill(selector, '')
-                    await page.wait_for_timeout(500)
-                    
-                    # 输入目的地
-                    await page.fill(selector, Config.DESTINATION)
-                    log_step(f"已输入目的地: {Config.DESTINATION}", "成功", "符合预期")
-                    destination_input_found = True
-                    
-                    # 等待下拉菜单显示
-                    await page.wait_for_timeout(Config.DESTINATION_WAIT)
-                    
-                    # 尝试截图保存当前状态
-                    if Config.DEBUG:
-                        await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}2_destination_input.png")
-                    
-                    # 再次点击输入框以确认选择（根据用户截图显示的操作方式）
-                    await page.click(selector)
-                    log_step("已点击输入框确认目的地选择", "成功", "符合预期")
-                    
-                    # 等待选择后页面稳定
-                    await page.wait_for_timeout(1000)
-                    
-                    # 截图记录目的地设置结果
-                    if Config.DEBUG:
-                        await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}2_destination_set.png")
-                    
-                    break
+                # 点击输入框激活
+                await page.click(selector)
+                await wait_until_ready(page, label="目的地输入框激活后的页面", timeout=500, quiet_ms=100)
+                
+                # 清空输入框
+                await page.fill(selector, '')
+                await wait_until_ready(page, label="清空目的地后的页面", timeout=500, quiet_ms=100)
+                
+                # 输入目的地
+                await page.fill(selector, Config.DESTINATION)
+                log_step(f"已输入目的地: {Config.DESTINATION}", "成功", "符合预期")
+                destination_input_found = True
+                
+                # 等待下拉菜单显示
+                await wait_until_ready(page, Config.DESTINATION_DROPDOWN_SELECTOR, "目的地下拉菜单",
+                                       timeout=Config.DESTINATION_WAIT)
+                
+                # 尝试截图保存当前状态
+                if Config.DEBUG:
+                    await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}2_destination_input.png")
+                
+                # 再次点击输入框以确认选择（根据用户截图显示的操作方式）
+                await page.click(selector)
+                log_step("已点击输入框确认目的地选择", "成功", "符合预期")
+                
+                # 等待选择后页面稳定
+                await wait_until_ready(page, label="确认目的地后的页面", timeout=1000)
+                
+                # 截图记录目的地设置结果
+                if Config.DEBUG:
+                    await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}2_destination_set.png")
+                
+                destination_candidates.succeeded(selector)
+                break
             except Exception as e:
                 log_step(f"尝试设置目的地 {selector} 时遇到错误: {str(e)}", "警告")
                 continue
@@ -907,25 +2179,26 @@ async def set_search_parameters(page):
         ]
         
         hotel_name_set = False
-        for keyword_selector in keyword_selectors:
+        keyword_candidates = iter_visible_selectors(page, keyword_selectors, "search_form", "keyword")
+        async for keyword_selector in keyword_candidates:
             try:
-                if await page.is_visible(keyword_selector, timeout=2000):
-                    # 点击输入框激活
-                    await page.click(keyword_selector, timeout=5000)
-                    await page.wait_for_timeout(500)
-                    
-                    # 清空输入框
-                    await page.fill(keyword_selector, '')
-                    await page.wait_for_timeout(500)
-                    
-                    # 输入酒店名称
-                    await page.fill(keyword_selector, Config.HOTEL_NAME)
-                    log_step(f"已设置酒店名称: {Config.HOTEL_NAME}", "成功", "符合预期")
-                    hotel_name_set = True
-                    
-                    # 等待输入完成
-                    await page.wait_for_timeout(1000)
-                    break
+                # 点击输入框激活
+                await page.click(keyword_selector, timeout=5000)
+                await wait_until_ready(page, label="酒店名称输入框激活后的页面", timeout=500, quiet_ms=100)
+                
+                # 清空输入框
+                await page.fill(keyword_selector, '')
+                await wait_until_ready(page, label="清空酒店名称后的页面", timeout=500, quiet_ms=100)
+                
+                # 输入酒店名称
+                await page.fill(keyword_selector, Config.HOTEL_NAME)
+                log_step(f"已设置酒店名称: {Config.HOTEL_NAME}", "成功", "符合预期")
+                hotel_name_set = True
+                keyword_candidates.succeeded(keyword_selector)
+                
+                # 等待输入完成
+                await wait_until_ready(page, label="输入酒店名称后的页面", timeout=1000)
+                break
             except Exception as e:
                 log_step(f"尝试设置酒店名称 {keyword_selector} 时出错: {str(e)}", "警告")
                 continue
@@ -937,7 +2210,7 @@ async def set_search_parameters(page):
             await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}2_hotel_name_set.png")
         
         # 调用新方法设置日期
-        date_set_success = await set_date_parameters(page)
+        date_set_success = await set_date_parameters(page, deadline)
         if not date_set_success:
             log_step("设置日期失败，但尝试继续执行", "警告")
         
@@ -975,13 +2248,17 @@ async def set_search_parameters(page):
         else:
             log_step("无法验证目的地设置", "失败", "不符合预期")
             return False
+    except (PageBlockedError, DeadlineExceeded):
+        raise
     except Exception as e:
         log_step(f"设置搜索参数时出错: {str(e)}", "失败", "不符合预期")
         return False
 
 # 搜索酒店函数，使用JavaScript直接触发
-async def search_hotel(page):
+async def search_hotel(page, deadline=None):
     """执行酒店搜索"""
+    if deadline:
+        deadline.enter("搜索酒店", page)
     log_step("正在执行酒店搜索...")
     
     try:
@@ -1002,18 +2279,19 @@ async def search_hotel(page):
         ]
         
         search_btn_clicked = False
-        for selector in search_btn_selectors:
+        search_btn_candidates = iter_visible_selectors(page, search_btn_selectors, "search_form", "search_button")
+        async for selector in search_btn_candidates:
             try:
-                if await page.is_visible(selector, timeout=2000):
-                    # 记录搜索按钮文本
-                    btn_text = await page.text_content(selector)
-                    log_step(f"找到搜索按钮: {btn_text}", "成功", "符合预期")
-                    
-                    # 点击搜索按钮
-                    await page.click(selector)
-                    log_step("已点击搜索按钮", "成功", "符合预期")
-                    search_btn_clicked = True
-                    break
+                # 记录搜索按钮文本
+                btn_text = await page.text_content(selector)
+                log_step(f"找到搜索按钮: {btn_text}", "成功", "符合预期")
+                
+                # 点击搜索按钮
+                await page.click(selector)
+                log_step("已点击搜索按钮", "成功", "符合预期")
+                search_btn_clicked = True
+                search_btn_candidates.succeeded(selector)
+                break
             except Exception as e:
                 log_step(f"尝试点击搜索按钮 {selector} 时出错: {str(e)}", "警告")
                 continue
@@ -1088,7 +2366,8 @@ async def search_hotel(page):
         
         # 等待页面加载
         try:
-            await page.wait_for_load_state("networkidle", timeout=Config.TIMEOUT)
+            with TimedWait("search_results_load", Config.TIMEOUT, deadline) as wait:
+                await page.wait_for_load_state("networkidle", timeout=wait.timeout)
             log_step("搜索结果页面已加载", "成功", "符合预期")
             
             # 验证搜索结果页面状态
@@ -1114,16 +2393,22 @@ async def search_hotel(page):
             else:
                 log_step("页面已加载，但可能不是搜索结果页面", "失败", "不符合预期")
                 return False
+        except (PageBlockedError, DeadlineExceeded):
+            raise
         except Exception as e:
             log_step(f"等待搜索结果页面加载超时: {str(e)}", "失败", "不符合预期")
             return False
+    except (PageBlockedError, DeadlineExceeded):
+        raise
     except Exception as e:
         log_step(f"执行搜索时出错: {str(e)}", "失败", "不符合预期")
         return False
 
 # 在搜索结果中查找匹配的酒店
-async def find_target_hotel(page):
+async def find_target_hotel(page, deadline=None):
     """在搜索结果中查找目标酒店"""
+    if deadline:
+        deadline.enter("查找目标酒店", page)
     log_step(f"正在搜索结果中查找目标酒店: {Config.HOTEL_NAME}...")
     
     # 先尝试查找下拉菜单中是否有完全匹配的结果
@@ -1224,7 +2509,8 @@ async def find_target_hotel(page):
             log_step(f"在下拉选项中找到匹配: {dropdown_result.get('text')}", "成功", "符合预期")
             if dropdown_result.get('clicked'):
                 log_step("已点击下拉选项", "成功", "符合预期")
-                await page.wait_for_load_state("networkidle")
+                with TimedWait("hotel_dropdown_load", Config.TIMEOUT, deadline) as wait:
+                    await page.wait_for_load_state("networkidle", timeout=wait.timeout)
                 
                 if Config.DEBUG:
                     await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}5_1_dropdown_clicked.png")
@@ -1246,14 +2532,18 @@ async def find_target_hotel(page):
                 log_step(f"酒店URL: {results['url']}", "成功", "符合预期")
                 # 如果找到了URL，可以直接访问
                 try:
-                    await page.goto(results['url'], timeout=Config.TIMEOUT)
-                    await page.wait_for_load_state("networkidle")
+                    with TimedWait("search_results_goto", Config.TIMEOUT, deadline) as wait:
+                        await page.goto(results['url'], timeout=wait.timeout)
+                    with TimedWait("search_results_goto_load", Config.TIMEOUT, deadline) as wait:
+                        await page.wait_for_load_state("networkidle", timeout=wait.timeout)
                     log_step("已跳转到酒店详情页", "成功", "符合预期")
                     
                     if Config.DEBUG:
                         await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}6_hotel_details.png")
                         
                     return True
+                except (PageBlockedError, DeadlineExceeded):
+                    raise
                 except Exception as e:
                     log_step(f"跳转到酒店详情页失败: {str(e)}", "失败", "不符合预期")
             else:
@@ -1294,20 +2584,25 @@ async def find_target_hotel(page):
                     if suggestion_results['clicked']:
                         log_step("已点击搜索建议", "成功", "符合预期")
                         # 等待页面跳转和加载
-                        await page.wait_for_load_state("networkidle")
+                        with TimedWait("hotel_suggestion_load", Config.TIMEOUT, deadline) as wait:
+                            await page.wait_for_load_state("networkidle", timeout=wait.timeout)
                         
                         if Config.DEBUG:
                             await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}6_after_suggestion.png")
                             
-                        return await find_target_hotel(page)  # 递归调用检查结果
+                        return await find_target_hotel(page, deadline)  # 递归调用检查结果
                     else:
                         log_step(f"点击搜索建议失败: {suggestion_results.get('error', '未知错误')}", "失败", "不符合预期")
                 else:
                     log_step("未找到匹配的搜索建议", "失败", "不符合预期")
+            except (PageBlockedError, DeadlineExceeded):
+                raise
             except Exception as e:
                 log_step(f"处理搜索建议时出错: {str(e)}", "失败", "不符合预期")
         
         return False
+    except (PageBlockedError, DeadlineExceeded):
+        raise
     except Exception as e:
         log_step(f"查找目标酒店时出错: {str(e)}", "失败", "不符合预期")
         return False
@@ -1401,24 +2696,252 @@ room_info_script = """
 }
 """
 
+# 一次遍历收集房型卡片及报价上的data-exposure/data-test-id/data-saleroom-key，
+# 结构与roomlist_parser.parse_room_metadata一致，由merge_room_metadata按卡片序号和报价序号合并进房型记录。
+# 参数为schema中room_list的room/offer选择器
+room_metadata_script = """
+([roomSelector, offerSelector]) => {
+    const cards = Array.from(document.querySelectorAll(roomSelector));
+    const cardIndex = new Map(cards.map((card, i) => [card, i]));
+    const offerIndex = new Map();
+    for (const card of cards) {
+        card.querySelectorAll(offerSelector).forEach((offer, j) => offerIndex.set(offer, j));
+    }
+    const metadata = cards.map((card, i) => ({index: i, exposures: [], test_ids: [], offers: []}));
+    const offerSlots = new Map();
+    
+    for (const node of document.querySelectorAll('[data-exposure], [data-test-id], [data-saleroom-key]')) {
+        const card = node.closest(roomSelector);
+        if (!card || !cardIndex.has(card)) continue;
+        let offer = node.closest(offerSelector);
+        if (offer && !offerIndex.has(offer)) offer = null;
+        let keyed = node.closest('[data-saleroom-key]');
+        if (keyed && !card.contains(keyed)) keyed = null;
+        let saleBox = node.closest('[class*="saleRoomItemBox"]');
+        if (saleBox && !card.contains(saleBox)) saleBox = null;
+        // 折叠隐藏的报价（带data-saleroom-key但不是报价卡片，或在报价区块内却不属于任何报价卡片）
+        // 不在房型记录中，跳过其元数据
+        if ((keyed && !offerIndex.has(keyed)) || (!offer && saleBox)) continue;
+        
+        let entry = metadata[cardIndex.get(card)];
+        if (offer) {
+            if (!offerSlots.has(offer)) {
+                const slot = {
+                    index: offerIndex.get(offer),
+                    key: offer.getAttribute('data-saleroom-key') || '',
+                    exposures: [],
+                    test_ids: []
+                };
+                offerSlots.set(offer, slot);
+                entry.offers.push(slot);
+            }
+            entry = offerSlots.get(offer);
+        }
+        const exposure = node.getAttribute('data-exposure');
+        if (exposure) entry.exposures.push(exposure);
+        const testId = node.getAttribute('data-test-id');
+        if (testId) entry.test_ids.push(testId);
+    }
+    return metadata;
+}
+"""
+
+# ==================== 列表页直达 ====================
+
+city_id_cache = CityIdCache(Config.CITY_ID_CACHE_FILE) if Config.CITY_ID_CACHE_FILE else None
+
+# 列表页URL中可能携带城市ID的查询参数
+CITY_ID_PARAMS = ("city", "cityId")
+
+def resolve_city_id(destination):
+    """返回目的地的城市ID：Config.CITY_IDS优先，其次是缓存，都没有时返回None"""
+    key = CityIdCache.normalize(destination)
+    for name, city_id in Config.CITY_IDS.items():
+        if CityIdCache.normalize(name) == key:
+            return city_id
+    return city_id_cache.get(destination) if city_id_cache else None
+
+def build_hotel_list_url(city_id):
+    """由城市ID、入住/退房日期和酒店名称构造酒店列表页URL"""
+    params = {
+        "city": city_id,
+        "checkin": Config.CHECK_IN_DATE.replace("-", "/"),
+        "checkout": Config.CHECK_OUT_DATE.replace("-", "/"),
+        "keyword": Config.HOTEL_NAME,
+        **Config.LIST_URL_EXTRA_PARAMS,
+    }
+    return f"{Config.LIST_URL_BASE}?{urllib.parse.urlencode(params, safe='/')}"
+
+def learn_city_id(url, destination):
+    """从表单搜索跳转后的列表页URL中读取城市ID并写入缓存，返回城市ID或None"""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    for name in CITY_ID_PARAMS:
+        value = query.get(name, [""])[0]
+        if value.isdigit() and int(value) > 0:
+            if city_id_cache:
+                city_id_cache.put(destination, int(value), "form_url")
+            log_step(f"从列表页URL学到目的地 '{destination}' 的城市ID: {value}", "成功")
+            return int(value)
+    log_step(f"列表页URL中没有城市ID: {url}", "警告")
+    return None
+
+async def open_hotel_list_directly(page, deadline=None):
+    """
+    跳过首页表单，直接打开酒店列表页
+    
+    返回列表页是否已就绪；没有城市ID、打开失败或列表页预检未通过时返回False，
+    由调用方回到首页表单搜索。预检未通过时丢弃缓存的城市ID，下一次表单搜索会重新学习
+    """
+    city_id = resolve_city_id(Config.DESTINATION)
+    if city_id is None:
+        log_step(f"目的地 '{Config.DESTINATION}' 还没有城市ID，使用首页表单搜索", "信息")
+        return False
+    if deadline:
+        deadline.enter("直接打开列表页", page)
+    
+    url = build_hotel_list_url(city_id)
+    log_step(f"直接打开酒店列表页: {url}", "信息")
+    try:
+        with TimedWait("list_url_goto", Config.TIMEOUT, deadline) as wait:
+            await page.goto(url, timeout=wait.timeout)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        log_step(f"打开酒店列表页失败: {str(e)}，回到首页表单", "警告")
+        return False
+    
+    if await preflight_page(page, "hotel_list", deadline) != "ok":
+        if city_id_cache:
+            city_id_cache.forget(Config.DESTINATION)
+        log_step(f"城市ID {city_id} 打开的页面不是酒店列表，回到首页表单", "警告")
+        return False
+    return True
+
+def report_search_time(direct, elapsed_ms):
+    """记录表单搜索的耗时；直接打开列表页时输出相对表单搜索节省的时间"""
+    if not city_id_cache:
+        return
+    if not direct:
+        city_id_cache.record_form_time(Config.DESTINATION, elapsed_ms)
+        log_step(f"表单搜索耗时 {elapsed_ms:.0f}ms", "信息")
+        return
+    form_ms = city_id_cache.form_time_ms(Config.DESTINATION)
+    if form_ms:
+        log_step(f"直接打开列表页耗时 {elapsed_ms:.0f}ms，表单搜索平均 {form_ms:.0f}ms，"
+                 f"本次节省约 {form_ms - elapsed_ms:.0f}ms", "成功")
+    else:
+        log_step(f"直接打开列表页耗时 {elapsed_ms:.0f}ms（还没有表单搜索的耗时记录）", "信息")
+
+def save_city_id_cache():
+    """保存城市ID缓存"""
+    if not city_id_cache:
+        return
+    try:
+        city_id_cache.save()
+    except OSError as e:
+        log_step(f"保存城市ID缓存失败: {str(e)}", "警告")
+
+# ==================== 酒店ID缓存 ====================
+
+hotel_id_cache = HotelIdCache(Config.HOTEL_ID_CACHE_FILE, Config.HOTEL_ID_TTL_DAYS) if Config.HOTEL_ID_CACHE_FILE else None
+
+# 详情页URL中的hotelId：?hotelId=123、/hotels/123.html、trip.com的hotel-detail-123
+HOTEL_ID_URL_PATTERNS = [
+    re.compile(r"[?&]hotelId=(\d+)", re.IGNORECASE),
+    re.compile(r"/hotels/(\d+)\.html"),
+    re.compile(r"hotel-detail-(\d+)"),
+]
+# 详情页URL中的入住/退房日期参数
+DETAIL_DATE_PARAMS = ("checkIn", "checkOut")
+
+def parse_hotel_id(url):
+    """从详情页URL中解析hotelId，解析不到时返回None"""
+    for pattern in HOTEL_ID_URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
+def with_stay_dates(url):
+    """把详情页URL中的入住/退房日期替换为本次任务的日期"""
+    parts = urllib.parse.urlsplit(url)
+    query = [(key, value) for key, value in urllib.parse.parse_qsl(parts.query) if key not in DETAIL_DATE_PARAMS]
+    query += list(zip(DETAIL_DATE_PARAMS, (Config.CHECK_IN_DATE, Config.CHECK_OUT_DATE)))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+def lookup_cached_hotel():
+    """查询目标酒店的缓存记录，未命中或已过期时返回None"""
+    if not hotel_id_cache:
+        return None
+    entry = hotel_id_cache.get(Config.HOTEL_NAME, Config.DESTINATION)
+    if entry:
+        log_step(f"酒店ID缓存命中: {Config.HOTEL_NAME} -> hotelId {entry['hotel_id']}"
+                 f"（来源 {entry['source']}，此前命中 {entry['hits']} 次）", "成功")
+    else:
+        log_step(f"酒店ID缓存未命中: {Config.HOTEL_NAME}", "信息")
+    return entry
+
+async def open_cached_hotel_detail(page, entry, deadline=None):
+    """
+    直接打开缓存的详情页，跳过搜索和列表阶段
+    
+    打开后用verify_hotel_found确认是目标酒店，通过时返回page，否则返回None。
+    验证不通过的记录会被删除；导航出错时保留记录，下次再试
+    """
+    if deadline:
+        deadline.enter("打开缓存的详情页", page)
+    url = with_stay_dates(entry["detail_url"])
+    try:
+        with TimedWait("cached_detail_goto", Config.TIMEOUT, deadline) as wait:
+            await page.goto(url, timeout=wait.timeout)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        log_step(f"打开缓存的详情页失败: {str(e)}，回到搜索流程", "警告")
+        return None
+    
+    if await preflight_page(page, "hotel_detail", deadline) == "ok" and await verify_hotel_found(page, Config.HOTEL_NAME):
+        hotel_id_cache.mark_verified(Config.HOTEL_NAME, Config.DESTINATION)
+        log_step(f"已通过缓存直接进入详情页: {url}", "成功")
+        return page
+    hotel_id_cache.invalidate(Config.HOTEL_NAME, Config.DESTINATION)
+    log_step(f"缓存的详情页不是目标酒店，已删除hotelId {entry['hotel_id']}，回到搜索流程", "警告")
+    return None
+
+async def remember_hotel_detail(detail_page, source):
+    """详情页通过verify_hotel_found验证后记录hotelId和URL，下次任务直接打开"""
+    if not hotel_id_cache:
+        return
+    hotel_id = parse_hotel_id(detail_page.url)
+    if not hotel_id:
+        log_step(f"详情页URL中没有hotelId，不写入缓存: {detail_page.url}", "信息")
+        return
+    if not await verify_hotel_found(detail_page, Config.HOTEL_NAME):
+        return
+    hotel_id_cache.put(Config.HOTEL_NAME, Config.DESTINATION, hotel_id, detail_page.url, source)
+    log_step(f"已缓存 {Config.HOTEL_NAME} 的hotelId {hotel_id}（来源 {source}）", "成功")
+
 # ==================== 第二部分：酒店列表页处理 ====================
 
-async def extract_hotel_list_info(page):
+async def extract_hotel_list_info(page, deadline=None):
     """提取酒店列表页中的酒店信息"""
+    if deadline:
+        deadline.enter("提取酒店列表", page)
     log_step("开始提取酒店列表页信息")
     
     # 仅在需要保存临时文件时保存截图
     if Config.SAVE_TEMP_FILES:
         await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}hotel_list_page.png")
     
-    # 固定等待10秒，确保页面完全加载
-    log_step("等待10秒，确保页面完全加载")
-    await page.wait_for_timeout(10000)
+    # 等待列表项出现并且列表渲染稳定，最多10秒
+    await wait_until_ready(page, schema_locator("hotel_list", "list_item"), "酒店列表", timeout=10000, quiet_ms=500,
+                           deadline=deadline)
     
     # 等待酒店列表加载 - 使用更精确的选择器
     try:
         # 首先等待list-item-target元素出现
-        await page.wait_for_selector('li.list-item-target, li[class*="list-item-target"]', timeout=Config.TIMEOUT)
+        with TimedWait("hotel_list_items", Config.TIMEOUT, deadline) as wait:
+            await page.wait_for_selector(schema_locator("hotel_list", "list_item"), timeout=wait.timeout)
         log_step("酒店列表项已加载", "成功")
     except Exception as e:
         log_step(f"等待酒店列表加载失败: {str(e)}", "失败")
@@ -1430,74 +2953,53 @@ async def extract_hotel_list_info(page):
             log_step("已保存列表页源码到hotel_list_page.html", "信息")
         return [], None
     
-    # 查找所有酒店列表项
-    list_items = await page.query_selector_all('li.list-item-target, li[class*="list-item-target"]')
+    # 查找所有酒店列表项；使用Locator，不在渲染进程中保留句柄
+    list_items = page.locator(schema_locator("hotel_list", "list_item"))
+    item_count = await list_items.count()
     
-    if not list_items or len(list_items) == 0:
+    if item_count == 0:
         log_step("未找到酒店列表项", "失败")
         return [], None
     
-    log_step(f"找到 {len(list_items)} 个酒店列表项", "成功")
+    log_step(f"找到 {item_count} 个酒店列表项", "成功")
     
     # 选择第一个列表项作为目标酒店（根据要求）
-    target_item = list_items[0]
+    target_item = list_items.first
     log_step("选择第一个列表项作为目标酒店", "成功")
     
     # 在目标列表项内查找酒店卡片
-    hotel_card = await target_item.query_selector('div.hotel-card, div[class*="hotel-card"]')
+    hotel_card = target_item.locator(schema_locator("hotel_list", "card")).first
     
-    if not hotel_card:
+    if await hotel_card.count() == 0:
         log_step("在目标列表项中未找到酒店卡片", "失败")
         return [], None
     
-    # 提取酒店信息
+    # 提取酒店信息：schema编译出的提取函数在卡片上一次evaluate取回所有字段
     try:
-        # 1. 提取酒店名称
-        name_el = await hotel_card.query_selector('.name-text, [class*="name"], h2, .title')
-        hotel_name = await name_el.text_content() if name_el else "未知酒店"
-        
-        # 2. 提取酒店价格
-        price_el = await hotel_card.query_selector('.price .ave-price-num, [class*="price"], .room-price')
-        price = await price_el.text_content() if price_el else "价格未知"
-        
-        # 3. 提取酒店评分
-        score_el = await hotel_card.query_selector('.score-info .score-value, [class*="score"], .rating')
-        score = await score_el.text_content() if score_el else "评分未知"
-        
-        # 4. 提取hotelName和subtitle
-        hotel_name_el = await hotel_card.query_selector('span.hotelName, [class*="hotelName"]')
-        subtitle_el = await hotel_card.query_selector('div.hotel-subtitle, [class*="hotel-subtitle"]')
+        card_info = await run_schema_extractor(hotel_card, "hotel_list")
+        if card_info is None:
+            log_step("酒店卡片字段提取失败", "失败")
+            return [], None
         
-        if hotel_name_el:
-            hotel_name_text = await hotel_name_el.text_content()
-            log_step(f"酒店名称(hotelName): {hotel_name_text}", "信息")
-        
-        if subtitle_el:
-            subtitle_text = await subtitle_el.text_content()
-            log_step(f"酒店副标题(subtitle): {subtitle_text}", "信息")
-        
-        # 5. 提取hotel-head信息
-        head_el = await hotel_card.query_selector('div.hotel-head, div[class*="hotel-head"]')
-        hotel_head_info = await head_el.evaluate('el => el.outerHTML') if head_el else ""
-        
-        # 6. 提取room-info信息
-        room_info_el = await hotel_card.query_selector('div.room-info, div[class*="room-info"]')
-        room_info = await room_info_el.evaluate('el => el.outerHTML') if room_info_el else ""
+        hotel_head_info = card_info.get("hotel_head", "")
+        room_info = card_info.get("room_info", "")
         
         # 构建酒店信息对象
         hotel_info = {
-            "名称": hotel_name.strip(),
-            "价格": price.strip(),
-            "评分": score.strip(),
+            "名称": card_info.get("名称", "未知酒店"),
+            "价格": card_info.get("价格", "价格未知"),
+            "评分": card_info.get("评分", "评分未知"),
             "is_target": True  # 标记为目标酒店
         }
         
         # 如果提取到hotelName和subtitle，添加到信息对象中
-        if hotel_name_el:
-            hotel_info["hotelName"] = hotel_name_text.strip()
+        if "hotelName" in card_info:
+            log_step(f"酒店名称(hotelName): {card_info['hotelName']}", "信息")
+            hotel_info["hotelName"] = card_info["hotelName"]
         
-        if subtitle_el:
-            hotel_info["subtitle"] = subtitle_text.strip()
+        if "subtitle" in card_info:
+            log_step(f"酒店副标题(subtitle): {card_info['subtitle']}", "信息")
+            hotel_info["subtitle"] = card_info["subtitle"]
         
         # 仅在需要保存临时文件时保存HTML内容
         if Config.SAVE_TEMP_FILES:
@@ -1520,26 +3022,19 @@ async def extract_hotel_list_info(page):
         traceback.print_exc()
         return [], None
 
-async def enter_hotel_detail(page, target_hotel_card):
-    """点击酒店卡片中的查看详情按钮进入详情页"""
-    if not target_hotel_card:
-        log_step("未指定目标酒店卡片，无法进入详情页", "失败")
-        return None
-    
-    log_step("准备点击进入酒店详情页")
-    
-    # 精确查找"查看详情"按钮
+async def find_view_button(target_hotel_card):
+    """在酒店卡片中查找"查看详情"按钮，找不到时返回卡片本身"""
     try:
         # 1. 尝试查找book-btn容器
-        book_wrap = await target_hotel_card.query_selector('div.book-wrap, div[class*="book-wrap"]')
-        if not book_wrap:
+        book_wrap = target_hotel_card.locator('div.book-wrap, div[class*="book-wrap"]').first
+        if await book_wrap.count() == 0:
             log_step("未找到book-wrap容器", "警告")
             book_wrap = target_hotel_card  # 如果没找到，就在整个卡片中查找
         
         # 2. 在容器中查找查看详情按钮
-        view_button = await book_wrap.query_selector('span.btn-txt, span[class*="btn-txt"], .book-btn')
+        view_button = book_wrap.locator('span.btn-txt, span[class*="btn-txt"], .book-btn').first
         
-        if view_button:
+        if await view_button.count() > 0:
             btn_text = await view_button.text_content()
             log_step(f"找到按钮文本: {btn_text}", "成功")
             if "查看详情" in btn_text or "详情" in btn_text:
@@ -1548,144 +3043,258 @@ async def enter_hotel_detail(page, target_hotel_card):
                 log_step(f"按钮文本不是查看详情: {btn_text}", "警告")
         else:
             log_step("未找到明确的查看详情按钮，将尝试其他按钮", "警告")
-            view_button = await book_wrap.query_selector('button, a[class*="btn"]')
+            view_button = book_wrap.locator('button, a[class*="btn"]').first
         
-        if not view_button:
+        if await view_button.count() == 0:
             log_step("未找到任何可点击的按钮", "失败")
             # 尝试点击整个卡片
             view_button = target_hotel_card
     except Exception as e:
         log_step(f"查找查看详情按钮时出错: {str(e)}", "警告")
         view_button = target_hotel_card  # 出错时尝试点击整个卡片
+    return view_button
+
+async def wait_detail_room_list(detail_page, name, race, deadline=None):
+    """等待详情页显示房型列表，预检不通过或不是目标酒店时返回None"""
+    with TimedWait(f"detail_{name}_domcontentloaded", Config.TIMEOUT, race) as wait:
+        await detail_page.wait_for_load_state('domcontentloaded', timeout=wait.timeout)
+    if await preflight_page(detail_page, "hotel_detail", deadline) != "ok":
+        log_step(f"{name}: 详情页结构与schema不符", "警告")
+        return None
+    with TimedWait(f"detail_{name}_room_list", Config.DETAIL_ENTRY_BUDGET, race) as wait:
+        await detail_page.wait_for_selector(schema_locator("room_list", "ready"), timeout=wait.timeout)
+    return await verified_detail_page(detail_page, name)
+
+async def verified_detail_page(detail_page, name):
+    """详情页是Config.HOTEL_NAME对应的酒店时返回该页面，否则返回None，不计为获胜"""
+    if await verify_hotel_found(detail_page, Config.HOTEL_NAME):
+        return detail_page
+    log_step(f"{name}: 详情页不是目标酒店 {Config.HOTEL_NAME}", "警告")
+    return None
+
+async def race_detail_entries(strategies, race):
+    """
+    并发运行各进入方式，返回 (获胜方式, 详情页)；都失败或预算用完时详情页为None
     
-    # 仅在需要保存临时文件时保存截图
-    if Config.SAVE_TEMP_FILES:
-        await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}before_click_detail.png")
-    
-    # 确保按钮可见和可点击
+    strategies为 {名称: 协程}，协程返回显示出房型列表的页面或None。获胜后取消其余方式；
+    没有获胜者且有方式遇到拦截时抛出该PageBlockedError。各方式因race预算不足抛出的DeadlineExceeded
+    按普通失败处理，任务级的预算由调用方检查
+    """
+    tasks = {asyncio.ensure_future(coro): name for name, coro in strategies.items()}
+    pending = set(tasks)
+    blocked = None
     try:
-        if view_button:
-            await view_button.scroll_into_view_if_needed()
-            log_step("已将按钮滚动到可见区域", "成功")
-    except Exception:
-        log_step("无法滚动到按钮位置，继续尝试点击", "警告")
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=race.remaining_s(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                log_step(f"进入详情页的预算 {race.budget_s:.1f}s 已用完", "警告")
+                break
+            for task in done:
+                name = tasks[task]
+                error = task.exception()
+                if isinstance(error, PageBlockedError):
+                    blocked = blocked or error
+                elif error:
+                    log_step(f"{name}: 未能进入详情页: {str(error)}", "警告")
+                elif task.result():
+                    log_step(f"{name} 最先显示房型列表，耗时 {race.elapsed_s() * 1000:.0f}ms", "成功")
+                    return name, task.result()
+                else:
+                    log_step(f"{name}: 未能进入详情页", "警告")
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    if blocked:
+        raise blocked
+    return None, None
+
+async def enter_hotel_detail(page, target_hotel_card, deadline=None):
+    """
+    进入酒店详情页，返回 (详情页, 获胜的方式)，所有方式都失败时详情页为None
+    
+    点击target_hotel_card（extract_hotel_list_info返回的Locator）中的查看详情按钮后，
+    同时等待新标签页、当前页跳转，并按Config.DETAIL_KNOWN_URL_DELAY错开直接打开Config.KNOWN_HOTEL_URLS中的每个URL。
+    所有方式共用Config.DETAIL_ENTRY_BUDGET的预算，最先显示出房型列表并通过verify_hotel_found验证的一方获胜，
+    其余方式被取消并关闭它们打开的标签页。没有目标酒店卡片时立即打开所有已知URL
+    """
+    context = page.context
+    if deadline:
+        deadline.enter("进入详情页", page)
+    budget_ms = deadline.timeout(Config.DETAIL_ENTRY_BUDGET, "进入详情页") if deadline else Config.DETAIL_ENTRY_BUDGET
+    race = Deadline(budget_ms / 1000)
+    pages_before = set(context.pages)
+    
+    # 点击打开的新标签页通过popup事件获得，不会与已知URL打开的标签页混淆
+    popup = asyncio.get_running_loop().create_future()
+    def on_popup(new_page):
+        if not popup.done():
+            popup.set_result(new_page)
+    page.on("popup", on_popup)
     
-    # 使用expect_page等待新页面打开
+    async def via_new_tab():
+        detail_page = await popup
+        log_step("检测到新打开的详情页面", "成功")
+        if deadline:
+            deadline.limit(detail_page, "进入详情页")
+        return await wait_detail_room_list(detail_page, "new_tab", race, deadline)
+    
+    async def via_same_tab():
+        # 页面级的等待在跳转后继续生效
+        with TimedWait("detail_same_tab_room_list", Config.DETAIL_ENTRY_BUDGET, race) as wait:
+            await page.wait_for_selector(schema_locator("room_list", "ready"), timeout=wait.timeout)
+        return await verified_detail_page(page, "same_tab")
+    
+    async def via_known_url(url, delay_ms):
+        await asyncio.sleep(delay_ms / 1000)
+        known_page = await context.new_page()
+        if deadline:
+            deadline.limit(known_page, "进入详情页")
+        with TimedWait("known_url_goto", Config.TIMEOUT, race) as wait:
+            await known_page.goto(url, timeout=wait.timeout)
+        return await wait_detail_room_list(known_page, "known_url", race, deadline)
+    
+    strategies = {}
+    detail_page = None
     try:
-        async with page.context.expect_page(timeout=20000) as new_page_info:
-            if view_button:
-                # 在点击之前再次确认按钮状态
-                is_visible = await view_button.is_visible()
-                log_step(f"按钮可见状态: {is_visible}", "信息")
-                
-                # 执行点击
+        if target_hotel_card:
+            log_step("准备点击进入酒店详情页")
+            view_button = await find_view_button(target_hotel_card)
+            
+            # 仅在需要保存临时文件时保存截图
+            if Config.SAVE_TEMP_FILES:
+                await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}before_click_detail.png")
+            try:
+                await view_button.scroll_into_view_if_needed()
                 await view_button.click()
                 log_step(f"已点击{'查看详情按钮' if view_button != target_hotel_card else '酒店卡片'}", "成功")
-            else:
-                log_step("未找到可点击元素，尝试点击整个酒店卡片", "警告")
-                await target_hotel_card.click()
-        
-        # 获取新打开的页面
-        detail_page = await new_page_info.value
-        log_step("成功检测到新打开的详情页面", "成功")
-        
-        # 等待详情页加载
-        await detail_page.wait_for_load_state('networkidle', timeout=Config.TIMEOUT)
-        log_step("酒店详情页加载完成", "成功")
-        
-        # 仅在需要保存临时文件时保存截图
-        if Config.SAVE_TEMP_FILES:
-            await detail_page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}hotel_detail_page.png")
-        
-        return detail_page
-    except Exception as e:
-        log_step(f"等待新页面打开失败: {str(e)}", "警告")
-        
-        # 仅在需要保存临时文件时保存截图
-        if Config.SAVE_TEMP_FILES:
-            await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}after_click_detail.png")
-        
-        # 备选方案1: 尝试从现有页面列表中获取新页面
-        await asyncio.sleep(5)  # 多等待几秒
-        pages = page.context.pages
-        if len(pages) > 1:
-            log_step("从现有页面列表中找到新页面", "成功")
-            detail_page = pages[-1]  # 假设最后一个是新打开的
-            try:
-                await detail_page.wait_for_load_state('networkidle', timeout=Config.TIMEOUT)
-                if Config.SAVE_TEMP_FILES:
-                    await detail_page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}hotel_detail_page_alt.png")
-                return detail_page
-            except Exception as page_err:
-                log_step(f"新页面加载失败: {str(page_err)}", "警告")
-        
-        # 备选方案2: 检查当前页面是否已变为详情页
-        try:
-            await page.wait_for_selector('.detail-headline, div.mainRoomList__UlISo, div.commonRoomCard__BpNjl', timeout=10000)
-            log_step("当前页面已变为酒店详情页", "成功")
-            if Config.SAVE_TEMP_FILES:
-                await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}hotel_detail_current_page.png")
-            return page
-        except Exception:
-            log_step("当前页面未变为详情页", "失败")
+                strategies["新标签页"] = via_new_tab()
+                strategies["当前页跳转"] = via_same_tab()
+            except Exception as e:
+                log_step(f"点击查看详情失败: {str(e)}，只尝试已知URL", "警告")
+        else:
+            log_step("未指定目标酒店卡片，只尝试已知URL", "警告")
         
-        # 所有尝试失败
-        log_step("无法进入酒店详情页，尝试最后的备选方案", "警告")
+        # 有点击进入的方式时已知URL错开启动，只剩已知URL时立即开始
+        stagger_ms = Config.DETAIL_KNOWN_URL_DELAY if strategies else 0
+        for i, url in enumerate(Config.KNOWN_HOTEL_URLS):
+            strategies[f"已知URL{i + 1}"] = via_known_url(url, stagger_ms * (i + 1))
         
-        # 备选方案3: 使用已知URL直接打开酒店详情页
-        for url in Config.KNOWN_HOTEL_URLS:
-            try:
-                log_step(f"尝试直接访问已知URL: {url}", "信息")
-                # 在当前页打开
-                await page.goto(url, timeout=Config.TIMEOUT)
-                # 检查是否成功加载了酒店详情页
+        log_step(f"同时尝试 {len(strategies)} 种方式进入详情页: {', '.join(strategies)}", "信息")
+        winner, detail_page = await race_detail_entries(strategies, race)
+        if deadline:
+            deadline.check("进入详情页")
+    finally:
+        page.remove_listener("popup", on_popup)
+        if not popup.done():
+            popup.cancel()
+        # 关闭落败方式打开的标签页
+        for extra_page in context.pages:
+            if extra_page not in pages_before and extra_page is not detail_page:
                 try:
-                    await page.wait_for_selector('div.mainRoomList__UlISo, div.commonRoomCard__BpNjl', timeout=15000)
-                    log_step(f"成功通过URL直接访问酒店详情页", "成功")
-                    if Config.SAVE_TEMP_FILES:
-                        await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}direct_url_detail_page.png")
-                    return page
+                    await extra_page.close()
                 except Exception:
-                    log_step(f"通过URL访问未能加载房间列表", "警告")
-                    continue
-            except Exception as url_err:
-                log_step(f"访问URL {url} 失败: {str(url_err)}", "警告")
-        
-        log_step("所有方案都失败，无法进入酒店详情页", "失败")
-        return None
+                    pass
+    
+    if not detail_page:
+        log_step("所有方式都失败，无法进入酒店详情页", "失败")
+        return None, None
+    if Config.SAVE_TEMP_FILES:
+        await detail_page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}hotel_detail_page.png")
+    return detail_page, winner
 
 # ==================== 第三部分：酒店房间信息提取 ====================
 
-async def extract_room_info(detail_page):
-    """从酒店详情页提取房间信息"""
+class RoomPayloadCollector:
+    """在BrowserContext上监听响应，收集房型/价格接口返回的JSON（新标签页的响应同样能收到）"""
+    
+    def __init__(self, context):
+        self.context = context
+        self.payloads = []
+        self.pending = set()
+        # 有新的接口响应开始读取时置位，wait_for_rooms据此唤醒而不是轮询
+        self.arrived = asyncio.Event()
+        self.context.on("response", self.on_response)
+    
+    def on_response(self, response):
+        url = response.url.lower()
+        if not any(keyword.lower() in url for keyword in Config.ROOM_PAYLOAD_URL_KEYWORDS):
+            return
+        task = asyncio.ensure_future(self.read_payload(response))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        self.arrived.set()
+    
+    async def read_payload(self, response):
+        try:
+            if "json" not in response.headers.get("content-type", ""):
+                return
+            data = await response.json()
+            self.payloads.append(data)
+            log_step(f"捕获到房型接口数据: {response.url}", "信息")
+        except Exception as e:
+            log_step(f"读取房型接口数据失败 {response.url}: {str(e)}", "警告")
+    
+    def build_rooms(self):
+        """合并所有接口数据中的房型，按房型名称和床型去重，只保留有报价的房型"""
+        rooms = []
+        seen = set()
+        for data in self.payloads:
+            for room in parse_room_payload(data):
+                key = (room["房型名称"], room["床型"])
+                if room["价格选项"] and key not in seen:
+                    seen.add(key)
+                    rooms.append(room)
+        return rooms
+    
+    async def wait_for_rooms(self, timeout_ms):
+        """等待接口数据到达并解析出房型，超时返回空列表"""
+        start = time.monotonic()
+        deadline = start + timeout_ms / 1000
+        while True:
+            self.arrived.clear()
+            if self.pending:
+                await asyncio.wait(list(self.pending), timeout=max(0, deadline - time.monotonic()))
+            rooms = self.build_rooms()
+            if rooms or time.monotonic() >= deadline:
+                break
+            # 等待下一个接口响应
+            try:
+                await asyncio.wait_for(self.arrived.wait(), timeout=max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+        log_step(f"等待房型接口数据 {(time.monotonic() - start) * 1000:.0f}ms（上限 {timeout_ms}ms）", "信息")
+        return rooms
+    
+    def detach(self):
+        self.context.remove_listener("response", self.on_response)
+
+async def extract_room_info(detail_page, close_after_snapshot=False, payload_collector=None, deadline=None):
+    """
+    从酒店详情页提取房间信息
+    
+    参数:
+    - detail_page: 酒店详情页
+    - close_after_snapshot: offline模式下取到页面HTML后立即关闭该标签页
+    - payload_collector: RoomPayloadCollector，捕获到房型接口数据时直接使用，跳过DOM提取
+    - deadline: 任务的Deadline
+    """
     if not detail_page:
         log_step("无效的详情页，无法提取房间信息", "失败")
         return []
+    if deadline:
+        deadline.enter("提取房型", detail_page)
     
     log_step("开始提取酒店房间信息")
     
-    # 提取酒店名称
-    hotel_name = ""
-    try:
-        # 尝试各种可能的选择器
-        hotel_name_selectors = [
-            'h1.detail-headline', 
-            '.hotel-name', 
-            '.hotel-title',
-            'div.hotel-title-box h1',
-            'span.hotelName',
-            '.detail-top .name'
-        ]
-        
-        for selector in hotel_name_selectors:
-            name_el = await detail_page.query_selector(selector)
-            if name_el:
-                hotel_name = await name_el.text_content()
-                hotel_name = hotel_name.strip()
-                log_step(f"提取到酒店名称: {hotel_name}", "成功")
-                break
-        
-        if not hotel_name:
+    # 提取酒店名称
+    hotel_name = ""
+    try:
+        detail_info = await run_schema_extractor(detail_page, "hotel_detail") or {}
+        hotel_name = detail_info.get("酒店名称", "")
+        if hotel_name:
+            log_step(f"提取到酒店名称: {hotel_name}", "成功")
+        else:
             # 如果没找到，尝试使用页面标题
             title = await detail_page.title()
             hotel_name = title.split('-')[0].strip() if '-' in title else title
@@ -1694,9 +3303,19 @@ async def extract_room_info(detail_page):
         log_step(f"提取酒店名称时出错: {str(e)}", "警告")
         hotel_name = "未知酒店"
     
+    # 优先使用房型接口返回的数据，命中时无需等待房间列表渲染
+    if payload_collector:
+        payload_wait = deadline.timeout(Config.PAYLOAD_WAIT, "等待房型接口") if deadline else Config.PAYLOAD_WAIT
+        rooms_info = await payload_collector.wait_for_rooms(payload_wait)
+        if rooms_info:
+            log_step(f"通过接口数据构建了 {len(rooms_info)} 种房型的信息", "成功")
+            return {"酒店名称": hotel_name, "房型列表": rooms_info}
+        log_step("未捕获到可用的房型接口数据，回退到页面提取", "信息")
+    
     # 等待房间列表加载
     try:
-        await detail_page.wait_for_selector('div.mainRoomList__UlISo, div.commonRoomCard__BpNjl', timeout=30000)
+        with TimedWait("room_list_ready", 30000, deadline) as wait:
+            await detail_page.wait_for_selector(schema_locator("room_list", "ready"), timeout=wait.timeout)
         log_step("房间列表已加载", "成功")
     except Exception as e:
         log_step(f"等待房间列表加载超时: {str(e)}", "失败")
@@ -1708,36 +3327,81 @@ async def extract_room_info(detail_page):
             log_step("已保存详情页源码到hotel_detail_page.html", "信息")
         return []
     
-    # 提取房间类型
-    room_types = await detail_page.query_selector_all('div.commonRoomCard__BpNjl')
+    # 根据配置选择提取模式
+    mode = Config.ROOM_EXTRACT_MODE
+    if mode == "compare":
+        rooms_info = await compare_room_extract_modes(detail_page)
+    elif mode == "offline":
+        rooms_info = await extract_rooms_offline(detail_page, close_after_snapshot)
+        if rooms_info is None and detail_page.is_closed():
+            rooms_info = []
+        elif rooms_info is None:
+            log_step("离线解析失败，回退到逐元素提取", "警告")
+            rooms_info = await extract_rooms_by_element(detail_page)
+    elif mode == "bulk":
+        rooms_info = await extract_rooms_bulk(detail_page)
+        if rooms_info is None:
+            log_step("批量提取失败，回退到逐元素提取", "警告")
+            rooms_info = await extract_rooms_by_element(detail_page)
+    else:
+        rooms_info = await extract_rooms_by_element(detail_page)
+    
+    log_step(f"共提取了 {len(rooms_info)} 种房型的信息", "成功")
+    return {"酒店名称": hotel_name, "房型列表": rooms_info}
+
+async def extract_rooms_by_element(detail_page):
+    """
+    逐元素提取房型列表（每个字段一次Playwright调用，作为批量提取的备选方案）
+    
+    房型卡片、报价和带hash类名的字段选择器都取自extraction_schema.json，与批量提取使用同一份规则
+    """
+    room_selector = schema_locator("room_list", "room")
+    offer_selector = schema_locator("room_list", "offer")
+    room_fields = ("room_list", "房型列表")
+    offer_fields = room_fields + ("价格选项",)
+    name_rule = schema_field_rules(*room_fields, "房型名称")[0]
+    bed_rule = schema_field_rules(*room_fields, "床型")[0]
+    area_rule = schema_field_rules(*room_fields, "面积和楼层")[0]
+    guests_rules = schema_field_rules(*offer_fields, "可住人数")
+    original_price_rule = schema_field_rules(*offer_fields, "原价")[0]
+    price_rules = schema_field_rules(*offer_fields, "价格")
+    promo_rule = schema_field_rules(*offer_fields, "促销")[0]
+    
+    # 提取房间类型；房型卡片的句柄在函数结束时释放，卡片内的句柄每个房型处理完就释放
+    page_scope = HandleScope()
+    room_types = page_scope.track(await detail_page.query_selector_all(room_selector))
     log_step(f"找到 {len(room_types)} 种房型", "成功")
     
     rooms_info = []
+    # 每个房型记录对应的 (房型卡片序号, [成功提取的报价序号])，出错跳过的房型/报价不会让元数据错位
+    positions = []
     
     for i, room_type in enumerate(room_types):
+        room_scope = HandleScope()
         try:
             # 提取房型名称
-            name_el = await room_type.query_selector('.commonRoomCard-title__iYBn2')
+            name_el = room_scope.track(await room_type.query_selector(name_rule["selector"]))
             room_name = await name_el.text_content() if name_el else "未知房型"
             log_step(f"提取房型 #{i+1}: {room_name}", "成功")
             
             # 提取床型信息
-            bed_el = await room_type.query_selector('.baseRoom-bedsInfo_title__sxCX9')
+            bed_el = room_scope.track(await room_type.query_selector(bed_rule["selector"]))
             bed_info = await bed_el.text_content() if bed_el else "床型信息未知"
             
             # 提取面积和楼层
-            area_els = await room_type.query_selector_all('.baseRoom-facility_title__BCMx6')
+            area_els = room_scope.track(await room_type.query_selector_all(area_rule["selector"]))
             area_info = ""
             for area_el in area_els:
                 text = await area_el.text_content()
-                if "平方米" in text:
+                if any(keyword in text for keyword in area_rule.get("contains", [""])):
                     area_info = text.strip()
                     break
             
             # 提取房间报价列表
-            price_items = await room_type.query_selector_all('.saleRoomItemBox__orNIv')
+            price_items = room_scope.track(await room_type.query_selector_all(offer_selector))
             
             room_offers = []
+            offer_positions = []
             for j, price_item in enumerate(price_items):
                 try:
                     # 使用更直接的方式提取信息
@@ -1745,7 +3409,7 @@ async def extract_room_info(detail_page):
                     
                     # 1. 提取早餐信息
                     try:
-                        breakfast_els = await price_item.query_selector_all('div:has(i.u-icon_ic_new_nonbreakfast), div:has(i.u-icon_ic_new_breakfast)')
+                        breakfast_els = room_scope.track(await price_item.query_selector_all('div:has(i.u-icon_ic_new_nonbreakfast), div:has(i.u-icon_ic_new_breakfast)'))
                         breakfast_texts = []
                         for el in breakfast_els:
                             text = await el.text_content()
@@ -1756,11 +3420,11 @@ async def extract_room_info(detail_page):
                             offer_info["早餐"] = " | ".join(breakfast_texts)
                         else:
                             # 尝试其他方式查找
-                            no_breakfast = await price_item.query_selector('div:has-text("无早餐")')
+                            no_breakfast = room_scope.track(await price_item.query_selector('div:has-text("无早餐")'))
                             if no_breakfast:
                                 offer_info["早餐"] = "无早餐"
                             else:
-                                with_breakfast = await price_item.query_selector('div:has-text("早餐")')
+                                with_breakfast = room_scope.track(await price_item.query_selector('div:has-text("早餐")'))
                                 if with_breakfast:
                                     offer_info["早餐"] = await with_breakfast.text_content()
                                 else:
@@ -1771,7 +3435,7 @@ async def extract_room_info(detail_page):
                     
                     # 2. 提取取消政策
                     try:
-                        cancel_els = await price_item.query_selector_all('div:has(i.u-icon_ic_new_freecancellation)')
+                        cancel_els = room_scope.track(await price_item.query_selector_all('div:has(i.u-icon_ic_new_freecancellation)'))
                         cancel_texts = []
                         for el in cancel_els:
                             text = await el.text_content()
@@ -1782,7 +3446,7 @@ async def extract_room_info(detail_page):
                             offer_info["取消政策"] = " | ".join(cancel_texts)
                         else:
                             # 尝试其他方式查找
-                            cancel_policy = await price_item.query_selector('div:has-text("取消")')
+                            cancel_policy = room_scope.track(await price_item.query_selector('div:has-text("取消")'))
                             if cancel_policy:
                                 offer_info["取消政策"] = await cancel_policy.text_content()
                             else:
@@ -1793,12 +3457,12 @@ async def extract_room_info(detail_page):
                     
                     # 3. 入住人数
                     try:
-                        guests_el = await price_item.query_selector('.saleRoomItemBox-guestInfo-adultBox_adultDesc__AfwYg')
+                        guests_el = room_scope.track(await price_item.query_selector(guests_rules[0]["selector"]))
                         if guests_el:
                             guests = await guests_el.text_content()
                         else:
                             # 检查是否有多个人图标而没有文本
-                            adult_icons = await price_item.query_selector_all('.saleRoomItemBox-guestInfo-adultBox_adultIcon__K9f3Y')
+                            adult_icons = room_scope.track(await price_item.query_selector_all(guests_rules[-1]["selector"]))
                             if len(adult_icons) > 0:
                                 guests = f"x{len(adult_icons)}"
                             else:
@@ -1812,27 +3476,27 @@ async def extract_room_info(detail_page):
                     # 4. 价格信息
                     # 4.1 折扣前价格
                     try:
-                        original_price_el = await price_item.query_selector('.saleRoomItemBox-priceBox-deletePrice__fuW7u')
+                        original_price_el = room_scope.track(await price_item.query_selector(original_price_rule["selector"]))
                         if original_price_el:
                             original_price = await original_price_el.text_content()
                             offer_info["原价"] = original_price.strip()
                     except Exception as price_err:
                         log_step(f"提取原价时出错: {str(price_err)}", "警告")
                     
-                    # 4.2 当前价格 - 尝试多种方式获取
+                    # 4.2 当前价格 - 按schema中的规则依次尝试
                     try:
-                        # 先尝试找特定的价格元素
-                        price_selectors = [
-                            '.saleRoomItemBox-priceBox-displayPrice__gWiOr',
-                            '.saleRoomItemBox-priceBoxForC__NrqJC span:not(.saleRoomItemBox-priceBox-displayPricePrefix__Xka15)',
-                            'div[class*="priceBox"] span:not([class*="Prefix"])',
-                            '.saleRoomItemBox-priceBox-displayPrice__gWiOr span:last-child',
-                            'div[class*="price"] span:has-text("¥")'
-                        ]
-                        
                         price_found = False
-                        for selector in price_selectors:
-                            price_el = await price_item.query_selector(selector)
+                        for rule in price_rules:
+                            if "contains" in rule:
+                                # 只取文本包含关键字（货币符号）的元素
+                                price_el = None
+                                for el in room_scope.track(await price_item.query_selector_all(rule["selector"])):
+                                    text = await el.text_content() or ""
+                                    if any(keyword in text for keyword in rule["contains"]):
+                                        price_el = el
+                                        break
+                            else:
+                                price_el = room_scope.track(await price_item.query_selector(rule["selector"]))
                             if price_el:
                                 price_text = await price_el.text_content()
                                 # 清理价格文本，去除"均"等前缀
@@ -1843,28 +3507,15 @@ async def extract_room_info(detail_page):
                                 break
                         
                         if not price_found:
-                            # 尝试使用JavaScript直接获取所有价格元素内容
-                            price_texts = await price_item.evaluate('''() => {
-                                const priceElements = Array.from(document.querySelectorAll('[class*="price"], [class*="Price"]'));
-                                return priceElements
-                                    .map(el => el.textContent)
-                                    .filter(text => text.includes('¥') || text.includes('￥'))
-                                    .map(text => text.trim());
-                            }''')
-                            
-                            if price_texts and len(price_texts) > 0:
-                                offer_info["价格"] = price_texts[0].replace('均', '').strip()
-                                log_step(f"通过JavaScript找到价格: {offer_info['价格']}", "成功")
-                            else:
-                                offer_info["价格"] = "价格未知"
-                                log_step("未找到价格信息", "警告")
+                            offer_info["价格"] = "价格未知"
+                            log_step("未找到价格信息", "警告")
                     except Exception as price_err:
                         log_step(f"提取价格时出错: {str(price_err)}", "警告")
                         offer_info["价格"] = "价格提取失败"
                     
                     # 4.3 促销信息
                     try:
-                        promo_el = await price_item.query_selector('.saleRoomItemBox-promotion-discountTag__nE7d9, [class*="discount"], [class*="promotion"]')
+                        promo_el = room_scope.track(await price_item.query_selector(promo_rule["selector"]))
                         if promo_el:
                             promotion = await promo_el.text_content()
                             if promotion:
@@ -1873,6 +3524,7 @@ async def extract_room_info(detail_page):
                         log_step(f"提取促销信息时出错: {str(promo_err)}", "警告")
                     
                     room_offers.append(offer_info)
+                    offer_positions.append(j)
                     log_step(f"成功提取房型 {room_name} 的价格选项 #{j+1}: {offer_info}", "成功")
                     
                 except Exception as e:
@@ -1887,13 +3539,111 @@ async def extract_room_info(detail_page):
             }
             
             rooms_info.append(room_info)
+            positions.append((i, offer_positions))
             
         except Exception as e:
             log_step(f"提取房型 #{i+1} 信息时出错: {str(e)}", "警告")
             traceback.print_exc()
+        finally:
+            await room_scope.release()
     
-    log_step(f"共提取了 {len(rooms_info)} 种房型的信息", "成功")
-    return {"酒店名称": hotel_name, "房型列表": rooms_info}
+    await page_scope.release()
+    
+    # 一次性取回所有data-exposure元数据并合并
+    try:
+        metadata = await detail_page.evaluate(room_metadata_script, [room_selector, offer_selector])
+        merge_room_metadata(rooms_info, metadata, positions)
+    except Exception as e:
+        log_step(f"提取房型元数据时出错: {str(e)}", "警告")
+    
+    return rooms_info
+
+async def extract_rooms_bulk(detail_page):
+    """用schema编译出的room_list提取函数一次page.evaluate批量提取房型列表，失败时返回None"""
+    try:
+        if not refresh_extraction_schema():
+            return None
+        extractor = extraction_schema.extractor("room_list")
+        selectors = [extraction_schema.locator("room_list", "room"), extraction_schema.locator("room_list", "offer")]
+        start = time.perf_counter()
+        # 房型字段和data-exposure元数据在同一次evaluate中取回
+        page_info, metadata = await detail_page.evaluate(
+            f"(selectors) => [({extractor})(), ({room_metadata_script})(selectors)]", selectors
+        )
+        rooms_info = page_info["房型列表"]
+        merge_room_metadata(rooms_info, metadata)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        offer_count = sum(len(room["价格选项"]) for room in rooms_info)
+        log_step(f"批量提取到 {len(rooms_info)} 种房型、{offer_count} 个价格选项，耗时 {elapsed_ms:.0f}ms", "成功")
+        return rooms_info
+    except Exception as e:
+        log_step(f"批量提取房型信息时出错: {str(e)}", "警告")
+        return None
+
+async def extract_rooms_offline(detail_page, close_after_snapshot=False):
+    """取一次页面HTML快照，在浏览器外解析房型列表，失败时返回None"""
+    try:
+        start = time.perf_counter()
+        html = await detail_page.content()
+        snapshot_ms = (time.perf_counter() - start) * 1000
+        
+        if close_after_snapshot:
+            await detail_page.close()
+            log_step("已获取页面快照并关闭详情页标签", "信息")
+        
+        start = time.perf_counter()
+        parsed = await asyncio.to_thread(parse_room_list_html, html)
+        parse_ms = (time.perf_counter() - start) * 1000
+        
+        rooms_info = parsed["房型列表"]
+        log_step(f"离线解析到 {len(rooms_info)} 种房型，快照耗时 {snapshot_ms:.0f}ms，解析耗时 {parse_ms:.0f}ms", "成功")
+        return rooms_info
+    except Exception as e:
+        log_step(f"离线解析房型信息时出错: {str(e)}", "警告")
+        return None
+
+async def compare_room_extract_modes(detail_page):
+    """分别用批量模式和逐元素模式提取房型，记录耗时和差异，返回批量结果"""
+    start = time.perf_counter()
+    bulk_rooms = await extract_rooms_bulk(detail_page)
+    bulk_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    element_rooms = await extract_rooms_by_element(detail_page)
+    element_ms = (time.perf_counter() - start) * 1000
+    
+    log_step(f"提取耗时对比: 批量 {bulk_ms:.0f}ms, 逐元素 {element_ms:.0f}ms", "信息")
+    
+    if bulk_rooms is None:
+        log_step("批量提取失败，使用逐元素提取结果", "警告")
+        return element_rooms
+    
+    # 逐个房型对比两种模式的结果
+    differences = 0
+    if len(bulk_rooms) != len(element_rooms):
+        log_step(f"房型数量不一致: 批量 {len(bulk_rooms)}, 逐元素 {len(element_rooms)}", "警告")
+        differences += 1
+    for i, (bulk_room, element_room) in enumerate(zip(bulk_rooms, element_rooms)):
+        for key in ("房型名称", "床型", "面积和楼层"):
+            if bulk_room.get(key) != element_room.get(key):
+                log_step(f"房型 #{i+1} 的{key}不一致: 批量 '{bulk_room.get(key)}', 逐元素 '{element_room.get(key)}'", "警告")
+                differences += 1
+        bulk_offers = bulk_room.get("价格选项", [])
+        element_offers = element_room.get("价格选项", [])
+        if len(bulk_offers) != len(element_offers):
+            log_step(f"房型 #{i+1} 的价格选项数量不一致: 批量 {len(bulk_offers)}, 逐元素 {len(element_offers)}", "警告")
+            differences += 1
+        for j, (bulk_offer, element_offer) in enumerate(zip(bulk_offers, element_offers)):
+            if bulk_offer != element_offer:
+                log_step(f"房型 #{i+1} 价格选项 #{j+1} 不一致: 批量 {bulk_offer}, 逐元素 {element_offer}", "警告")
+                differences += 1
+    
+    if differences == 0:
+        log_step("两种提取模式结果一致", "成功")
+    else:
+        log_step(f"两种提取模式共有 {differences} 处差异", "警告")
+    
+    return bulk_rooms
 
 async def save_room_info_to_file(rooms_info, filename="hotel_results.txt"):
     """将房间信息保存到文件"""
@@ -1966,113 +3716,946 @@ async def save_room_info_to_file(rooms_info, filename="hotel_results.txt"):
     except Exception as e:
         log_step(f"保存房间信息到文件失败: {str(e)}", "失败")
 
-# ==================== 主函数更新 ====================
+# ==================== HTTP直连模式 ====================
 
-async def main():
-    """主函数"""
-    log_step("程序开始运行")
+def load_cookies():
+    """从Config.COOKIE_FILE加载cookies，失败时返回空列表"""
+    cookies = []
+    if os.path.exists(Config.COOKIE_FILE):
+        try:
+            with open(Config.COOKIE_FILE, 'r') as f:
+                cookies = json.load(f)
+            log_step(f"成功加载cookies, 共{len(cookies)}条", "成功")
+        except Exception as e:
+            log_step(f"加载cookies失败: {str(e)}", "警告")
+    return cookies
+
+def build_cookie_header(cookies, url):
+    """把属于目标域名的cookies拼成Cookie请求头"""
+    host = urllib.parse.urlparse(url).hostname or ""
+    pairs = []
+    for cookie in cookies:
+        domain = cookie.get("domain", "").lstrip(".")
+        if domain and (host == domain or host.endswith("." + domain)):
+            pairs.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(pairs)
+
+async def fetch_detail_via_http(client, url, cookies, timeout_ms=None):
+    """
+    不启动浏览器，直接请求酒店详情页并解析服务端渲染的房型列表
+    
+    参数:
+    - timeout_ms: 本次请求的超时，None时使用client的默认超时
     
+    返回:
+    - (状态, 结果): 状态为 "ok" / "client-rendered" / "blocked" / "error"，
+      只有 "ok" 时结果为extract_room_info相同结构的字典
+    """
     try:
-        async with async_playwright() as p:
-            # 加载cookies
-            cookies = []
-            if os.path.exists(Config.COOKIE_FILE):
-                try:
-                    with open(Config.COOKIE_FILE, 'r') as f:
-                        cookies = json.load(f)
-                    log_step(f"成功加载cookies, 共{len(cookies)}条", "成功")
-                except Exception as e:
-                    log_step(f"加载cookies失败: {str(e)}", "警告")
-            
-            # 启动浏览器
-            browser = await p.chromium.launch(headless=Config.HEADLESS)
-            context = await browser.new_context(viewport={'width': 1280, 'height': 720})
-            
-            # 设置cookies
-            if cookies:
-                await context.add_cookies(cookies)
-            
-            # 打开页面
-            page = await context.new_page()
-            await page.goto('https://hotels.ctrip.com/', timeout=Config.TIMEOUT)
-            
-            log_step("成功打开携程酒店首页", "成功")
-            if Config.SAVE_TEMP_FILES:
-                await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}home_page.png")
-            
-            # 第一部分：搜索酒店（保持原有代码）
+        start = time.perf_counter()
+        headers = {}
+        cookie_header = build_cookie_header(cookies, url)
+        if cookie_header:
+            headers["Cookie"] = cookie_header
+        response = await client.get(url, headers=headers, timeout=timeout_ms)
+        html = await response.text()
+        fetch_ms = (time.perf_counter() - start) * 1000
+        await response.dispose()
+        
+        log_step(f"HTTP请求 {url} 返回 {response.status}，{len(html)} 字节，耗时 {fetch_ms:.0f}ms", "信息")
+        
+        # 被风控、跳转到登录页或命中验证码
+        if response.status in (403, 429) or "passport.ctrip.com" in response.url:
+            return "blocked", None
+        lowered = html.lower()
+        if any(marker in lowered for marker in BLOCKED_PAGE_MARKERS) and 'mainRoomList' not in html:
+            return "blocked", None
+        if not response.ok:
+            return "error", None
+        
+        parsed = await asyncio.to_thread(parse_room_list_html, html)
+        if not parsed["房型列表"]:
+            # 房型列表需要在浏览器中由JS渲染
+            return "client-rendered", None
+        return "ok", parsed
+    except Exception as e:
+        log_step(f"HTTP请求 {url} 出错: {str(e)}", "警告")
+        return "error", None
+
+def mirror_of(url):
+    """详情页URL所属的镜像站: "ctrip" / "trip.com"，其他站点返回域名"""
+    host = urllib.parse.urlparse(url).hostname or ""
+    if host == "ctrip.com" or host.endswith(".ctrip.com"):
+        return "ctrip"
+    if host == "trip.com" or host.endswith(".trip.com"):
+        return "trip.com"
+    return host
+
+def with_mirror_params(url):
+    """附加Config.MIRROR_QUERY_PARAMS中该镜像需要的查询参数"""
+    params = Config.MIRROR_QUERY_PARAMS.get(mirror_of(url))
+    if not params:
+        return url
+    parts = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query) if k not in params]
+    query.extend(params.items())
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+async def timed_fetch(client, url, cookies, deadline=None):
+    """
+    请求详情页并计时，把耗时记入该镜像的等待点
+    
+    解析出房型列表时记为正常样本；失败或被对冲取消时只知道耗时至少为这么久，
+    记为超时（删失）样本，避免只统计成功的快请求使分位数偏低。
+    传入deadline时请求超时收紧到剩余预算内，预算已用完时抛出DeadlineExceeded
+    
+    返回 (状态, 结果, 耗时毫秒)
+    """
+    name = f"http_detail_{mirror_of(url)}"
+    timeout_ms = deadline.timeout(Config.TIMEOUT, name) if deadline else None
+    start = time.perf_counter()
+    try:
+        status, result = await fetch_detail_via_http(client, with_mirror_params(url), cookies, timeout_ms)
+    except asyncio.CancelledError:
+        if wait_stats:
+            wait_stats.record(name, (time.perf_counter() - start) * 1000, timed_out=True)
+        raise
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if wait_stats:
+        wait_stats.record(name, elapsed_ms, timed_out=status != "ok")
+    return status, result, elapsed_ms
+
+def hedge_delay_ms(url):
+    """主站请求多久未返回后发出对冲请求：历史耗时的Config.HEDGE_PERCENTILE分位数，样本不足时用默认值"""
+    name = f"http_detail_{mirror_of(url)}"
+    if wait_stats and wait_stats.samples(name) >= wait_stats.min_samples:
+        quantile = wait_stats.quantile_ms(name, Config.HEDGE_PERCENTILE)
+        if quantile:
+            return quantile
+    return Config.HEDGE_DEFAULT_DELAY
+
+async def fetch_hedged(client, primary_url, mirror_url, cookies, deadline=None):
+    """
+    请求主站详情页，超过历史p90仍未返回（或已失败）时向镜像发出对冲请求，
+    采用先解析出房型列表的一方并取消另一方。传入deadline时等待不超过剩余预算，
+    预算用完时取消两个请求并抛出DeadlineExceeded
+    
+    返回:
+    - (状态, 结果, URL): 成功时为获胜方的结果和URL，都失败时为主站的状态
+    """
+    delay_ms = hedge_delay_ms(primary_url)
+    primary_mirror, backup_mirror = mirror_of(primary_url), mirror_of(mirror_url)
+    start = time.perf_counter()
+    primary_task = asyncio.ensure_future(timed_fetch(client, primary_url, cookies, deadline))
+    urls = {primary_task: primary_url}
+    pending = {primary_task}
+    primary_status = None
+    hedge_at_ms = None
+    try:
+        while pending:
+            timeout = None if hedge_at_ms is not None else max(0.0, delay_ms / 1000 - (time.perf_counter() - start))
+            remaining = deadline.remaining_s() if deadline else None
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and deadline:
+                deadline.check("HTTP对冲请求")
+            for task in done:
+                status, result, elapsed_ms = task.result()
+                url = urls[task]
+                if task is primary_task:
+                    primary_status = status
+                if status != "ok":
+                    log_step(f"镜像 {mirror_of(url)} 未能解析房型列表: {status}", "警告")
+                    continue
+                total_ms = (time.perf_counter() - start) * 1000
+                if hedge_at_ms is None:
+                    log_step(f"主站 {primary_mirror} 在 {total_ms:.0f}ms 内返回（对冲阈值 {delay_ms:.0f}ms），未发出对冲请求", "成功")
+                elif task is primary_task:
+                    log_step(f"对冲请求发出后主站 {primary_mirror} 仍先返回，总耗时 {total_ms:.0f}ms", "成功")
+                else:
+                    # 主站被取消，按其历史p95估算它原本还需要多久
+                    name = f"http_detail_{primary_mirror}"
+                    expected_ms = wait_stats.quantile_ms(name) if wait_stats else None
+                    saved = (f"按主站历史p{Config.ADAPTIVE_TIMEOUT_PERCENTILE * 100:.0f} {expected_ms}ms 估算节省约 {expected_ms - total_ms:.0f}ms"
+                             if expected_ms and expected_ms > total_ms else f"主站已等待 {total_ms:.0f}ms 仍未返回")
+                    log_step(f"对冲获胜: 镜像 {backup_mirror} 耗时 {elapsed_ms:.0f}ms，"
+                             f"总耗时 {total_ms:.0f}ms，{saved}", "成功")
+                return status, result, url
+            if hedge_at_ms is None:
+                # 超过阈值仍未返回，或主站已失败
+                hedge_at_ms = (time.perf_counter() - start) * 1000
+                reason = f"返回 {primary_status}" if primary_status else f"超过 {delay_ms:.0f}ms 未返回"
+                log_step(f"主站 {primary_mirror} {reason}，向镜像 {backup_mirror} 发出对冲请求", "信息")
+                mirror_task = asyncio.ensure_future(timed_fetch(client, mirror_url, cookies, deadline))
+                urls[mirror_task] = mirror_url
+                pending.add(mirror_task)
+        return primary_status, None, None
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def extract_room_info_via_http(p, cookies, deadline=None):
+    """
+    通过HTTP请求Config.KNOWN_HOTEL_URLS，返回第一个能直接解析出房型列表的结果
+    
+    第一个URL与另一个镜像的第一个URL对冲请求，都失败时按顺序请求其余URL。
+    每个请求的超时和对冲等待都不超过deadline剩余的预算，预算用完时抛出DeadlineExceeded
+    
+    返回:
+    - 成功返回extract_room_info相同结构的字典，需要浏览器时返回None
+    """
+    if deadline:
+        deadline.enter("HTTP直连")
+    client = await p.request.new_context(
+        user_agent=Config.HTTP_USER_AGENT,
+        extra_http_headers={"Accept-Language": "zh-CN,zh;q=0.9"},
+        timeout=Config.TIMEOUT
+    )
+    try:
+        urls = list(Config.KNOWN_HOTEL_URLS)
+        primary_url = urls[0] if urls else None
+        mirror_url = next((url for url in urls if mirror_of(url) != mirror_of(primary_url)), None) \
+            if primary_url and Config.HEDGE_PERCENTILE else None
+        if mirror_url:
+            status, result, url = await fetch_hedged(client, primary_url, mirror_url, cookies, deadline)
+            if status == "ok":
+                log_step(f"通过HTTP直接获取到 {len(result['房型列表'])} 种房型: {url}", "成功")
+                return result
+            if status == "blocked":
+                return None
+            urls = [url for url in urls if url not in (primary_url, mirror_url)]
+        
+        for url in urls:
+            status, result, _ = await timed_fetch(client, url, cookies, deadline)
+            if status == "ok":
+                log_step(f"通过HTTP直接获取到 {len(result['房型列表'])} 种房型: {url}", "成功")
+                return result
+            log_step(f"HTTP模式无法直接解析 {url}: {status}", "警告")
+            if status == "blocked":
+                # 被拦截时继续请求其他地址大概率同样被拦截，直接交给浏览器
+                break
+        return None
+    finally:
+        await client.dispose()
+
+# ==================== 浏览器启动 ====================
+
+def launch_profile():
+    """当前的启动配置 {"args": [...], "viewport": {...}}"""
+    return LAUNCH_PROFILES[Config.LAUNCH_PROFILE]
+
+def browser_mode():
+    """浏览器模式: "cdp" 连接常驻Chromium, "profile" 使用持久化用户目录, "launch" 每次运行启动新浏览器"""
+    if Config.CDP_URL:
+        return "cdp"
+    return "profile" if Config.PROFILE_DIR else "launch"
+
+async def connect_cdp_browser(p):
+    """连接Config.CDP_URL上的常驻Chromium，连接不上时重新启动它再连接"""
+    try:
+        return await p.chromium.connect_over_cdp(Config.CDP_URL, timeout=5000)
+    except Exception as e:
+        if not Config.CDP_AUTO_LAUNCH:
+            raise
+        log_step(f"无法连接常驻浏览器 {Config.CDP_URL}: {str(e)}，重新启动", "警告")
+    
+    port = urllib.parse.urlparse(Config.CDP_URL).port or 9222
+    process = start_chromium(p.chromium.executable_path, port, Config.CDP_USER_DATA_DIR,
+                             headless=Config.HEADLESS, detach=True, extra_args=launch_profile()["args"])
+    if not await asyncio.to_thread(wait_for_cdp, Config.CDP_URL, 15.0, process):
+        raise RuntimeError(f"常驻浏览器未能在 {Config.CDP_URL} 启动")
+    log_step(f"已启动常驻浏览器，pid {process.pid}", "信息")
+    return await p.chromium.connect_over_cdp(Config.CDP_URL)
+
+async def open_browser(p):
+    """
+    按browser_mode()获取浏览器
+    
+    cdp模式下browser.close()只关闭本次创建的context并断开连接，常驻Chromium继续运行
+    """
+    start = time.perf_counter()
+    if Config.CDP_URL:
+        browser = await connect_cdp_browser(p)
+    elif Config.PROFILE_DIR:
+        # 浏览器在ContextPool创建context时才启动
+        browser = PersistentProfile(p, Config.PROFILE_DIR, Config.PROFILE_READONLY)
+    else:
+        browser = await p.chromium.launch(headless=Config.HEADLESS, args=launch_profile()["args"])
+    log_step(f"浏览器就绪（{browser_mode()}模式，启动配置 {Config.LAUNCH_PROFILE}），耗时 {(time.perf_counter() - start) * 1000:.0f}ms", "信息")
+    return browser
+
+def watch_first_navigation(page, deadline):
+    """记录从程序启动到标签页第一次导航提交的耗时，按浏览器模式分别记入等待统计"""
+    def on_navigated(frame):
+        if frame is not page.main_frame or not frame.url.startswith("http"):
+            return
+        page.remove_listener("framenavigated", on_navigated)
+        elapsed_ms = deadline.elapsed_s() * 1000
+        log_step(f"启动到首次导航耗时 {elapsed_ms:.0f}ms（{browser_mode()}模式）", "信息")
+        if wait_stats:
+            wait_stats.record(f"startup_{browser_mode()}", elapsed_ms)
+    page.on("framenavigated", on_navigated)
+
+# ==================== 持久化缓存 ====================
+
+class PersistentProfile:
+    """
+    把launch_persistent_context包装成只有一个context的浏览器，供ContextPool使用
+    
+    context被关闭（池重建）后下一次new_context重新启动；只读模式下新建临时用户目录，
+    只复制profile_dir中的Config.PROFILE_CACHE_DIRS，关闭时删除，不会写回profile_dir
+    """
+    
+    def __init__(self, p, profile_dir, readonly=False):
+        self.p = p
+        self.profile_dir = profile_dir
+        self.readonly = readonly
+        self.user_data_dir = None
+        self.context = None
+        # 只读模式下复制缓存的字节数和耗时
+        self.copy_bytes = 0
+        self.copy_ms = 0.0
+    
+    def prepare_dir(self):
+        if not self.readonly:
+            return self.profile_dir
+        start = time.perf_counter()
+        user_data_dir = tempfile.mkdtemp(prefix="ctrip-profile-")
+        for cache_dir in Config.PROFILE_CACHE_DIRS:
+            source = os.path.join(self.profile_dir, cache_dir)
+            if not os.path.isdir(source):
+                continue
+            # 跳过锁文件，源目录正被另一个浏览器使用时也能复制
+            shutil.copytree(source, os.path.join(user_data_dir, cache_dir),
+                            ignore=shutil.ignore_patterns("Singleton*", "lockfile", "LOCK"))
+            for root, _, files in os.walk(os.path.join(user_data_dir, cache_dir)):
+                self.copy_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        self.copy_ms = (time.perf_counter() - start) * 1000
+        return user_data_dir
+    
+    async def new_context(self, **kwargs):
+        if self.user_data_dir is None:
+            self.user_data_dir = await asyncio.to_thread(self.prepare_dir)
+            if self.readonly:
+                log_step(f"使用持久化用户目录 {self.user_data_dir}（只读副本，复制缓存 "
+                         f"{self.copy_bytes / 1024 / 1024:.1f}MB，耗时 {self.copy_ms:.0f}ms）", "信息")
+            else:
+                log_step(f"使用持久化用户目录 {self.user_data_dir}", "信息")
+        self.context = await self.p.chromium.launch_persistent_context(
+            self.user_data_dir, headless=Config.HEADLESS, args=launch_profile()["args"], **kwargs)
+        return self.context
+    
+    def is_connected(self):
+        """context关闭或浏览器崩溃后下一次new_context会重新启动，始终视为已连接"""
+        return True
+    
+    def on(self, event, handler):
+        """与Browser.on兼容，持久化context没有disconnected事件"""
+    
+    async def close(self):
+        if self.context:
+            try:
+                await self.context.close()
+            except Exception:
+                pass
+        if self.readonly and self.user_data_dir:
+            await asyncio.to_thread(shutil.rmtree, self.user_data_dir, True)
+
+class HttpCacheStats:
+    """通过CDP Network事件统计HTTP缓存命中率、缓存节省的字节数和实际网络传输的字节数"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.hits = 0
+        self.saved_bytes = 0
+        self.network_bytes = 0
+        # requestId -> {"cached": 是否来自缓存, "length": 响应的Content-Length}
+        self.pending = {}
+    
+    def attach(self, context):
+        """统计context中现有和之后打开的所有标签页"""
+        for page in context.pages:
+            asyncio.ensure_future(self.watch(page))
+        context.on("page", lambda page: asyncio.ensure_future(self.watch(page)))
+    
+    async def watch(self, page):
+        try:
+            session = await page.context.new_cdp_session(page)
+            session.on("Network.requestServedFromCache", self.on_served_from_cache)
+            session.on("Network.responseReceived", self.on_response)
+            session.on("Network.loadingFinished", self.on_finished)
+            await session.send("Network.enable")
+        except Exception as e:
+            log_step(f"无法统计标签页的HTTP缓存: {str(e)}", "警告")
+    
+    def on_served_from_cache(self, params):
+        self.pending.setdefault(params["requestId"], {})["cached"] = True
+    
+    def on_response(self, params):
+        response = params["response"]
+        entry = self.pending.setdefault(params["requestId"], {})
+        if response.get("fromDiskCache") or response.get("fromPrefetchCache"):
+            entry["cached"] = True
+        headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+        length = str(headers.get("content-length", ""))
+        if length.isdigit():
+            entry["length"] = int(length)
+    
+    def on_finished(self, params):
+        entry = self.pending.pop(params["requestId"], {})
+        self.requests += 1
+        if entry.get("cached"):
+            self.hits += 1
+            self.saved_bytes += entry.get("length", 0)
+        else:
+            self.network_bytes += int(params.get("encodedDataLength", 0))
+    
+    def hit_rate(self):
+        return self.hits / self.requests if self.requests else 0.0
+    
+    def log_stats(self):
+        log_step(f"HTTP缓存: {self.requests} 个请求命中 {self.hits} 个（{self.hit_rate() * 100:.0f}%），"
+                 f"节省约 {self.saved_bytes / 1024 / 1024:.1f}MB，网络传输 {self.network_bytes / 1024 / 1024:.1f}MB", "信息")
+
+http_cache_stats = HttpCacheStats() if browser_mode() == "profile" else None
+
+def log_http_cache_stats():
+    """输出本次运行的HTTP缓存命中率和节省的字节数"""
+    if http_cache_stats:
+        http_cache_stats.log_stats()
+
+# ==================== BrowserContext池 ====================
+
+# 归还context时清除的站点存储（cookies单独恢复为初始值，sessionStorage随标签页关闭丢弃）
+POOL_CLEAR_STORAGE_TYPES = "local_storage,indexeddb,cache_storage,service_workers,websql,file_systems"
+
+class PooledContext:
+    """池中的一个BrowserContext和它的空白标签页，origins记录任务期间打开过的页面来源，归还时清除其存储"""
+    
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+        self.origins = set()
+    
+    def on_request(self, request):
+        if request.is_navigation_request():
+            parsed = urllib.parse.urlparse(request.url)
+            if parsed.scheme in ("http", "https"):
+                self.origins.add(f"{parsed.scheme}://{parsed.netloc}")
+    
+    async def clear_storage(self):
+        """通过CDP清除打开过的各来源的localStorage、IndexedDB、Cache Storage和Service Worker"""
+        if not self.origins:
+            return
+        session = await self.context.new_cdp_session(self.page)
+        try:
+            for origin in sorted(self.origins):
+                await session.send("Storage.clearDataForOrigin",
+                                   {"origin": origin, "storageTypes": POOL_CLEAR_STORAGE_TYPES})
+        finally:
+            await session.detach()
+        self.origins.clear()
+
+class BrowserUnavailableError(Exception):
+    """浏览器连接已断开或池中的context全部重建失败，context池无法再借出context"""
+
+class ContextPool:
+    """
+    同一个浏览器内预热的BrowserContext池，供长时间运行的worker反复执行任务
+    
+    context创建时就设置好视口、cookies、弹窗屏蔽和请求路由并打开一个空白标签页。任务归还后，
+    使用满max_uses次、JS堆超过memory_limit_mb或任务异常退出的context在后台关闭并重建，
+    其余的关闭所有标签页、清除任务打开过的站点的localStorage/IndexedDB等存储、恢复初始cookies后放回池中，
+    清除失败时同样重建
+    
+    浏览器断开（disconnected事件）或context全部重建失败后池失效：checkout立即抛出BrowserUnavailableError，
+    正在等待的checkout也被唤醒并抛出，由BrowserWorker连接新浏览器并重建整个池
+    """
+    
+    def __init__(self, browser, size, cookies, max_uses=20, memory_limit_mb=None):
+        self.browser = browser
+        self.size = size
+        self.cookies = cookies
+        self.max_uses = max_uses
+        self.memory_limit_mb = memory_limit_mb
+        self.idle = asyncio.Queue()
+        self.rebuilding = set()
+        # 池失效时设置，lost_reason为原因
+        self.lost = asyncio.Event()
+        self.lost_reason = None
+        self.closing = False
+        browser.on("disconnected", self.on_disconnected)
+        # 统计：每次checkout的等待耗时、重置/重建次数、占用数对时间的积分
+        self.checkout_ms = []
+        self.resets = 0
+        self.recycled = 0
+        self.in_use = 0
+        self.peak = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.last_change = None
+    
+    async def create(self):
+        context = await self.browser.new_context(viewport=launch_profile()["viewport"])
+        await install_overlay_suppression(context)
+        await install_request_routing(context)
+        if http_cache_stats:
+            http_cache_stats.attach(context)
+        if self.cookies:
+            await context.add_cookies(self.cookies)
+        # 持久化context启动时已经有一个标签页
+        page = context.pages[0] if context.pages else await context.new_page()
+        entry = PooledContext(context, page)
+        context.on("request", entry.on_request)
+        return entry
+    
+    async def start(self):
+        """预热size个context"""
+        start = time.perf_counter()
+        entries = await asyncio.gather(*(self.create() for _ in range(self.size)))
+        for entry in entries:
+            self.idle.put_nowait(entry)
+        self.started_at = self.last_change = time.perf_counter()
+        log_step(f"已预热 {self.size} 个BrowserContext，耗时 {(time.perf_counter() - start) * 1000:.0f}ms", "信息")
+    
+    def track(self, delta):
+        """更新占用数，并累计占用数对时间的积分"""
+        now = time.perf_counter()
+        self.busy_seconds += self.in_use * (now - self.last_change)
+        self.last_change = now
+        self.in_use += delta
+        self.peak = max(self.peak, self.in_use)
+    
+    def on_disconnected(self, _browser):
+        if not self.closing:
+            self.fail("浏览器连接已断开")
+    
+    def fail(self, reason):
+        """标记池失效并唤醒所有等待中的checkout"""
+        if self.lost.is_set():
+            return
+        self.lost_reason = reason
+        self.lost.set()
+        log_step(f"Context池不可用: {reason}", "失败")
+    
+    def alive(self):
+        return not self.lost.is_set() and self.browser.is_connected()
+    
+    async def checkout(self):
+        """取出一个空闲context，没有空闲时等待归还或重建完成；池失效时抛出BrowserUnavailableError"""
+        if not self.alive():
+            raise BrowserUnavailableError(self.lost_reason or "浏览器连接已断开")
+        start = time.perf_counter()
+        get = asyncio.ensure_future(self.idle.get())
+        lost = asyncio.ensure_future(self.lost.wait())
+        try:
+            await asyncio.wait({get, lost}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # 取到context的同时任务被取消，把它放回池中
+            if get.done() and not get.cancelled():
+                self.idle.put_nowait(get.result())
+            raise
+        finally:
+            lost.cancel()
+            get.cancel()
+        if not get.done() or get.cancelled():
+            raise BrowserUnavailableError(self.lost_reason)
+        entry = get.result()
+        self.checkout_ms.append((time.perf_counter() - start) * 1000)
+        self.track(1)
+        entry.uses += 1
+        return entry
+    
+    async def recycle_reason(self, entry, healthy):
+        """需要重建时返回原因"""
+        if not healthy:
+            return "任务异常退出"
+        if entry.uses >= self.max_uses:
+            return f"已使用 {entry.uses} 次"
+        if self.memory_limit_mb:
+            try:
+                heap_mb = 0
+                for page in entry.context.pages:
+                    heap_mb += (await get_page_memory(page))["js_heap_mb"]
+            except Exception as e:
+                log_step(f"读取context内存失败: {str(e)}", "警告")
+                return None
+            if heap_mb > self.memory_limit_mb:
+                return f"JS堆 {heap_mb:.0f}MB 超过上限 {self.memory_limit_mb}MB"
+        return None
+    
+    async def checkin(self, entry, healthy=True):
+        """归还context：重置后放回池中，或在后台重建"""
+        self.track(-1)
+        reason = await self.recycle_reason(entry, healthy)
+        if not reason:
+            try:
+                for page in entry.context.pages:
+                    await page.close()
+                entry.page = await entry.context.new_page()
+                await entry.clear_storage()
+                await entry.context.clear_cookies()
+                if self.cookies:
+                    await entry.context.add_cookies(self.cookies)
+                self.resets += 1
+                self.idle.put_nowait(entry)
+                return
+            except Exception as e:
+                reason = f"重置失败: {str(e)}"
+        log_step(f"重建BrowserContext: {reason}", "信息")
+        self.recycled += 1
+        task = asyncio.ensure_future(self.rebuild(entry))
+        self.rebuilding.add(task)
+        task.add_done_callback(self.rebuilding.discard)
+    
+    async def rebuild(self, entry):
+        try:
+            await entry.context.close()
+        except Exception:
+            pass
+        try:
+            self.idle.put_nowait(await self.create())
+        except Exception as e:
+            if not self.browser.is_connected():
+                # 浏览器已断开，不缩小池，等worker连接新浏览器后整体重建
+                self.fail("浏览器连接已断开")
+                return
+            log_step(f"重建BrowserContext失败，池容量减为 {self.size - 1}: {str(e)}", "警告")
+            self.size -= 1
+            if self.size <= 0:
+                self.fail(f"所有BrowserContext重建失败: {str(e)}")
+    
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """async with pool.lease() as entry: 使用entry.context和entry.page执行一个任务"""
+        entry = await self.checkout()
+        healthy = False
+        try:
+            yield entry
+            healthy = True
+        finally:
+            await self.checkin(entry, healthy)
+    
+    def log_stats(self):
+        """输出checkout等待耗时和占用率"""
+        if not self.started_at:
+            return
+        self.track(0)
+        elapsed = time.perf_counter() - self.started_at
+        occupancy = self.busy_seconds / (elapsed * self.size) if elapsed and self.size else 0
+        waits = sorted(self.checkout_ms)
+        if waits:
+            p95 = waits[max(0, int(len(waits) * 0.95) - 1)]
+            wait_text = (f"等待 平均 {sum(waits) / len(waits):.1f}ms / p95 {p95:.1f}ms / 最大 {waits[-1]:.1f}ms")
+        else:
+            wait_text = "无checkout"
+        log_step(f"Context池: {self.size} 个context，checkout {len(waits)} 次，{wait_text}，"
+                 f"平均占用率 {occupancy * 100:.0f}%，峰值 {self.peak}/{self.size}，"
+                 f"重置 {self.resets} 次，重建 {self.recycled} 次", "信息")
+    
+    async def close(self):
+        self.closing = True
+        self.log_stats()
+        for task in list(self.rebuilding):
+            task.cancel()
+        await asyncio.gather(*self.rebuilding, return_exceptions=True)
+        while not self.idle.empty():
+            entry = self.idle.get_nowait()
+            try:
+                await entry.context.close()
+            except Exception:
+                pass
+
+# ==================== 主函数更新 ====================
+
+def save_run_state():
+    """任务结束（包括被拦截或超出预算）时输出统计，保存各项缓存和日志"""
+    log_preflight_stats()
+    log_overlay_stats()
+    log_route_stats()
+    save_static_assets()
+    log_http_cache_stats()
+    save_selector_cache()
+    save_wait_stats()
+    save_city_id_cache()
+    save_log_to_file(Config.LOG_FILE)
+
+async def search_and_open_detail(context, page, deadline):
+    """
+    通过搜索进入详情页：搜索酒店 → 酒店列表 → 详情页，已知URL与点击进入同时尝试
+    
+    返回 (详情页, 房型接口监听器)，没有得到详情页时详情页为None。
+    得到的详情页验证通过后写入酒店ID缓存
+    """
+    # 第一部分：搜索酒店。已知城市ID时直接打开列表页，否则通过首页表单搜索
+    search_start = time.perf_counter()
+    direct = Config.SEARCH_MODE == "url" and await open_hotel_list_directly(page, deadline)
+    if direct:
+        search_outcome = "ok"
+        report_search_time(True, (time.perf_counter() - search_start) * 1000)
+    else:
+        form_start = time.perf_counter()
+        with TimedWait("home_goto", Config.TIMEOUT, deadline) as wait:
+            await page.goto('https://hotels.ctrip.com/', timeout=wait.timeout)
+        
+        log_step("成功打开携程酒店首页", "成功")
+        if Config.SAVE_TEMP_FILES:
+            await page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}home_page.png")
+        
+        # 页面被拦截或需要登录时直接结束；首页结构变化时跳过搜索，直接访问已知URL
+        search_outcome = await preflight_page(page, "home", deadline)
+        if search_outcome == "ok":
             try:
                 # 填写搜索参数
-                await set_search_parameters(page)
-                
-                # 执行搜索
-                await search_hotel(page)
+                await set_search_parameters(page, deadline)
                 
-                # 寻找目标酒店
-                await find_target_hotel(page)
+                # 执行搜索，成功时记住城市ID，下次直接打开列表页
+                if await search_hotel(page, deadline):
+                    learn_city_id(page.url, Config.DESTINATION)
+                    report_search_time(False, (time.perf_counter() - form_start) * 1000)
+            except (PageBlockedError, DeadlineExceeded):
+                raise
             except Exception as e:
                 log_step(f"第一部分搜索酒店过程出错: {str(e)}", "失败")
                 traceback.print_exc()
+        else:
+            log_step("首页结构与schema不符，跳过搜索", "警告")
+    
+    if search_outcome == "ok":
+        try:
+            # 寻找目标酒店
+            await find_target_hotel(page, deadline)
+        except (PageBlockedError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            log_step(f"第一部分查找目标酒店过程出错: {str(e)}", "失败")
+            traceback.print_exc()
+    
+    # 第二部分：提取酒店列表信息并进入详情页
+    list_outcome = await preflight_page(page, "hotel_list", deadline) if search_outcome == "ok" else search_outcome
+    if list_outcome == "ok":
+        hotel_list, target_hotel_card = await extract_hotel_list_info(page, deadline)
+    else:
+        hotel_list, target_hotel_card = [], None
+    
+    # 仅在需要保存临时文件时保存JSON
+    if Config.SAVE_TEMP_FILES:
+        # 保存酒店列表信息
+        with open("hotel_list.json", "w", encoding="utf-8") as f:
+            json.dump(hotel_list, f, ensure_ascii=False, indent=2)
+        log_step("酒店列表信息已保存到hotel_list.json", "成功")
+    
+    # 进入详情页前开始监听房型接口
+    payload_collector = RoomPayloadCollector(context) if Config.CAPTURE_ROOM_PAYLOAD else None
+    
+    # 进入酒店详情页：点击查看详情与已知URL同时进行，最先显示房型列表的一方获胜
+    detail_page, winner = await enter_hotel_detail(page, target_hotel_card, deadline)
+    
+    if detail_page:
+        await remember_hotel_detail(detail_page, "known_url" if winner.startswith("已知URL") else "search")
+    return detail_page, payload_collector
+
+async def run_browser_job(pool, deadline):
+    """
+    浏览器模式的完整任务：搜索 → 酒店列表 → 详情页 → 房型，酒店ID缓存命中时直接进入详情页
+    
+    从ContextPool借出预热好的context执行，结束后归还。BrowserWorker.run把它放在asyncio.wait_for中运行，
+    预算用完时整个任务被取消，context作为异常退出归还并重建
+    """
+    async with pool.lease() as leased:
+        context, page = leased.context, leased.page
+        watch_first_navigation(page, deadline)
+        
+        # 酒店ID缓存命中时直接打开详情页，跳过搜索和列表阶段
+        detail_page, payload_collector = None, None
+        try:
+            cached = lookup_cached_hotel()
+            if cached:
+                # 进入详情页前开始监听房型接口
+                payload_collector = RoomPayloadCollector(context) if Config.CAPTURE_ROOM_PAYLOAD else None
+                detail_page = await open_cached_hotel_detail(page, cached, deadline)
+            if not detail_page:
+                if payload_collector:
+                    payload_collector.detach()
+                detail_page, payload_collector = await search_and_open_detail(context, page, deadline)
             
-            # 第二部分：提取酒店列表信息并进入详情页
-            try:
-                hotel_list, target_hotel_card = await extract_hotel_list_info(page)
+            # 第三部分：提取酒店房间信息
+            if detail_page:
+                detail_page = await recycle_page_if_needed(detail_page, deadline, owned=detail_page is not page)
+                rooms_info = await extract_room_info(detail_page, close_after_snapshot=detail_page is not page,
+                                                     payload_collector=payload_collector, deadline=deadline)
+                
+                # 保存房间信息到文件
+                await save_room_info_to_file(rooms_info, Config.OUTPUT_FILE)
                 
                 # 仅在需要保存临时文件时保存JSON
                 if Config.SAVE_TEMP_FILES:
-                    # 保存酒店列表信息
-                    with open("hotel_list.json", "w", encoding="utf-8") as f:
-                        json.dump(hotel_list, f, ensure_ascii=False, indent=2)
-                    log_step("酒店列表信息已保存到hotel_list.json", "成功")
-                
-                # 进入酒店详情页
-                detail_page = await enter_hotel_detail(page, target_hotel_card)
-                
-                if not detail_page:
-                    # 如果无法通过列表进入详情页，尝试直接访问已知URL
-                    for url in Config.KNOWN_HOTEL_URLS:
-                        log_step(f"尝试直接访问酒店URL: {url}", "信息")
-                        detail_page = await context.new_page()
-                        await detail_page.goto(url, timeout=Config.TIMEOUT)
-                        
-                        # 检查是否成功加载酒店详情页
-                        try:
-                            await detail_page.wait_for_selector('div.mainRoomList__UlISo, div.commonRoomCard__BpNjl', timeout=15000)
-                            log_step(f"成功直接访问酒店详情页: {url}", "成功")
-                            if Config.SAVE_TEMP_FILES:
-                                await detail_page.screenshot(path=f"{Config.SCREENSHOT_PREFIX}direct_hotel_detail.png")
-                            break
-                        except Exception:
-                            log_step(f"直接访问URL未找到房间列表: {url}", "警告")
-                            await detail_page.close()
-                            detail_page = None
-                
-                # 第三部分：提取酒店房间信息
-                if detail_page:
-                    rooms_info = await extract_room_info(detail_page)
-                    
-                    # 保存房间信息到文件
-                    await save_room_info_to_file(rooms_info, Config.OUTPUT_FILE)
-                    
-                    # 仅在需要保存临时文件时保存JSON
-                    if Config.SAVE_TEMP_FILES:
-                        # 同时保存为JSON格式便于程序处理
-                        with open("room_info.json", "w", encoding="utf-8") as f:
-                            json.dump(rooms_info, f, ensure_ascii=False, indent=2)
-                        log_step("房间信息已保存到room_info.json", "成功")
-                else:
-                    log_step("无法获取有效的酒店详情页，跳过房间信息提取", "失败")
-                
-            except Exception as e:
-                log_step(f"第二/三部分处理过程出错: {str(e)}", "失败")
-                traceback.print_exc()
-            
-            # 保存日志
-            save_log_to_file(Config.LOG_FILE)
+                    # 同时保存为JSON格式便于程序处理
+                    with open("room_info.json", "w", encoding="utf-8") as f:
+                        json.dump(rooms_info, f, ensure_ascii=False, indent=2)
+                    log_step("房间信息已保存到room_info.json", "成功")
+            else:
+                log_step("无法获取有效的酒店详情页，跳过房间信息提取", "失败")
             
-            # 关闭浏览器
+        except (PageBlockedError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            log_step(f"第二/三部分处理过程出错: {str(e)}", "失败")
+            traceback.print_exc()
+        finally:
+            # context会归还给池复用，监听器不能留在上面
+            if payload_collector:
+                payload_collector.detach()
+
+class BrowserWorker:
+    """
+    长时间运行的浏览器worker：第一个需要浏览器的任务启动浏览器并预热context池，之后的任务复用二者
+    
+    任务参数都在Config上，任务依次执行；context池的重置和重建在任务之间的空隙中进行。
+    浏览器崩溃或断开后，下一个任务开始前重新连接（cdp模式先等待常驻Chromium恢复）或重新启动浏览器，
+    并重建context池
+    """
+    
+    def __init__(self, p, cookies):
+        self.p = p
+        self.cookies = cookies
+        self.browser = None
+        self.pool = None
+        self.jobs = 0
+        self.reconnects = 0
+    
+    async def discard(self):
+        """丢弃已断开的浏览器和失效的context池"""
+        pool, browser = self.pool, self.browser
+        self.pool = self.browser = None
+        await pool.close()
+        try:
             await browser.close()
-            log_step("程序运行完成", "成功")
+        except Exception:
+            pass
+    
+    async def start(self):
+        if self.pool and self.pool.alive():
+            return
+        if self.pool:
+            log_step(f"{self.pool.lost_reason or '浏览器连接已断开'}，重新连接浏览器并重建context池", "警告")
+            await self.discard()
+            self.reconnects += 1
+            if browser_mode() == "cdp" and not await asyncio.to_thread(
+                    wait_for_cdp, Config.CDP_URL, Config.CDP_RECONNECT_WAIT):
+                log_step(f"常驻浏览器 {Config.CDP_URL} 在 {Config.CDP_RECONNECT_WAIT}s 内未恢复", "警告")
+        self.browser = await open_browser(self.p)
+        pool_size = 1 if browser_mode() == "profile" else Config.CONTEXT_POOL_SIZE
+        self.pool = ContextPool(self.browser, pool_size, self.cookies,
+                                max_uses=Config.CONTEXT_MAX_USES, memory_limit_mb=Config.CONTEXT_MEMORY_LIMIT_MB)
+        await self.pool.start()
+    
+    async def run(self, deadline):
+        """在池中执行一个浏览器任务，超出预算时抛出DeadlineExceeded"""
+        await self.start()
+        self.jobs += 1
+        try:
+            await asyncio.wait_for(run_browser_job(self.pool, deadline), timeout=deadline.remaining_s())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("浏览器任务", deadline.budget_s) from None
+    
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+        if self.jobs:
+            log_step(f"浏览器worker共执行 {self.jobs} 个浏览器任务，重新连接浏览器 {self.reconnects} 次", "信息")
+
+def load_jobs():
+    """读取Config.JOBS_FILE中的任务列表，未设置时返回只有当前配置的一个任务"""
+    if not Config.JOBS_FILE:
+        return [{}]
+    with open(Config.JOBS_FILE, "r", encoding="utf-8") as f:
+        jobs = json.load(f)
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError(f"{Config.JOBS_FILE} 应为由对象组成的JSON数组")
+    return jobs
+
+@contextlib.contextmanager
+def job_config(job):
+    """在任务期间把job中的值覆盖到Config上，结束后恢复"""
+    unknown = [key for key in job if not hasattr(Config, key)]
+    if unknown:
+        raise ValueError(f"任务包含未知的配置项: {', '.join(unknown)}")
+    previous = {key: getattr(Config, key) for key in job}
+    for key, value in job.items():
+        setattr(Config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            setattr(Config, key, value)
+
+async def run_job(p, worker, cookies, deadline):
+    """
+    执行一个任务：HTTP直连模式先尝试不启动浏览器，失败或浏览器模式时交给worker
+    
+    HTTP请求和浏览器任务共用同一个deadline，任务总耗时受Config.JOB_DEADLINE限制
+    """
+    if Config.DETAIL_FETCH_MODE == "http":
+        rooms_info = await extract_room_info_via_http(p, cookies, deadline)
+        if rooms_info:
+            await save_room_info_to_file(rooms_info, Config.OUTPUT_FILE)
+            if Config.SAVE_TEMP_FILES:
+                with open("room_info.json", "w", encoding="utf-8") as f:
+                    json.dump(rooms_info, f, ensure_ascii=False, indent=2)
+                log_step("房间信息已保存到room_info.json", "成功")
+            log_step("任务完成（HTTP模式，未启动浏览器）", "成功")
+            return
+        log_step("HTTP模式未能获取房型列表，回退到浏览器模式", "警告")
+    
+    # 浏览器模式：使用HTTP请求剩下的预算
+    await worker.run(deadline)
+    log_step(f"任务完成，耗时 {deadline.elapsed_s():.1f}s", "成功")
+
+async def main():
+    """主函数：依次执行任务列表中的任务，浏览器和context池在任务之间复用"""
+    log_step("程序开始运行")
+    
+    try:
+        jobs = load_jobs()
+        async with async_playwright() as p:
+            # 加载cookies
+            cookies = load_cookies()
+            worker = BrowserWorker(p, cookies)
+            try:
+                for i, job in enumerate(jobs, 1):
+                    with job_config(job):
+                        if len(jobs) > 1:
+                            log_step(f"开始任务 {i}/{len(jobs)}: {Config.HOTEL_NAME}（{Config.DESTINATION}，"
+                                     f"{Config.CHECK_IN_DATE} ~ {Config.CHECK_OUT_DATE}）", "信息")
+                        deadline = Deadline(Config.JOB_DEADLINE)
+                        try:
+                            await run_job(p, worker, cookies, deadline)
+                        except PageBlockedError as e:
+                            log_step(f"{str(e)}，终止本次任务", "失败")
+                        except DeadlineExceeded as e:
+                            log_step(f"{str(e)}，已取消本次任务（已用 {deadline.elapsed_s():.1f}s）", "失败")
+                        except BrowserUnavailableError as e:
+                            log_step(f"{str(e)}，本次任务失败，下一个任务前重新连接浏览器", "失败")
+                        except Exception as e:
+                            # 单个任务出错不影响后面的任务
+                            log_step(f"任务运行出错: {str(e)}", "失败")
+                            traceback.print_exc()
+                        # 每个任务结束后保存各项缓存、统计和日志
+                        save_run_state()
+            finally:
+                await worker.close()
+        log_step("程序运行完成", "成功")
+        save_log_to_file(Config.LOG_FILE)
     
     except Exception as e:
         log_step(f"程序运行出错: {str(e)}", "失败")
@@ -2080,4 +4663,4 @@ async def main():
         save_log_to_file(Config.LOG_FILE)
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
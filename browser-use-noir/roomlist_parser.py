@@ -0,0 +1,672 @@
+"""
+离线解析携程酒店详情页HTML
+
+将page.content()保存下来的详情页HTML（或mainRoomList__UlISo片段，如roomlist.txt）
+解析成与getctrip.extract_room_info相同的结构：
+    {"酒店名称": ..., "房型列表": [{"房型名称", "床型", "面积和楼层", "价格选项": [...]}]}
+
+只依赖标准库，不需要浏览器，可以在关闭标签页之后再解析。
+字段规则与extraction_schema.json中的room_list及getctrip.extract_rooms_by_element保持一致，
+酒店名称的选择器直接读取同目录extraction_schema.json中hotel_detail的规则。
+
+另外提供parse_room_payload，把房型接口返回的JSON转换成同样的结构。
+"""
+import json
+import os
+import re
+from html.parser import HTMLParser
+
+from extraction_schema import ExtractionSchema, SchemaError
+
+# 不会出现结束标签的元素
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+
+class Node:
+    """简化的DOM节点"""
+    __slots__ = ('tag', 'attrs', 'classes', 'children', 'parent', 'index', '_text')
+
+    def __init__(self, tag, attrs, parent, index):
+        self.tag = tag
+        self.attrs = attrs
+        self.classes = attrs.get('class', '').split()
+        self.children = []
+        self.parent = parent
+        self.index = index  # 文档顺序
+        self._text = None
+
+    def text(self):
+        """等价于DOM的textContent"""
+        if self._text is None:
+            parts = []
+            for child in self.children:
+                parts.append(child if isinstance(child, str) else child.text())
+            self._text = ''.join(parts)
+        return self._text
+
+    def iter(self):
+        """按文档顺序遍历所有后代元素（不含自身）"""
+        stack = [c for c in reversed(self.children) if isinstance(c, Node)]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(c for c in reversed(node.children) if isinstance(c, Node))
+
+
+class _TreeBuilder(HTMLParser):
+    """把HTML构建成Node树，容忍未闭合和错位的标签"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#document', {}, None, 0)
+        self.stack = [self.root]
+        self.count = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.count += 1
+        parent = self.stack[-1]
+        node = Node(tag, {k: (v or '') for k, v in attrs}, parent, self.count)
+        parent.children.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        # 找到最近的同名未闭合元素，将其及其内部未闭合的元素一起闭合
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_html(html):
+    """将HTML字符串解析为Node树，返回根节点"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _compile_compound(compound):
+    """把 'tag.cls1.cls2' 形式的简单选择器编译为匹配函数"""
+    match = re.match(r'^([a-zA-Z0-9]*)((?:\.[\w-]+)*)$', compound)
+    if not match:
+        raise ValueError(f"不支持的选择器: {compound}")
+    tag = match.group(1)
+    classes = [c for c in match.group(2).split('.') if c]
+
+    def matches(node):
+        if tag and node.tag != tag:
+            return False
+        return all(c in node.classes for c in classes)
+    return matches
+
+
+def _compile_selector(selector):
+    """把逗号分隔的选择器编译为匹配链列表"""
+    return [[_compile_compound(c) for c in part.split()] for part in selector.split(',')]
+
+
+def _chain_matches(chain, node, scope):
+    """node满足链中最后一个选择器，且祖先依次满足前面的选择器"""
+    if not chain[-1](node):
+        return False
+    remaining = chain[:-1]
+    ancestor = node.parent
+    while remaining and ancestor is not None and ancestor is not scope:
+        if remaining[-1](ancestor):
+            remaining = remaining[:-1]
+        ancestor = ancestor.parent
+    return not remaining
+
+
+def iter_select(scope, selector):
+    """
+    在scope的后代中按文档顺序查找匹配选择器的元素
+
+    只支持标签、类名以及后代组合符（如 'div.hotel-title-box h1'），
+    多个选择器用逗号分隔
+    """
+    chains = _compile_selector(selector)
+    for node in scope.iter():
+        if any(_chain_matches(chain, node, scope) for chain in chains):
+            yield node
+
+
+def select_all(scope, selector):
+    """返回所有匹配的元素"""
+    return list(iter_select(scope, selector))
+
+
+def select_one(scope, selector):
+    """返回第一个匹配的元素，没有则返回None"""
+    return next(iter_select(scope, selector), None)
+
+
+def select_by_priority(scope, selectors, nonempty=()):
+    """
+    只遍历一次，返回按selectors优先级最先命中的元素
+    （等价于依次对每个选择器调用select_one）
+
+    nonempty中的序号对应的选择器第一个命中的元素文本为空白时视为未命中（与schema规则的nonempty一致）
+    """
+    chains = [_compile_selector(selector) for selector in selectors]
+    best = None
+    best_priority = len(selectors)
+    blank = set()
+    for node in scope.iter():
+        for priority in range(best_priority):
+            if priority in blank:
+                continue
+            if any(_chain_matches(chain, node, scope) for chain in chains[priority]):
+                if priority in nonempty and not node.text().strip():
+                    blank.add(priority)
+                    continue
+                best, best_priority = node, priority
+                break
+        if best_priority == 0:
+            break
+    return best
+
+
+def _class_contains(node, fragment):
+    """等价于CSS的 [class*="fragment"]"""
+    return fragment in node.attrs.get('class', '')
+
+
+def _divs_with_icon(item, icon_classes):
+    """等价于 div:has(i.icon)：返回item内所有包含指定图标的div，按文档顺序"""
+    found = {}
+    for node in item.iter():
+        if node.tag != 'i' or not any(c in node.classes for c in icon_classes):
+            continue
+        ancestor = node.parent
+        while ancestor is not None and ancestor is not item:
+            if ancestor.tag == 'div':
+                found[ancestor.index] = ancestor
+            ancestor = ancestor.parent
+    return [found[k] for k in sorted(found)]
+
+
+def _first_div_with_text(item, needle):
+    """等价于Playwright的 div:has-text("needle")"""
+    for node in item.iter():
+        if node.tag == 'div' and needle in node.text():
+            return node
+    return None
+
+
+def _join_texts(nodes, keywords):
+    texts = [n.text() for n in nodes]
+    return ' | '.join(t.strip() for t in texts if t and any(k in t for k in keywords))
+
+
+def parse_offer(item):
+    """解析单个saleRoomItemBox报价节点"""
+    offer = {}
+
+    # 1. 早餐信息
+    breakfast = _join_texts(
+        _divs_with_icon(item, ('u-icon_ic_new_nonbreakfast', 'u-icon_ic_new_breakfast')),
+        ('早餐', '无早'))
+    if breakfast:
+        offer["早餐"] = breakfast
+    elif _first_div_with_text(item, '无早餐'):
+        offer["早餐"] = "无早餐"
+    else:
+        with_breakfast = _first_div_with_text(item, '早餐')
+        offer["早餐"] = with_breakfast.text() if with_breakfast else "早餐信息未知"
+
+    # 2. 取消政策
+    cancel = _join_texts(_divs_with_icon(item, ('u-icon_ic_new_freecancellation',)), ('取消',))
+    if cancel:
+        offer["取消政策"] = cancel
+    else:
+        cancel_policy = _first_div_with_text(item, '取消')
+        offer["取消政策"] = cancel_policy.text() if cancel_policy else "取消政策未知"
+
+    # 3. 入住人数
+    guests_el = select_one(item, '.saleRoomItemBox-guestInfo-adultBox_adultDesc__AfwYg')
+    if guests_el:
+        guests = guests_el.text()
+    else:
+        adult_icons = select_all(item, '.saleRoomItemBox-guestInfo-adultBox_adultIcon__K9f3Y')
+        guests = f"x{len(adult_icons)}" if adult_icons else "x1"
+    offer["可住人数"] = guests.strip().replace('x', '')
+
+    # 4.1 折扣前价格
+    original_price_el = select_one(item, '.saleRoomItemBox-priceBox-deletePrice__fuW7u')
+    if original_price_el:
+        offer["原价"] = original_price_el.text().strip()
+
+    # 4.2 当前价格
+    price_el = select_one(item, '.saleRoomItemBox-priceBox-displayPrice__gWiOr')
+    if not price_el:
+        for node in item.iter():
+            if node.tag == 'span' and not _class_contains(node, 'Prefix') and _inside(node, item, lambda a: a.tag == 'div' and _class_contains(a, 'priceBox')):
+                price_el = node
+                break
+    if not price_el:
+        for node in item.iter():
+            if node.tag == 'span' and '¥' in node.text() and _inside(node, item, lambda a: a.tag == 'div' and _class_contains(a, 'price')):
+                price_el = node
+                break
+    if price_el:
+        offer["价格"] = price_el.text().replace('均', '').strip()
+    else:
+        price_texts = [n.text() for n in item.iter()
+                       if _class_contains(n, 'price') or _class_contains(n, 'Price')]
+        price_texts = [t for t in price_texts if '¥' in t or '￥' in t]
+        offer["价格"] = price_texts[0].strip().replace('均', '').strip() if price_texts else "价格未知"
+
+    # 4.3 促销信息
+    for node in item.iter():
+        if ('saleRoomItemBox-promotion-discountTag__nE7d9' in node.classes
+                or _class_contains(node, 'discount') or _class_contains(node, 'promotion')):
+            if node.text():
+                offer["促销"] = node.text().strip()
+            break
+
+    return offer
+
+
+def _inside(node, scope, predicate):
+    """判断node在scope内是否有满足条件的祖先"""
+    ancestor = node.parent
+    while ancestor is not None and ancestor is not scope:
+        if predicate(ancestor):
+            return True
+        ancestor = ancestor.parent
+    return False
+
+
+def parse_room_card(card):
+    """解析单个commonRoomCard房型卡片"""
+    name_el = select_one(card, '.commonRoomCard-title__iYBn2')
+    bed_el = select_one(card, '.baseRoom-bedsInfo_title__sxCX9')
+    area_info = ""
+    for el in select_all(card, '.baseRoom-facility_title__BCMx6'):
+        if "平方米" in el.text():
+            area_info = el.text().strip()
+            break
+
+    return {
+        "房型名称": (name_el.text() if name_el else "未知房型").strip(),
+        "床型": (bed_el.text() if bed_el else "床型信息未知").strip(),
+        "面积和楼层": area_info,
+        "价格选项": [parse_offer(item) for item in select_all(card, '.saleRoomItemBox__orNIv')]
+    }
+
+
+# 与本模块同目录的提取schema，文件更新后下一次解析时重新加载
+extraction_schema = ExtractionSchema(os.path.join(os.path.dirname(os.path.abspath(__file__)), "extraction_schema.json"))
+
+
+def hotel_name_rules():
+    """extraction_schema.json中hotel_detail.酒店名称的规则；新文件无效时继续使用上一个有效版本"""
+    try:
+        extraction_schema.refresh()
+    except SchemaError:
+        if extraction_schema.schema is None:
+            raise
+    return extraction_schema.field_rules("hotel_detail", "酒店名称")
+
+
+def parse_hotel_name(root):
+    """按schema中hotel_detail.酒店名称规则的顺序提取酒店名称，找不到时使用页面标题"""
+    rules = hotel_name_rules()
+    nonempty = {i for i, rule in enumerate(rules) if rule.get("nonempty")}
+    name_el = select_by_priority(root, [rule["selector"] for rule in rules], nonempty)
+    if name_el:
+        return name_el.text().strip()
+
+    title_el = select_one(root, 'title')
+    title = title_el.text() if title_el else ""
+    return title.split('-')[0].strip() if '-' in title else title
+
+
+def parse_room_list_html(html):
+    """
+    把详情页HTML解析为extract_room_info相同的结构
+
+    参数:
+    - html: page.content()返回的完整页面，或只包含房型列表的HTML片段
+
+    返回:
+    - {"酒店名称": str, "房型列表": list}
+    """
+    root = parse_html(html)
+    rooms = [parse_room_card(card) for card in select_all(root, 'div.commonRoomCard__BpNjl')]
+    return {
+        "酒店名称": parse_hotel_name(root),
+        "房型列表": merge_room_metadata(rooms, parse_room_metadata(root))
+    }
+
+
+def load_room_results(text):
+    """
+    读取save_room_info_to_file写出的结果文件（如hotel_results.txt），还原成房型列表结构
+
+    返回:
+    - {"酒店名称": str, "房型列表": list}
+    """
+    result = {"酒店名称": "", "房型列表": []}
+    room = None
+    offer = None
+    for line in text.splitlines():
+        if line.startswith("酒店名称: "):
+            result["酒店名称"] = line[len("酒店名称: "):]
+        elif re.match(r'^房型 \d+: ', line):
+            room = {"房型名称": line.split(': ', 1)[1], "床型": "", "面积和楼层": "", "价格选项": []}
+            result["房型列表"].append(room)
+            offer = None
+        elif room is not None and line.startswith("床型: "):
+            room["床型"] = line[len("床型: "):]
+        elif room is not None and line.startswith("面积和楼层: "):
+            room["面积和楼层"] = line[len("面积和楼层: "):]
+        elif room is not None and re.match(r'^  选项 \d+:$', line):
+            offer = {}
+            room["价格选项"].append(offer)
+        elif offer is not None and line.startswith("    ") and ": " in line:
+            key, value = line.strip().split(": ", 1)
+            offer[key] = value
+    return result
+
+
+# ==================== data-exposure元数据 ====================
+
+# 合并到记录中的元数据字段，不参与不同提取模式之间的结果对比
+ROOM_METADATA_KEY = "房型元数据"
+OFFER_METADATA_KEYS = ("报价ID", "标签", "测试ID")
+
+
+def decode_exposure(raw):
+    """解析data-exposure属性中的JSON，返回其中的data字段，无法解析时返回空dict"""
+    if not raw:
+        return {}
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        return {}
+    data = payload.get("data") if isinstance(payload, dict) else None
+    return data if isinstance(data, dict) else {}
+
+
+def parse_room_metadata(root):
+    """
+    一次遍历收集每个房型卡片及其报价上的data-exposure/data-test-id/data-saleroom-key
+
+    返回结构与getctrip.room_metadata_script一致，index为房型卡片的序号和报价在卡片内的序号:
+    [{"index", "exposures": [...], "test_ids": [...], "offers": [{"index", "key", "exposures", "test_ids"}]}]
+    """
+    cards = select_all(root, 'div.commonRoomCard__BpNjl')
+    card_index = {card.index: i for i, card in enumerate(cards)}
+    offer_index = {}
+    for card in cards:
+        for j, offer in enumerate(select_all(card, '.saleRoomItemBox__orNIv')):
+            offer_index[offer.index] = j
+    metadata = [{"index": i, "exposures": [], "test_ids": [], "offers": []} for i in range(len(cards))]
+    offer_slots = {}
+
+    for node in root.iter():
+        attrs = node.attrs
+        if not ('data-exposure' in attrs or 'data-test-id' in attrs or 'data-saleroom-key' in attrs):
+            continue
+        # 找到所属的报价卡片、最近的带data-saleroom-key的节点和房型卡片，包括节点自身
+        offer = keyed = card = None
+        in_sale_room = False
+        ancestor = node
+        while ancestor is not None and card is None:
+            if offer is None and ancestor.index in offer_index:
+                offer = ancestor
+            if keyed is None and 'data-saleroom-key' in ancestor.attrs:
+                keyed = ancestor
+            if ancestor.index in card_index:
+                card = ancestor
+            elif _class_contains(ancestor, 'saleRoomItemBox'):
+                in_sale_room = True
+            ancestor = ancestor.parent
+        # 折叠隐藏的报价（带data-saleroom-key但不是报价卡片，或在报价区块内却不属于任何报价卡片）
+        # 不在房型记录中，跳过其元数据
+        if card is None or (keyed is not None and keyed.index not in offer_index) or (offer is None and in_sale_room):
+            continue
+        entry = metadata[card_index[card.index]]
+        if offer is not None:
+            if offer.index not in offer_slots:
+                offer_slots[offer.index] = {"index": offer_index[offer.index],
+                                            "key": offer.attrs.get('data-saleroom-key', ''),
+                                            "exposures": [], "test_ids": []}
+                entry["offers"].append(offer_slots[offer.index])
+            entry = offer_slots[offer.index]
+        if attrs.get('data-exposure'):
+            entry["exposures"].append(attrs['data-exposure'])
+        if attrs.get('data-test-id'):
+            entry["test_ids"].append(attrs['data-test-id'])
+    return metadata
+
+
+def _exposure_tags(exposures):
+    """从报价的各个exposure中收集标签文本，保持顺序去重"""
+    tags = []
+    for raw in exposures:
+        data = decode_exposure(raw)
+        tag_lists = [data.get("rm_taglist"), data.get("new_taglist")]
+        for tag in [tag for tag_list in tag_lists if isinstance(tag_list, list) for tag in tag_list]:
+            if not isinstance(tag, dict):
+                continue
+            title = tag.get("tagtitle")
+            if not title or title == "discountTag":
+                title = tag.get("tagname")
+            if isinstance(title, str) and title and title not in tags:
+                tags.append(title)
+    return tags
+
+
+def _join_unique(values):
+    """保持顺序去重后以" | "拼接"""
+    return " | ".join(dict.fromkeys(values))
+
+
+def merge_room_metadata(rooms, metadata, positions=None):
+    """
+    把parse_room_metadata/room_metadata_script的结果按房型卡片序号和报价序号合并进房型记录
+
+    - positions: 每个房型记录对应的 (房型卡片序号, [各报价在卡片内的序号])，缺省为按顺序一一对应；
+      逐元素提取跳过了出错的房型或报价时由调用方传入，避免后面的记录错配到别的卡片
+    - 房型增加"房型元数据"：房型卡片上exposure的data字段合并结果，以及卡片上的data-test-id
+    - 报价增加"报价ID"（data-saleroom-key）、"标签"和"测试ID"，并按报价ID去重
+    """
+    by_card = {entry["index"]: entry for entry in metadata}
+    for i, room in enumerate(rooms):
+        card, offer_positions = positions[i] if positions else (i, range(len(room["价格选项"])))
+        entry = by_card.get(card)
+        if entry is None:
+            continue
+        room_data = {}
+        for raw in entry["exposures"]:
+            for key, value in decode_exposure(raw).items():
+                room_data.setdefault(key, value)
+        if entry["test_ids"]:
+            room_data["测试ID"] = _join_unique(entry["test_ids"])
+        room[ROOM_METADATA_KEY] = room_data
+
+        offers_by_index = {offer_entry["index"]: offer_entry for offer_entry in entry["offers"]}
+        merged_offers = []
+        seen_keys = set()
+        for offer, position in zip(room["价格选项"], offer_positions):
+            offer_entry = offers_by_index.get(position)
+            if offer_entry:
+                key = offer_entry["key"]
+                if key:
+                    if key in seen_keys:
+                        continue
+                    seen_keys.add(key)
+                    offer["报价ID"] = key
+                tags = _exposure_tags(offer_entry["exposures"])
+                if tags:
+                    offer["标签"] = " | ".join(tags)
+                if offer_entry["test_ids"]:
+                    offer["测试ID"] = _join_unique(offer_entry["test_ids"])
+            merged_offers.append(offer)
+        room["价格选项"] = merged_offers
+    return rooms
+
+
+# ==================== 接口JSON解析 ====================
+
+# 房型/报价JSON中可能出现的字段名，按优先级排列
+ROOM_NAME_KEYS = ('roomName', 'baseRoomName', 'physicalRoomName', 'name', 'title')
+BED_KEYS = ('bedName', 'bedInfo', 'bedTitle', 'bedDesc', 'bed')
+AREA_KEYS = ('areaDesc', 'area', 'areaInfo', 'roomArea')
+FLOOR_KEYS = ('floorDesc', 'floor', 'floorInfo')
+OFFER_LIST_KEYS = ('saleRoomList', 'saleRooms', 'subRoomList', 'subRooms', 'rateList', 'rates', 'offers')
+BREAKFAST_KEYS = ('breakfastDesc', 'breakfastInfo', 'breakfast', 'mealDesc', 'mealInfo', 'meal')
+CANCEL_KEYS = ('cancelDesc', 'cancelPolicyDesc', 'cancelInfo', 'cancelPolicy', 'cancelRule', 'cancel')
+GUEST_KEYS = ('maxGuest', 'maxGuestNum', 'maxAdult', 'adultNum', 'guestCount', 'person', 'occupancy')
+PRICE_KEYS = ('displayPrice', 'avgPrice', 'salePrice', 'price', 'amount')
+ORIGINAL_PRICE_KEYS = ('deletePrice', 'originPrice', 'originalPrice', 'crossedPrice')
+PROMOTION_KEYS = ('discountTag', 'promotionTag', 'discountDesc', 'promotionDesc', 'promotion')
+
+
+def _scalar_text(value):
+    """把JSON中的值转成展示文本，dict取其中第一个文本类字段"""
+    if isinstance(value, bool) or value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        for key in ('title', 'text', 'desc', 'content', 'name', 'value', 'amount', 'price'):
+            text = _scalar_text(value.get(key))
+            if text:
+                return text
+    if isinstance(value, list):
+        return " | ".join(t for t in (_scalar_text(v) for v in value) if t)
+    return ""
+
+
+def _lookup(data, keys, depth=2):
+    """在data及其嵌套dict中按keys顺序查找第一个非空的文本值"""
+    for key in keys:
+        if key in data:
+            text = _scalar_text(data[key])
+            if text:
+                return text
+    if depth > 0:
+        for value in data.values():
+            if isinstance(value, dict):
+                text = _lookup(value, keys, depth - 1)
+                if text:
+                    return text
+    return ""
+
+
+def _format_price(text):
+    """统一价格格式为 ¥1,234"""
+    if not text:
+        return ""
+    if text[0] in '¥￥':
+        return text
+    try:
+        return f"¥{float(text.replace(',', '')):,.0f}"
+    except ValueError:
+        return text
+
+
+def parse_payload_offer(data):
+    """把单个报价JSON转换成与页面提取相同的价格选项结构"""
+    offer = {
+        "早餐": _lookup(data, BREAKFAST_KEYS) or "早餐信息未知",
+        "取消政策": _lookup(data, CANCEL_KEYS) or "取消政策未知",
+        "可住人数": (_lookup(data, GUEST_KEYS) or "1").replace('x', '')
+    }
+    original_price = _format_price(_lookup(data, ORIGINAL_PRICE_KEYS))
+    if original_price:
+        offer["原价"] = original_price
+    offer["价格"] = _format_price(_lookup(data, PRICE_KEYS)) or "价格未知"
+    promotion = _lookup(data, PROMOTION_KEYS)
+    if promotion:
+        offer["促销"] = promotion
+    return offer
+
+
+def _room_record(room, offers):
+    area = _lookup(room, AREA_KEYS)
+    floor = _lookup(room, FLOOR_KEYS)
+    return {
+        "房型名称": _lookup(room, ROOM_NAME_KEYS, depth=0) or "未知房型",
+        "床型": _lookup(room, BED_KEYS) or "床型信息未知",
+        "面积和楼层": " | ".join(t for t in (area, floor) if t),
+        "价格选项": [parse_payload_offer(offer) for offer in offers]
+    }
+
+
+def _iter_dicts(data):
+    """深度优先遍历JSON中的所有dict"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            yield value
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+
+
+def parse_room_payload(data):
+    """
+    从房型接口返回的JSON中构建房型列表
+
+    支持两种常见结构:
+    1. 房型对象内嵌报价列表（saleRoomList/subRoomList等）
+    2. 物理房型表和售卖房型表分开（physicRoomMap + saleRoomMap），通过房型ID关联
+
+    返回:
+    - 与extract_room_info的"房型列表"相同结构的list，识别不出时返回空列表
+    """
+    rooms = []
+
+    # 结构1: 房型内嵌报价列表
+    offer_ids = set()
+    for node in _iter_dicts(data):
+        if id(node) in offer_ids:
+            continue
+        offers = next((node[k] for k in OFFER_LIST_KEYS
+                       if isinstance(node.get(k), list) and node[k] and isinstance(node[k][0], dict)), None)
+        if offers is not None and _lookup(node, ROOM_NAME_KEYS, depth=0):
+            rooms.append(_room_record(node, offers))
+            offer_ids.update(id(offer) for offer in offers)
+    if rooms:
+        return rooms
+
+    # 结构2: 物理房型表 + 售卖房型表
+    for node in _iter_dicts(data):
+        physic_map = next((v for k, v in node.items() if isinstance(v, dict) and 'physic' in k.lower()), None)
+        sale_map = next((v for k, v in node.items() if isinstance(v, dict) and 'saleroom' in k.lower()), None)
+        if not physic_map or not sale_map:
+            continue
+        offers_by_room = {}
+        for sale_room in sale_map.values():
+            if not isinstance(sale_room, dict):
+                continue
+            room_id = next((str(sale_room[k]) for k in ('physicalRoomId', 'physicRoomId', 'baseRoomId', 'roomId')
+                            if k in sale_room), None)
+            offers_by_room.setdefault(room_id, []).append(sale_room)
+        for room_id, room in physic_map.items():
+            if isinstance(room, dict):
+                rooms.append(_room_record(room, offers_by_room.get(str(room_id), [])))
+        if rooms:
+            return rooms
+
+    return rooms
@@ -21,7 +21,9 @@ config = BrowserContextConfig(
     user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36',
 )
 
-browser = Browser()
+# 设置BROWSER_CDP_URL（如 http://127.0.0.1:9222，见browser-use-noir/browser_server.py）时连接常驻Chromium，不再每次启动浏览器
+CDP_URL = os.getenv("BROWSER_CDP_URL")
+browser = Browser(config=BrowserConfig(cdp_url=CDP_URL)) if CDP_URL else Browser()
 context = BrowserContext(browser=browser, config=config)
 
 llm = ChatOpenAI(